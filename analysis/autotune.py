@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import random
+import socket
+import time
+from pathlib import Path
+
+import numpy as np
+
+from parallel_runner import run_sharded
+
+# CPU throughput autotuner for the sliced predictor.
+# Sweeps tile batch size, worker processes x torch threads per worker and
+# tile size on CALIB_IMAGES images from valid/images and measures images/sec
+# (wall clock over all workers, model loading excluded) and p95 per-image
+# latency. The sweep is coordinate-wise rather than a full grid: batch size
+# first with one worker using every core, then the worker/thread split at
+# the best batch, then tile size. The best setting by images/sec (p95 breaks
+# near-ties) is written to configs/autotune/<hostname>.json; load_tuned()
+# reads it back, and run_sahi.py and the compare scripts use it in place of
+# their defaults.
+# Tile size changes what the detector sees, and ranking it by images/sec
+# alone always favours bigger tiles (fewer tiles, lower recall on tiny
+# lights), so it is only stored as advice next to the best setting and is
+# never applied automatically; pick it with recommend_slicing.py or the sweep.
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+MODEL_PATH = PROJECT_ROOT / "experiments" / "bosch_sanity" / "weights" / "best.pt"
+IMG_DIR = PROJECT_ROOT / "data" / "bosch" / "valid" / "images"
+TUNE_DIR = PROJECT_ROOT / "configs" / "autotune"
+
+CALIB_IMAGES = 24
+RANDOM_SEED = 0
+WARMUP = 2
+CONF = 0.25
+OVERLAP = 0.20
+DEVICE = "cpu"
+BATCH_SIZES = [1, 4, 8, 16, 32]
+SLICES = [640]
+APPLIED = ("threads", "workers", "tile_batch")   # settings load_tuned() hands out
+NEAR_TIE = 0.03          # within 3% images/sec, prefer the lower p95
+
+
+def host_file(host=None):
+    return TUNE_DIR / f"{host or socket.gethostname()}.json"
+
+
+def load_tuned(host=None):
+    # -> best settings for this host ({} if autotune has not been run here):
+    # keys threads, workers, tile_batch (older files may also hold a slice,
+    # which is dropped here)
+    path = host_file(host)
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        best = json.load(f).get("best", {})
+    return {k: v for k, v in best.items() if k in APPLIED}
+
+
+def worker_splits(cpus):
+    # (workers, threads per worker) pairs that use every core
+    out = []
+    workers = 1
+    while workers <= cpus:
+        out.append((workers, max(1, cpus // workers)))
+        workers *= 2
+    return out
+
+
+# Per-process state for the sweep workers
+_ctx = {}
+
+
+def _init(model_path, slice_size, batch_size):
+    from ultralytics import YOLO
+
+    from sliced_predictor import SlicedPredictor
+
+    model = YOLO(str(model_path))
+    _ctx["predictor"] = SlicedPredictor(model, slice_size, slice_size, OVERLAP, conf=CONF,
+                                        batch_size=batch_size, device=DEVICE)
+
+
+def _run_shard(paths):
+    from frames import read_frame
+
+    predictor = _ctx["predictor"]
+    frames = [f for f in (read_frame(p) for p in paths) if f is not None]
+    for frame in frames[:WARMUP]:
+        predictor.predict_arrays([frame.bgr])
+    start = time.time()
+    ms = []
+    for frame in frames:
+        t0 = time.perf_counter()
+        predictor.predict_arrays([frame.bgr])
+        ms.append((time.perf_counter() - t0) * 1e3)
+    return start, time.time(), ms
+
+
+def measure(paths, model_path, workers, threads, batch_size, slice_size):
+    shards = [paths[k::workers] for k in range(workers)]
+    out = run_sharded(_run_shard, shards, num_workers=workers, threads=threads,
+                      init_fn=_init, init_args=(model_path, slice_size, batch_size))
+    ms = [m for _, _, shard_ms in out for m in shard_ms]
+    wall = max(end for _, end, _ in out) - min(start for start, _, _ in out)
+    return {
+        "workers": workers, "threads": threads, "tile_batch": batch_size, "slice": slice_size,
+        "images_per_sec": len(ms) / wall if wall > 0 else 0.0,
+        "p95_ms": float(np.percentile(ms, 95)) if ms else None,
+    }
+
+
+def better(a, b):
+    # is result a better than b?
+    if b is None:
+        return True
+    if a["images_per_sec"] > b["images_per_sec"] * (1 + NEAR_TIE):
+        return True
+    if a["images_per_sec"] < b["images_per_sec"] * (1 - NEAR_TIE):
+        return False
+    return a["p95_ms"] < b["p95_ms"]
+
+
+def autotune(model_path=MODEL_PATH, n_images=CALIB_IMAGES, batch_sizes=BATCH_SIZES, slices=SLICES):
+    imgs = sorted(p for p in IMG_DIR.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    random.seed(RANDOM_SEED)
+    paths = random.sample(imgs, k=min(n_images, len(imgs)))
+    cpus = os.cpu_count() or 1
+    results = []
+
+    def run(workers, threads, batch_size, slice_size):
+        r = measure(paths, model_path, workers, threads, batch_size, slice_size)
+        results.append(r)
+        print(f"  workers={workers} threads={threads} batch={batch_size} slice={slice_size}: "
+              f"{r['images_per_sec']:.2f} img/s, p95 {r['p95_ms']:.0f} ms")
+        return r
+
+    best = None
+    print("[autotune] tile batch size")
+    for batch_size in batch_sizes:
+        r = run(1, cpus, batch_size, slices[0])
+        best = r if better(r, best) else best
+
+    print("[autotune] workers x threads")
+    for workers, threads in worker_splits(cpus):
+        if (workers, threads) == (1, cpus):
+            continue
+        r = run(workers, threads, best["tile_batch"], best["slice"])
+        best = r if better(r, best) else best
+
+    if len(slices) > 1:
+        print("[autotune] tile size")
+        for slice_size in slices[1:]:
+            r = run(best["workers"], best["threads"], best["tile_batch"], slice_size)
+            best = r if better(r, best) else best
+
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the fastest threads / batch / workers on this host.")
+    parser.add_argument("--model", type=Path, default=MODEL_PATH)
+    parser.add_argument("--images", type=int, default=CALIB_IMAGES)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--slices", type=int, nargs="+", default=SLICES,
+                        help="tile sizes to time (advice only); the first is used while tuning the rest")
+    parser.add_argument("--dry-run", action="store_true", help="measure but do not write the host config")
+    args = parser.parse_args()
+
+    best, results = autotune(args.model, args.images, args.batch_sizes, args.slices)
+    host = socket.gethostname()
+    out = {
+        "host": host,
+        "cpu_count": os.cpu_count(),
+        "model": Path(args.model).name,
+        "images": args.images,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "best": {k: best[k] for k in APPLIED},
+        # fastest tile size only; not applied, since speed says nothing about recall
+        "advice": {"slice": best["slice"]},
+        "best_result": best,
+        "results": results,
+    }
+    print(f"\nbest: {out['best']} ({best['images_per_sec']:.2f} img/s, p95 {best['p95_ms']:.0f} ms)")
+    if len(args.slices) > 1:
+        print(f"fastest tile size: {best['slice']} (advice only, not applied; check recall before switching)")
+    if args.dry_run:
+        return
+    path = host_file(host)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(out, f, indent=2)
+    print(f"Saved: {path}")
+
+
+if __name__ == "__main__":
+    main()
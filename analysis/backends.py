@@ -0,0 +1,175 @@
+import argparse
+import random
+import shutil
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from pred_cache import file_digest
+
+# CPU inference backends for best.pt.
+# "torch" is the plain ultralytics model. "onnx" and "openvino" export
+# best.pt once (dynamic batch / image size, so the sliced predictor can still
+# batch its tiles) into debug/exports/<weights digest>/ and load the export
+# through ultralytics, which runs it on ONNX Runtime / OpenVINO with the same
+# predict() API, so SlicedPredictor, CascadePredictor and the single-shot
+# path work unchanged.
+# int8=True adds static INT8 quantization calibrated on CALIB_IMAGES images
+# sampled from the valid split: onnxruntime.quantization (QDQ, per-channel
+# weights, MinMax activations) for ONNX, ultralytics' NNCF export for
+# OpenVINO. Exported predictions differ slightly from PyTorch, so cache keys
+# go through backend_digest().
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+EXPORT_DIR = PROJECT_ROOT / "debug" / "exports"
+CALIB_DIR = PROJECT_ROOT / "data" / "bosch" / "valid" / "images"
+
+BACKENDS = ("torch", "onnx", "openvino")
+IMGSZ = 640
+CALIB_IMAGES = 64
+CALIB_SEED = 0
+OPSET = 17
+
+
+def backend_name(backend, int8=False):
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "torch":
+        if int8:
+            raise ValueError("int8 needs an exported backend (onnx or openvino)")
+        return "torch"
+    return f"{backend}_{'int8' if int8 else 'fp32'}"
+
+
+def backend_digest(weights_digest, backend, int8=False):
+    # pred_cache key part: torch keeps the plain weights digest so old entries stay valid
+    name = backend_name(backend, int8)
+    return weights_digest if name == "torch" else f"{weights_digest}_{name}"
+
+
+def calibration_images(n=CALIB_IMAGES, seed=CALIB_SEED, img_dir=CALIB_DIR):
+    imgs = sorted(p for p in img_dir.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    random.Random(seed).shuffle(imgs)
+    return imgs[:n]
+
+
+def letterbox(img, size=IMGSZ, pad_value=114):
+    # same resize + centered gray padding as ultralytics' LetterBox
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    out = np.full((size, size, 3), pad_value, dtype=np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    out[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return out
+
+
+def to_input(img_bgr, size=IMGSZ):
+    # BGR uint8 -> 1x3xHxW float RGB in [0, 1], what the exported graph expects
+    x = letterbox(img_bgr, size)[:, :, ::-1].transpose(2, 0, 1)
+    return np.ascontiguousarray(x, dtype=np.float32)[None] / 255.0
+
+
+def quantize_onnx(fp32_path, int8_path, calib_paths, imgsz=IMGSZ):
+    import onnx
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                          quantize_static)
+
+    src = onnx.load(str(fp32_path), load_external_data=False)
+    input_name = src.graph.input[0].name
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.paths = iter(calib_paths)
+
+        def get_next(self):
+            for p in self.paths:
+                img = cv2.imread(str(p))
+                if img is not None:
+                    return {input_name: to_input(img, imgsz)}
+            return None
+
+    quantize_static(str(fp32_path), str(int8_path), Reader(), quant_format=QuantFormat.QDQ,
+                    per_channel=True, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    calibrate_method=CalibrationMethod.MinMax)
+
+    # ultralytics reads stride / names / imgsz from the model metadata, which
+    # quantize_static does not carry over
+    dst = onnx.load(str(int8_path))
+    del dst.metadata_props[:]
+    dst.metadata_props.extend(src.metadata_props)
+    onnx.save(dst, str(int8_path))
+
+
+def calibration_yaml(out_dir, calib_paths):
+    # ultralytics' int8 export calibrates on the `val` entry of a data yaml;
+    # an image list keeps it to the same sample the ONNX path uses
+    import yaml
+    from evaluate import NUM_CLASSES
+
+    list_path = out_dir / "calib.txt"
+    list_path.write_text("\n".join(str(Path(p).resolve()) for p in calib_paths) + "\n")
+    data = {"path": str(out_dir), "train": str(list_path), "val": str(list_path),
+            "nc": NUM_CLASSES, "names": [str(i) for i in range(NUM_CLASSES)]}
+    yaml_path = out_dir / "calib.yaml"
+    with open(yaml_path, "w") as f:
+        yaml.safe_dump(data, f, sort_keys=False)
+    return yaml_path
+
+
+def model_file(weights, backend="torch", int8=False, imgsz=IMGSZ, force=False):
+    # -> path ultralytics can load for this backend, exporting it on first use
+    name = backend_name(backend, int8)
+    weights = Path(weights)
+    if name == "torch":
+        return weights
+
+    out_dir = EXPORT_DIR / file_digest(weights)[:16]
+    target = out_dir / (f"{weights.stem}_{name}.onnx" if backend == "onnx" else f"{weights.stem}_{name}_openvino_model")
+    if target.exists() and not force:
+        return target
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    from ultralytics import YOLO
+
+    if backend == "onnx":
+        fp32 = out_dir / f"{weights.stem}_onnx_fp32.onnx"
+        if not fp32.exists() or force:
+            exported = YOLO(str(weights)).export(format="onnx", imgsz=imgsz, dynamic=True, opset=OPSET,
+                                                 simplify=True)
+            shutil.move(str(exported), str(fp32))
+        if int8:
+            quantize_onnx(fp32, target, calibration_images(), imgsz)
+        return target
+
+    kwargs = {"format": "openvino", "imgsz": imgsz, "dynamic": True}
+    if int8:
+        kwargs.update(int8=True, data=str(calibration_yaml(out_dir, calibration_images())))
+    exported = Path(YOLO(str(weights)).export(**kwargs))
+    if target.exists():
+        shutil.rmtree(target)
+    shutil.move(str(exported), str(target))
+    return target
+
+
+def load_model(weights, backend="torch", int8=False, imgsz=IMGSZ):
+    from ultralytics import YOLO
+
+    path = model_file(weights, backend, int8, imgsz)
+    return YOLO(str(path)) if backend == "torch" else YOLO(str(path), task="detect")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export best.pt for the ONNX Runtime / OpenVINO backends.")
+    parser.add_argument("weights", type=Path)
+    parser.add_argument("--backend", choices=BACKENDS[1:], default="onnx")
+    parser.add_argument("--int8", action="store_true", help=f"static INT8, calibrated on {CALIB_IMAGES} valid images")
+    parser.add_argument("--imgsz", type=int, default=IMGSZ)
+    parser.add_argument("--force", action="store_true", help="re-export even if the file exists")
+    args = parser.parse_args()
+    print(model_file(args.weights, args.backend, args.int8, args.imgsz, force=args.force))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import numpy as np
+
+from bench_box_ops import best_time, random_boxes
+from box_merge import merge_boxes
+from box_ops import to_box_array, to_box_list
+
+try:
+    from sahi.postprocess.combine import GreedyNMMPostprocess
+    from sahi.prediction import ObjectPrediction
+except ImportError:
+    GreedyNMMPostprocess = None
+
+# Micro-benchmark: merging the concatenated tile + full-frame boxes of one
+# frame. SAHI's GREEDYNMM on ObjectPrediction lists (object creation included,
+# since that is part of its cost), a plain-Python greedy NMM, and the
+# box_merge nms / nmm / wbf on flat arrays. The match column checks that the
+# array NMM keeps the same boxes as the Python reference.
+
+IMG_W, IMG_H = 1280, 720
+BOX_COUNTS = [50, 100, 250, 500, 1000, 2000]
+MATCH_THR = 0.5
+METRIC = "ios"
+
+
+def ios_xyxy(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    area_a = max(0, a[2] - a[0]) * max(0, a[3] - a[1])
+    area_b = max(0, b[2] - b[0]) * max(0, b[3] - b[1])
+    return ix * iy / (min(area_a, area_b) + 1e-9)
+
+
+def loop_nmm(boxes):
+    ranked = sorted(boxes, key=lambda b: -b[5])
+    claimed = [False] * len(ranked)
+    out = []
+    for i, head in enumerate(ranked):
+        if claimed[i]:
+            continue
+        x1, y1, x2, y2 = head[:4]
+        for j in range(i + 1, len(ranked)):
+            b = ranked[j]
+            if not claimed[j] and b[4] == head[4] and ios_xyxy(head, b) >= MATCH_THR:
+                claimed[j] = True
+                x1, y1, x2, y2 = min(x1, b[0]), min(y1, b[1]), max(x2, b[2]), max(y2, b[3])
+        out.append((x1, y1, x2, y2, head[4], head[5]))
+    return out
+
+
+def sahi_nmm(boxes):
+    preds = [ObjectPrediction(bbox=list(b[:4]), category_id=b[4], category_name=str(b[4]), score=b[5],
+                              full_shape=[IMG_H, IMG_W])
+             for b in boxes]
+    post = GreedyNMMPostprocess(match_threshold=MATCH_THR, match_metric="IOS", class_agnostic=False)
+    return post(preds)
+
+
+def main():
+    rng = np.random.default_rng(0)
+
+    print("| Boxes | loop nmm ms | sahi nmm ms | nmm ms | nms ms | wbf ms | nmm vs loop | kept (nms/nmm/wbf) | match |")
+    print("|---:|---:|---:|---:|---:|---:|---:|---|---|")
+    for n in BOX_COUNTS:
+        boxes = random_boxes(rng, n)
+        arr = to_box_array(boxes)
+
+        t_loop, ref = best_time(loop_nmm, boxes)
+        t_sahi = best_time(sahi_nmm, boxes)[0] if GreedyNMMPostprocess is not None else None
+        t_nmm, nmm = best_time(merge_boxes, arr, "nmm", MATCH_THR, METRIC)
+        t_nms, nms = best_time(merge_boxes, arr, "nms", MATCH_THR, METRIC)
+        t_wbf, wbf = best_time(merge_boxes, arr, "wbf", MATCH_THR, METRIC)
+
+        got = sorted(to_box_list(nmm))
+        want = sorted((float(b[0]), float(b[1]), float(b[2]), float(b[3]), int(b[4]), float(np.float32(b[5])))
+                      for b in ref)
+        same = len(got) == len(want) and np.allclose(np.asarray(got), np.asarray(want), atol=1e-6)
+
+        sahi_txt = "-" if t_sahi is None else f"{t_sahi * 1e3:.2f}"
+        print(
+            f"| {n} | {t_loop * 1e3:.2f} | {sahi_txt} | {t_nmm * 1e3:.2f} | {t_nms * 1e3:.2f} | "
+            f"{t_wbf * 1e3:.2f} | {t_loop / t_nmm:.1f}x | {len(nms)}/{len(nmm)}/{len(wbf)} | "
+            f"{'ok' if same else 'DIFF'} |"
+        )
+    if GreedyNMMPostprocess is None:
+        print("\nsahi not installed: SAHI column skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import time
+
+import numpy as np
+
+from box_ops import count_duplicate_pairs, count_unmatched
+
+# Micro-benchmark: the old scalar iou_xyxy loops from the compare scripts
+# vs the vectorized box_ops versions, on synthetic Bosch-sized frames.
+
+IMG_W, IMG_H = 1280, 720
+BOX_COUNTS = [10, 50, 100, 250, 500]
+REPEATS = 5
+IOU_MATCH = 0.50
+IOU_DUP = 0.80
+RANDOM_SEED = 0
+
+
+def iou_xyxy(a, b):
+    ax1, ay1, ax2, ay2 = a
+    bx1, by1, bx2, by2 = b
+    inter_x1 = max(ax1, bx1)
+    inter_y1 = max(ay1, by1)
+    inter_x2 = min(ax2, bx2)
+    inter_y2 = min(ay2, by2)
+    inter_w = max(0, inter_x2 - inter_x1)
+    inter_h = max(0, inter_y2 - inter_y1)
+    inter = inter_w * inter_h
+    area_a = max(0, ax2 - ax1) * max(0, ay2 - ay1)
+    area_b = max(0, bx2 - bx1) * max(0, by2 - by1)
+    union = area_a + area_b - inter + 1e-9
+    return inter / union
+
+
+def loop_count_duplicates(boxes):
+    dup = 0
+    xyxy = [b[:4] for b in boxes]
+    for i in range(len(xyxy)):
+        for j in range(i + 1, len(xyxy)):
+            if iou_xyxy(xyxy[i], xyxy[j]) >= IOU_DUP:
+                dup += 1
+    return dup
+
+
+def loop_count_new(sahi_boxes, single_boxes):
+    single_xyxy = [b[:4] for b in single_boxes]
+    new_count = 0
+    for sb in sahi_boxes:
+        matched = any(iou_xyxy(sb[:4], bx) >= IOU_MATCH for bx in single_xyxy)
+        if not matched:
+            new_count += 1
+    return new_count
+
+
+def random_boxes(rng, n):
+    # small, clustered boxes with some near-copies so the duplicate test has work to do
+    cx = rng.uniform(0, IMG_W, n)
+    cy = rng.uniform(0, IMG_H * 0.6, n)
+    w = rng.uniform(4, 40, n)
+    h = w * rng.uniform(1.5, 3.0, n)
+    copies = rng.random(n) < 0.2
+    cx[copies] = np.roll(cx, 1)[copies] + rng.normal(0, 1, copies.sum())
+    cy[copies] = np.roll(cy, 1)[copies] + rng.normal(0, 1, copies.sum())
+
+    boxes = []
+    for i in range(n):
+        boxes.append((float(cx[i] - w[i] / 2), float(cy[i] - h[i] / 2),
+                      float(cx[i] + w[i] / 2), float(cy[i] + h[i] / 2),
+                      int(rng.integers(0, 5)), float(rng.uniform(0.25, 1.0))))
+    return boxes
+
+
+def best_time(fn, *args):
+    best = float("inf")
+    result = None
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    rng = np.random.default_rng(RANDOM_SEED)
+
+    print("| Boxes | dup loop ms | dup vec ms | speedup | new loop ms | new vec ms | speedup | match |")
+    print("|---:|---:|---:|---:|---:|---:|---:|---|")
+    for n in BOX_COUNTS:
+        sahi_boxes = random_boxes(rng, n)
+        single_boxes = random_boxes(rng, max(1, n // 2))
+
+        t_dup_loop, dup_loop = best_time(loop_count_duplicates, sahi_boxes)
+        t_dup_vec, dup_vec = best_time(count_duplicate_pairs, sahi_boxes, IOU_DUP)
+        t_new_loop, new_loop = best_time(loop_count_new, sahi_boxes, single_boxes)
+        t_new_vec, new_vec = best_time(count_unmatched, sahi_boxes, single_boxes, IOU_MATCH)
+
+        same = "ok" if (dup_loop == dup_vec and new_loop == new_vec) else f"DIFF ({dup_loop}/{dup_vec}, {new_loop}/{new_vec})"
+        print(
+            f"| {n} | {t_dup_loop * 1e3:.2f} | {t_dup_vec * 1e3:.2f} | {t_dup_loop / t_dup_vec:.1f}x | "
+            f"{t_new_loop * 1e3:.2f} | {t_new_vec * 1e3:.2f} | {t_new_loop / t_new_vec:.1f}x | {same} |"
+        )
+
+
+if __name__ == "__main__":
+    main()
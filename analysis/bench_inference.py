@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import platform
+import socket
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from cascade import CascadePredictor
+from parallel_runner import pin_threads
+from sliced_predictor import SlicedPredictor
+
+# Reproducible inference benchmark on synthetic Bosch-sized frames.
+# Frames are generated from a fixed seed (sky/road gradient, noise and a few
+# small lit blobs), so no dataset is needed. For single-shot, every
+# slice/overlap config and the cascade it records per-image latency
+# (p50/p95/mean), tiles/sec and peak RSS, plus model load time, and writes
+# everything to JSON. Each config runs in a fresh process (model load
+# included), since peak RSS is a process-lifetime high-water mark: run in one
+# process, every config would inherit the peak of the ones before it. With --baseline the run is compared against an earlier
+# JSON and exits 1 if any metric regresses past the thresholds below.
+# Without the trained weights it falls back to yolov8n.yaml (random init, no
+# download), which is fine for timing on an offline CPU machine.
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+MODEL_PATH = PROJECT_ROOT / "experiments" / "bosch_sanity" / "weights" / "best.pt"
+FALLBACK_MODEL = "yolov8n.yaml"
+OUT_DIR = PROJECT_ROOT / "debug" / "bench"
+
+FRAME_W, FRAME_H = 1280, 720
+NUM_FRAMES = 20
+WARMUP = 2
+SEED = 0
+CONF = 0.25
+DEVICE = "cpu"
+THREADS = 4
+TILE_BATCH = 16
+MERGE = "nmm"
+
+CONFIGS = [
+    {"name": "single"},
+    {"name": "tile640_ov10", "slice": 640, "overlap": 0.10},
+    {"name": "tile640_ov20", "slice": 640, "overlap": 0.20},
+    {"name": "tile640_ov30", "slice": 640, "overlap": 0.30},
+    {"name": "cascade", "slice": 640},
+]
+
+# Allowed change vs the baseline before a run counts as a regression
+THRESHOLDS = {
+    "p50_ms": 0.10,          # +10% median latency
+    "p95_ms": 0.20,          # +20% tail latency
+    "tiles_per_sec": 0.10,   # -10% throughput
+    "peak_rss_mb": 0.20,     # +20% memory
+    "load_s": 0.50,          # +50% model load
+}
+HIGHER_IS_BETTER = {"tiles_per_sec"}
+
+
+def synthetic_frames(n=NUM_FRAMES, width=FRAME_W, height=FRAME_H, seed=SEED):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(n):
+        y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+        sky = np.stack([200 - 80 * y, 170 - 60 * y, 140 - 40 * y], axis=-1)
+        img = np.broadcast_to(sky, (height, width, 3)).copy()
+        img[int(height * 0.55):] = 90
+        img += rng.normal(0, 8, img.shape).astype(np.float32)
+        img = np.clip(img, 0, 255).astype(np.uint8)
+        # small "lights" in the upper half, like the Bosch label prior
+        for _ in range(rng.integers(3, 12)):
+            cx, cy = int(rng.integers(0, width)), int(rng.integers(0, height // 2))
+            w = int(rng.integers(3, 14))
+            h = int(w * rng.uniform(2.0, 3.0))
+            cv2.rectangle(img, (cx, cy), (cx + w, cy + h), (20, 20, 20), -1)
+            color = [(0, 0, 255), (0, 200, 255), (0, 255, 0)][int(rng.integers(0, 3))]
+            cv2.circle(img, (cx + w // 2, cy + h // 4), max(1, w // 3), color, -1)
+        frames.append(img)
+    return frames
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, kilobytes on Linux
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def latency_stats(ms):
+    ms = np.asarray(ms, dtype=np.float64)
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+def load_model(model_path):
+    from ultralytics import YOLO
+
+    t0 = time.perf_counter()
+    model = YOLO(str(model_path))
+    load_s = time.perf_counter() - t0
+    return model, load_s
+
+
+def make_predictor(model, cfg):
+    if cfg["name"] == "single":
+        return None
+    if cfg["name"] == "cascade":
+        return CascadePredictor(model, cfg["slice"], cfg["slice"], conf=CONF, batch_size=TILE_BATCH,
+                                device=DEVICE, merge_method=MERGE)
+    return SlicedPredictor(model, cfg["slice"], cfg["slice"], cfg["overlap"], conf=CONF,
+                           batch_size=TILE_BATCH, device=DEVICE, merge_method=MERGE)
+
+
+def bench_config(model, cfg, frames):
+    predictor = make_predictor(model, cfg)
+
+    def run(frame):
+        if predictor is None:
+            model.predict(source=frame, conf=CONF, device=DEVICE, verbose=False)
+        else:
+            predictor.predict(frame)
+
+    for frame in frames[:WARMUP]:
+        run(frame)
+    tiles_before = predictor.tiles_run if predictor else 0
+    fwd_before = predictor.forward_seconds if predictor else 0.0
+
+    ms = []
+    t_start = time.perf_counter()
+    for frame in frames:
+        t0 = time.perf_counter()
+        run(frame)
+        ms.append((time.perf_counter() - t0) * 1e3)
+    wall = time.perf_counter() - t_start
+
+    out = latency_stats(ms)
+    out["images_per_sec"] = len(frames) / wall
+    if predictor is None:
+        # one full-frame pass per image
+        out["tiles_per_sec"] = out["images_per_sec"]
+        out["tiles_per_image"] = 1.0
+    else:
+        tiles = predictor.tiles_run - tiles_before
+        fwd = predictor.forward_seconds - fwd_before
+        out["tiles_per_sec"] = tiles / fwd if fwd > 0 else 0.0
+        out["tiles_per_image"] = tiles / len(frames)
+    out["peak_rss_mb"] = peak_rss_mb()
+    return out
+
+
+def bench_isolated(model_path, cfg):
+    # one config in a fresh process: its own model load, frames and RSS peak
+    pin_threads(THREADS)
+    frames = synthetic_frames()
+    model, load_s = load_model(model_path)
+    out = bench_config(model, cfg, frames)
+    out["load_s"] = load_s
+    return out
+
+
+def environment(model_name):
+    env = {
+        "host": socket.gethostname(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "threads": THREADS,
+        "device": DEVICE,
+        "model": model_name,
+        "frames": NUM_FRAMES,
+        "frame_size": [FRAME_W, FRAME_H],
+    }
+    try:
+        import torch
+        import ultralytics
+        env["torch"] = torch.__version__
+        env["ultralytics"] = ultralytics.__version__
+    except ImportError:
+        pass
+    return env
+
+
+def compare(result, baseline, thresholds=THRESHOLDS):
+    # -> list of human-readable regressions
+    problems = []
+    if baseline["env"].get("model") != result["env"].get("model"):
+        problems.append(f"model differs from baseline ({baseline['env'].get('model')} vs {result['env'].get('model')})")
+    base_load = baseline.get("load_s")
+    if base_load and result["load_s"] > base_load * (1 + thresholds["load_s"]):
+        problems.append(f"load_s {result['load_s']:.2f} vs {base_load:.2f}")
+
+    for name, cur in result["configs"].items():
+        base = baseline["configs"].get(name)
+        if base is None:
+            continue
+        for key, tol in thresholds.items():
+            if key == "load_s" or cur.get(key) is None or not base.get(key):
+                continue
+            if key in HIGHER_IS_BETTER:
+                bad = cur[key] < base[key] * (1 - tol)
+            else:
+                bad = cur[key] > base[key] * (1 + tol)
+            if bad:
+                problems.append(f"{name}.{key}: {cur[key]:.2f} vs baseline {base[key]:.2f} (tolerance {tol:.0%})")
+    return problems
+
+
+def format_table(result):
+    lines = ["| Config | p50 ms | p95 ms | img/s | tiles/img | tiles/s | peak RSS MB |",
+             "|---|---:|---:|---:|---:|---:|---:|"]
+    for name, r in result["configs"].items():
+        rss = "-" if r["peak_rss_mb"] is None else f"{r['peak_rss_mb']:.0f}"
+        lines.append(f"| {name} | {r['p50_ms']:.1f} | {r['p95_ms']:.1f} | {r['images_per_sec']:.2f} | "
+                     f"{r['tiles_per_image']:.2f} | {r['tiles_per_sec']:.1f} | {rss} |")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single-shot / sliced / cascade inference on synthetic frames.")
+    parser.add_argument("--model", default=None, help=f"weights (default {MODEL_PATH}, else {FALLBACK_MODEL})")
+    parser.add_argument("--configs", nargs="+", default=[c["name"] for c in CONFIGS])
+    parser.add_argument("--out", type=Path, default=None, help="result JSON (default debug/bench/<time>.json)")
+    parser.add_argument("--baseline", type=Path, default=None, help="fail if this run regresses against it")
+    parser.add_argument("--save-baseline", type=Path, default=None, help="also write this run as a baseline")
+    parser.add_argument("--tolerance", nargs="*", default=[], metavar="KEY=FRAC",
+                        help=f"override thresholds, keys: {', '.join(THRESHOLDS)}")
+    args = parser.parse_args()
+
+    thresholds = dict(THRESHOLDS)
+    for item in args.tolerance:
+        key, _, value = item.partition("=")
+        if key not in thresholds:
+            parser.error(f"unknown threshold {key!r}")
+        thresholds[key] = float(value)
+
+    model_path = args.model or (MODEL_PATH if MODEL_PATH.exists() else FALLBACK_MODEL)
+    result = {"env": environment(Path(str(model_path)).name), "configs": {}}
+    for cfg in CONFIGS:
+        if cfg["name"] not in args.configs:
+            continue
+        print(f"[bench] {cfg['name']} ...")
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result["configs"][cfg["name"]] = pool.submit(bench_isolated, str(model_path), cfg).result()
+    # every config loads the model once; the median is the run's load time
+    load_s = float(np.median([r["load_s"] for r in result["configs"].values()])) if result["configs"] else 0.0
+    result["load_s"] = load_s
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    out_path = args.out or OUT_DIR / f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(out_path, "w") as f:
+        json.dump(result, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(result, f, indent=2)
+
+    print(f"\nmodel load: {load_s:.2f}s ({model_path})")
+    print(format_table(result))
+    print(f"\nSaved: {out_path}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        problems = compare(result, baseline, thresholds)
+        if problems:
+            print(f"\nREGRESSION vs {args.baseline}:")
+            for p in problems:
+                print("  -", p)
+            raise SystemExit(1)
+        print(f"\nNo regressions vs {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
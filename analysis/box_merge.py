@@ -0,0 +1,78 @@
+import numpy as np
+
+from box_ops import BOX_DTYPE, ios_matrix, iou_matrix, to_box_array
+
+# Array-based merging of overlapping tile / full-frame predictions.
+# All three methods share one greedy clustering: boxes are ranked by
+# confidence, and each box not yet claimed becomes a cluster head that claims
+# every lower-ranked unclaimed box overlapping it by >= thr (same class when
+# class_aware). Heads are found with one row op per head on a precomputed
+# overlap matrix; the fusion itself is a handful of ufunc.at calls.
+#   nms - keep the heads
+#   nmm - head grows to the union of its cluster (SAHI's GREEDYNMM); score and
+#         class stay the head's
+#   wbf - confidence-weighted mean of the cluster's coordinates, mean score
+
+MERGE_METHODS = ("nms", "nmm", "wbf")
+
+
+def greedy_clusters(boxes, thr, metric="ios", class_aware=True):
+    # -> (order, owner): `order` ranks the boxes by confidence and owner[k] is
+    # the rank of the head that claimed ranked box k (owner[k] == k for heads)
+    boxes = to_box_array(boxes)
+    order = np.argsort(-boxes["conf"], kind="stable")
+    n = len(order)
+    owner = np.arange(n)
+    if n < 2:
+        return order, owner
+
+    ranked = boxes[order]
+    overlap = ios_matrix(ranked, ranked) if metric == "ios" else iou_matrix(ranked, ranked)
+    hits = overlap >= thr
+    if class_aware:
+        hits &= ranked["cls"][:, None] == ranked["cls"][None, :]
+    # only lower-ranked boxes can be claimed
+    hits = np.triu(hits, k=1)
+
+    claimed = np.zeros(n, dtype=bool)
+    for i in range(n):
+        if claimed[i]:
+            continue
+        members = hits[i] & ~claimed
+        owner[members] = i
+        claimed |= members
+    return order, owner
+
+
+def merge_boxes(boxes, method="nms", thr=0.5, metric="ios", class_aware=True):
+    if method not in MERGE_METHODS:
+        raise ValueError(f"unknown merge method {method!r}, expected one of {MERGE_METHODS}")
+    boxes = to_box_array(boxes)
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=BOX_DTYPE)
+
+    order, owner = greedy_clusters(boxes, thr, metric=metric, class_aware=class_aware)
+    ranked = boxes[order]
+    heads = np.flatnonzero(owner == np.arange(len(owner)))
+    if method == "nms":
+        return ranked[heads]
+
+    # dense cluster ids so the reductions below are over len(heads) slots
+    slot = np.empty(len(owner), dtype=np.int64)
+    slot[heads] = np.arange(len(heads))
+    cid = slot[owner]
+    out = ranked[heads].copy()
+
+    if method == "nmm":
+        for name, ufunc in (("x1", np.minimum), ("y1", np.minimum), ("x2", np.maximum), ("y2", np.maximum)):
+            col = out[name].copy()
+            ufunc.at(col, cid, ranked[name])
+            out[name] = col
+        return out
+
+    w = ranked["conf"].astype(np.float64)
+    wsum = np.bincount(cid, weights=w, minlength=len(heads))
+    for name in ("x1", "y1", "x2", "y2"):
+        out[name] = np.bincount(cid, weights=w * ranked[name], minlength=len(heads)) / wsum
+    out["conf"] = wsum / np.bincount(cid, minlength=len(heads))
+    return out
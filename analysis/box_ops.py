@@ -0,0 +1,160 @@
+import numpy as np
+
+# Shared box helpers for the SAHI comparison scripts.
+# Boxes are kept as structured arrays so the (x1, y1, x2, y2, cls, conf)
+# tuples from the predictors convert in one shot and every pairwise op is a
+# single broadcasted NumPy expression instead of nested Python loops.
+# Coordinates stay float64 so thresholds behave exactly like the old
+# scalar iou_xyxy.
+
+BOX_DTYPE = np.dtype([
+    ("x1", np.float64),
+    ("y1", np.float64),
+    ("x2", np.float64),
+    ("y2", np.float64),
+    ("cls", np.int16),
+    ("conf", np.float32),
+])
+
+
+def to_box_array(boxes):
+    if isinstance(boxes, np.ndarray) and boxes.dtype == BOX_DTYPE:
+        return boxes
+
+    out = np.zeros(len(boxes), dtype=BOX_DTYPE)
+    if len(boxes) == 0:
+        return out
+
+    raw = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+    out["x1"] = raw[:, 0]
+    out["y1"] = raw[:, 1]
+    out["x2"] = raw[:, 2]
+    out["y2"] = raw[:, 3]
+    out["cls"] = raw[:, 4].astype(np.int16)
+    out["conf"] = raw[:, 5]
+    return out
+
+
+def to_box_list(arr):
+    return [
+        (float(b["x1"]), float(b["y1"]), float(b["x2"]), float(b["y2"]), int(b["cls"]), float(b["conf"]))
+        for b in arr
+    ]
+
+
+def xyxy(boxes):
+    if isinstance(boxes, np.ndarray) and boxes.dtype.names:
+        return np.stack([boxes["x1"], boxes["y1"], boxes["x2"], boxes["y2"]], axis=1)
+    if isinstance(boxes, np.ndarray):
+        return boxes.reshape(-1, 4)
+    return xyxy(to_box_array(boxes))
+
+
+def areas(boxes):
+    b = xyxy(boxes)
+    return np.clip(b[:, 2] - b[:, 0], 0, None) * np.clip(b[:, 3] - b[:, 1], 0, None)
+
+
+def iou_matrix(a, b):
+    a = xyxy(a)
+    b = xyxy(b)
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+
+    union = areas(a)[:, None] + areas(b)[None, :] - inter + 1e-9
+    return inter / union
+
+
+def match_matrix(a, b, iou_thr, class_aware=False):
+    a = to_box_array(a)
+    b = to_box_array(b)
+    hits = iou_matrix(a, b) >= iou_thr
+    if class_aware:
+        hits &= a["cls"][:, None] == b["cls"][None, :]
+    return hits
+
+
+def count_duplicate_pairs(boxes, iou_thr, class_aware=False):
+    boxes = to_box_array(boxes)
+    if len(boxes) < 2:
+        return 0
+    hits = match_matrix(boxes, boxes, iou_thr, class_aware=class_aware)
+    return int(np.triu(hits, k=1).sum())
+
+
+def count_unmatched(boxes, ref, iou_thr, class_aware=False):
+    boxes = to_box_array(boxes)
+    ref = to_box_array(ref)
+    if len(ref) == 0:
+        return len(boxes)
+    hits = match_matrix(boxes, ref, iou_thr, class_aware=class_aware)
+    return int((~hits.any(axis=1)).sum())
+
+
+def greedy_assign(a, b, iou_thr, class_aware=False, by_score=False):
+    # One-to-one matching of a -> b. By default pairs are taken in order of
+    # decreasing IoU; with by_score=True the rows of `a` are visited in order
+    # of decreasing confidence and each takes its best free column (COCO style).
+    a = to_box_array(a)
+    b = to_box_array(b)
+    empty = np.zeros(0, dtype=np.int64)
+    if len(a) == 0 or len(b) == 0:
+        return empty, empty, np.zeros(0, dtype=np.float32)
+
+    iou = iou_matrix(a, b)
+    valid = iou >= iou_thr
+    if class_aware:
+        valid &= a["cls"][:, None] == b["cls"][None, :]
+    iou = np.where(valid, iou, -1.0)
+
+    used_a = np.zeros(len(a), dtype=bool)
+    used_b = np.zeros(len(b), dtype=bool)
+    ai, bi, vals = [], [], []
+
+    if by_score:
+        for i in np.argsort(-a["conf"], kind="stable"):
+            row = np.where(used_b, -1.0, iou[i])
+            j = int(row.argmax())
+            if row[j] < 0:
+                continue
+            used_b[j] = True
+            ai.append(i)
+            bi.append(j)
+            vals.append(row[j])
+    else:
+        rows, cols = np.nonzero(valid)
+        order = np.argsort(-iou[rows, cols], kind="stable")
+        for i, j in zip(rows[order], cols[order]):
+            if used_a[i] or used_b[j]:
+                continue
+            used_a[i] = True
+            used_b[j] = True
+            ai.append(i)
+            bi.append(j)
+            vals.append(iou[i, j])
+
+    return (np.asarray(ai, dtype=np.int64), np.asarray(bi, dtype=np.int64),
+            np.asarray(vals, dtype=np.float32))
+
+
+def ios_matrix(a, b):
+    # intersection over the smaller box, the match metric SAHI uses when merging tiles
+    a = xyxy(a)
+    b = xyxy(b)
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+
+    smaller = np.minimum(areas(a)[:, None], areas(b)[None, :]) + 1e-9
+    return inter / smaller
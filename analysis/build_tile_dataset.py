@@ -0,0 +1,234 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+from dataset_index import DATA_ROOT, load_index
+from sliced_predictor import slice_bboxes
+
+# Offline tile dataset for training at the tiled-inference resolution.
+# Each train/valid frame is cut into SLICE x SLICE tiles with the same geometry
+# SAHI / sliced_predictor use at inference time. Labels are clipped to the
+# tile and renormalized; a box keeps its label only if at least MIN_VISIBLE of
+# its area lands inside the tile. Train tiles with no boxes are kept at
+# EMPTY_RATIO, chosen by a hash of the tile name so the choice is stable across
+# runs; valid/test keep every tile, so validation still scores on all the
+# background the model sees at inference time.
+# Work is per source image on a thread pool (imdecode / imencode release the
+# GIL), and <out>/<split>/tiles_state.json remembers which tiles each image
+# produced, so a re-run only re-cuts images whose file, labels or tiling
+# settings changed and removes tiles of images that are gone.
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+OUT_ROOT = PROJECT_ROOT / "data" / "bosch_tiles640"
+SPLITS = ["train", "valid"]
+
+SLICE = 640
+OVERLAP = 0.20
+EMPTY_RATIO = 0.10       # fraction of empty train tiles kept (0 = drop all, 1 = keep all)
+MIN_VISIBLE = 0.50       # min fraction of a box's area inside the tile
+MIN_SIDE_PX = 2.0        # clipped boxes thinner than this are dropped
+JPEG_QUALITY = 95
+WORKERS = min(16, (os.cpu_count() or 1) * 2)
+STATE_VERSION = 1
+
+
+def settings():
+    return {"slice": SLICE, "overlap": OVERLAP, "empty_ratio": EMPTY_RATIO,
+            "min_visible": MIN_VISIBLE, "min_side_px": MIN_SIDE_PX, "jpeg_quality": JPEG_QUALITY}
+
+
+def settings_digest():
+    return hashlib.sha1(json.dumps(settings(), sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def keep_empty(tile_name, ratio=EMPTY_RATIO):
+    if ratio >= 1:
+        return True
+    h = int(hashlib.sha1(tile_name.encode("utf-8")).hexdigest()[:8], 16)
+    return h / 0xFFFFFFFF < ratio
+
+
+def tile_labels(boxes, tile, width, height):
+    # boxes: dataset_index rows for one frame -> (cls, cx, cy, w, h) rows
+    # normalized to the tile, after clipping
+    if len(boxes) == 0:
+        return np.zeros((0, 5), dtype=np.float64)
+    tx1, ty1, tx2, ty2 = tile
+    cx = boxes["x"].astype(np.float64) * width
+    cy = boxes["y"].astype(np.float64) * height
+    bw = boxes["w"].astype(np.float64) * width
+    bh = boxes["h"].astype(np.float64) * height
+    x1, y1, x2, y2 = cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2
+
+    cx1, cy1 = np.maximum(x1, tx1), np.maximum(y1, ty1)
+    cx2, cy2 = np.minimum(x2, tx2), np.minimum(y2, ty2)
+    cw, ch = cx2 - cx1, cy2 - cy1
+    visible = np.where((cw > 0) & (ch > 0), cw * ch, 0.0) / np.maximum(bw * bh, 1e-12)
+    keep = (visible >= MIN_VISIBLE) & (cw >= MIN_SIDE_PX) & (ch >= MIN_SIDE_PX)
+
+    tw, th = tx2 - tx1, ty2 - ty1
+    out = np.stack([
+        boxes["cls"].astype(np.float64),
+        ((cx1 + cx2) / 2 - tx1) / tw,
+        ((cy1 + cy2) / 2 - ty1) / th,
+        cw / tw,
+        ch / th,
+    ], axis=1)
+    return out[keep]
+
+
+def split_empty_ratio(split):
+    return EMPTY_RATIO if split == "train" else 1.0
+
+
+def cut_image(index, rid, img_out, label_out, empty_ratio=EMPTY_RATIO):
+    # -> (tile names written, boxes kept, empty tiles dropped)
+    src = index.image_path(rid)
+    data = np.fromfile(str(src), dtype=np.uint8)
+    img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    height, width = img.shape[:2]
+    boxes = index.boxes_for(rid)
+    stem = index.records[rid]["stem"]
+
+    written, kept_boxes, dropped = [], 0, 0
+    for tile in slice_bboxes(height, width, SLICE, SLICE, OVERLAP, OVERLAP):
+        x1, y1, x2, y2 = tile
+        name = f"{stem}__x{x1}_y{y1}"
+        rows = tile_labels(boxes, tile, width, height)
+        if len(rows) == 0 and not keep_empty(name, empty_ratio):
+            dropped += 1
+            continue
+
+        ok, buf = cv2.imencode(".jpg", img[y1:y2, x1:x2], [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        if not ok:
+            continue
+        buf.tofile(str(img_out / f"{name}.jpg"))
+        with open(label_out / f"{name}.txt", "w") as f:
+            for cls, cx, cy, w, h in rows:
+                f.write(f"{int(cls)} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}\n")
+        written.append(name)
+        kept_boxes += len(rows)
+    return written, kept_boxes, dropped
+
+
+def remove_tiles(names, img_out, label_out):
+    for name in names:
+        for path in (img_out / f"{name}.jpg", label_out / f"{name}.txt"):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def load_state(state_path):
+    if not state_path.exists():
+        return {}
+    with open(state_path, "r") as f:
+        state = json.load(f)
+    if state.get("version") != STATE_VERSION:
+        return {}
+    return state.get("images", {})
+
+
+def save_state(state_path, entries):
+    tmp = state_path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"version": STATE_VERSION, "settings": settings(), "images": entries}, f)
+    os.replace(tmp, state_path)
+
+
+def build_split(split, pool, src_root=DATA_ROOT, out_root=OUT_ROOT, force=False):
+    index = load_index(split, root=src_root)
+    img_out = out_root / split / "images"
+    label_out = out_root / split / "labels"
+    img_out.mkdir(parents=True, exist_ok=True)
+    label_out.mkdir(parents=True, exist_ok=True)
+    state_path = out_root / split / "tiles_state.json"
+
+    old = {} if force else load_state(state_path)
+    digest = settings_digest()
+    empty_ratio = split_empty_ratio(split)
+    entries = {}
+    jobs = []
+    for rid in index.image_ids():
+        r = index.records[rid]
+        sig = [r["image_sig"], r["label_sig"], digest, empty_ratio]
+        prev = old.pop(r["stem"], None)
+        if prev is not None and prev["sig"] == sig:
+            entries[r["stem"]] = prev
+            continue
+        if prev is not None:
+            remove_tiles(prev["tiles"], img_out, label_out)
+        jobs.append((rid, sig))
+
+    # whatever is left in `old` belongs to images that no longer exist
+    for prev in old.values():
+        remove_tiles(prev["tiles"], img_out, label_out)
+
+    def run(job):
+        rid, sig = job
+        return rid, sig, cut_image(index, rid, img_out, label_out, empty_ratio)
+
+    t0 = time.perf_counter()
+    for rid, sig, res in pool.map(run, jobs):
+        if res is None:
+            print(f"  could not decode {index.image_path(rid)}")
+            continue
+        names, n_boxes, n_dropped = res
+        entries[index.records[rid]["stem"]] = {"sig": sig, "tiles": names, "boxes": n_boxes, "dropped": n_dropped}
+    elapsed = time.perf_counter() - t0
+    save_state(state_path, entries)
+
+    tiles = sum(len(e["tiles"]) for e in entries.values())
+    boxes_kept = sum(e["boxes"] for e in entries.values())
+    dropped = sum(e["dropped"] for e in entries.values())
+    print(f"[{split}] {len(entries)} images -> {tiles} tiles, {boxes_kept} boxes "
+          f"({dropped} empty tiles dropped); re-cut {len(jobs)} images in {elapsed:.1f}s")
+    print(f"[{split}] source boxes: {len(index.boxes)} (tiles can repeat boxes in overlaps "
+          f"and drop ones cut below {MIN_VISIBLE:.0%} visibility)")
+    return tiles
+
+
+def write_data_yaml(out_root=OUT_ROOT, src_yaml=DATA_ROOT / "data.yaml", splits=SPLITS):
+    with open(src_yaml, "r") as f:
+        src = yaml.safe_load(f)
+    data = {"path": str(out_root), "train": "train/images", "val": "valid/images",
+            "nc": src["nc"], "names": src["names"], "tiling": settings()}
+    if "test" in splits:
+        data["test"] = "test/images"
+    path = out_root / "data.yaml"
+    with open(path, "w") as f:
+        yaml.safe_dump(data, f, sort_keys=False)
+    return path
+
+
+def build_tiles(splits=SPLITS, out_root=OUT_ROOT, force=False):
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        for split in splits:
+            build_split(split, pool, out_root=out_root, force=force)
+    return write_data_yaml(out_root, splits=splits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cut the Bosch splits into SAHI-geometry training tiles.")
+    parser.add_argument("--splits", nargs="+", default=SPLITS)
+    parser.add_argument("--out", type=Path, default=OUT_ROOT)
+    parser.add_argument("--force", action="store_true", help="re-cut every image, ignoring saved state")
+    args = parser.parse_args()
+
+    path = build_tiles(args.splits, args.out, force=args.force)
+    print("Wrote", path)
+
+
+if __name__ == "__main__":
+    main()
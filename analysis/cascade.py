@@ -0,0 +1,144 @@
+import numpy as np
+
+from box_ops import BOX_DTYPE
+from instrument import stage
+from sliced_predictor import (BATCH_SIZE, MERGE_METHOD, MERGE_METRIC, MERGE_THR, SlicedPredictor,
+                              load_frame, shift_to_frame)
+
+# Two-stage cascade between single-shot and full tiling.
+# Stage 1 runs the model once on the whole frame (letterboxed down to the
+# model's imgsz) at a low confidence. Detections that are uncertain
+# (STAGE1_CONF <= conf < ACCEPT_CONF) or small (longest side < SMALL_SIDE px)
+# mark the regions worth a closer look; stage 2 cuts full-resolution
+# crop_h x crop_w windows around them, at most MAX_CROPS per frame, and runs
+# those as one batch. Frames where stage 1 finds little (the small-light misses
+# the cascade is for) would never get a second look that way, so with an
+# occupancy prior (tile_prior.py) up to PRIOR_CROPS more crops are placed over
+# the prior's highest-mass cells whenever stage 1 leaves room under MAX_CROPS;
+# a prior crop whose centre already lies in a stage-1 crop is skipped.
+# Confident stage-1 boxes and the stage-2 boxes are merged with the same
+# box_merge step as the sliced predictor.
+
+STAGE1_CONF = 0.05
+ACCEPT_CONF = 0.6
+SMALL_SIDE = 24
+MAX_CROPS = 6
+CROP_MARGIN = 16         # a candidate must sit this far inside a crop to reuse it
+PRIOR_CROPS = 2          # max crops per frame seeded from the prior
+
+
+def place_crops(boxes, image_h, image_w, crop_h, crop_w, max_crops=MAX_CROPS, margin=CROP_MARGIN):
+    # greedy cover of candidate boxes (highest score first) with fixed-size
+    # windows centred on the first uncovered candidate, shifted inside the frame
+    crops = []
+    if len(boxes) == 0:
+        return crops
+    order = np.argsort(-boxes["conf"], kind="stable")
+    for b in boxes[order]:
+        inside = [x1 + margin <= b["x1"] and b["x2"] <= x2 - margin and
+                  y1 + margin <= b["y1"] and b["y2"] <= y2 - margin
+                  for x1, y1, x2, y2 in crops]
+        if any(inside):
+            continue
+        if len(crops) >= max_crops:
+            break
+        cx = (b["x1"] + b["x2"]) / 2
+        cy = (b["y1"] + b["y2"]) / 2
+        x1 = int(np.clip(round(cx - crop_w / 2), 0, max(0, image_w - crop_w)))
+        y1 = int(np.clip(round(cy - crop_h / 2), 0, max(0, image_h - crop_h)))
+        crops.append((x1, y1, min(image_w, x1 + crop_w), min(image_h, y1 + crop_h)))
+    return crops
+
+
+def prior_windows(prior, image_h, image_w, crop_h, crop_w, max_crops):
+    # crops covering the prior's highest-mass cells, best first: every cell
+    # with mass is a pseudo-box scored by it and covered like stage-1 candidates
+    gh, gw = prior.grid.shape
+    rows, cols = np.nonzero(prior.grid > 0)
+    cells = np.zeros(len(rows), dtype=BOX_DTYPE)
+    cells["x1"], cells["x2"] = cols * image_w / gw, (cols + 1) * image_w / gw
+    cells["y1"], cells["y2"] = rows * image_h / gh, (rows + 1) * image_h / gh
+    cells["conf"] = prior.grid[rows, cols]
+    return place_crops(cells, image_h, image_w, crop_h, crop_w, max_crops, margin=0)
+
+
+class CascadePredictor(SlicedPredictor):
+    def __init__(self, yolo_model, crop_h=640, crop_w=640, conf=0.25, stage1_conf=STAGE1_CONF,
+                 accept_conf=ACCEPT_CONF, small_side=SMALL_SIDE, max_crops=MAX_CROPS,
+                 prior=None, prior_crops=PRIOR_CROPS, batch_size=BATCH_SIZE, imgsz=None, device=None,
+                 merge_metric=MERGE_METRIC, merge_thr=MERGE_THR, merge_method=MERGE_METHOD):
+        super().__init__(yolo_model, crop_h, crop_w, 0.0, conf=conf, batch_size=batch_size,
+                         imgsz=imgsz, device=device, merge_metric=merge_metric, merge_thr=merge_thr,
+                         merge_method=merge_method)
+        self.stage1_conf = stage1_conf
+        self.accept_conf = accept_conf
+        self.small_side = small_side
+        self.max_crops = max_crops
+        self.prior = prior
+        self.prior_crops = prior_crops if prior is not None else 0
+        self.frames_run = 0
+        self.crops_prior = 0
+        self._prior_windows = {}
+
+    @property
+    def cascade_name(self):
+        # everything that changes the output, for pred_cache keys
+        prior = f"_prior{self.prior_crops}_{self.prior.digest}" if self.prior_crops else ""
+        return (f"cascade_s{self.stage1_conf:g}_a{self.accept_conf:g}_small{self.small_side}"
+                f"_crop{self.slice_w}x{self.slice_h}_max{self.max_crops}{prior}_{self.postprocess_name}")
+
+    @property
+    def crops_per_frame(self):
+        return self.tiles_run / self.frames_run if self.frames_run else 0.0
+
+    def candidates(self, boxes):
+        side = np.maximum(boxes["x2"] - boxes["x1"], boxes["y2"] - boxes["y1"])
+        return boxes[(boxes["conf"] < self.accept_conf) | (side < self.small_side)]
+
+    def crops(self, boxes, image_h, image_w):
+        # -> (stage-1 crops, prior crops) for one frame
+        crops = place_crops(self.candidates(boxes), image_h, image_w, self.slice_h, self.slice_w, self.max_crops)
+        room = min(self.prior_crops, self.max_crops - len(crops))
+        extra = []
+        if room > 0:
+            key = (image_h, image_w)
+            if key not in self._prior_windows:
+                self._prior_windows[key] = prior_windows(self.prior, image_h, image_w,
+                                                         self.slice_h, self.slice_w, self.max_crops)
+            for x1, y1, x2, y2 in self._prior_windows[key]:
+                if len(extra) >= room:
+                    break
+                cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+                if not any(a <= cx <= c and b <= cy <= d for a, b, c, d in crops):
+                    extra.append((x1, y1, x2, y2))
+        return crops, extra
+
+    def predict_arrays(self, frames):
+        frames = [load_frame(f) for f in frames]
+        stage1 = self._full_frame_pass(frames, conf=self.stage1_conf)
+        self.frames_run += len(frames)
+
+        per_frame = [[b[b["conf"] >= self.conf]] for b in stage1]
+        jobs = []
+        with stage("slice"):
+            for fi, (frame, boxes) in enumerate(zip(frames, stage1)):
+                h, w = frame.shape[:2]
+                crops, extra = self.crops(boxes, h, w)
+                jobs.extend((fi, crop) for crop in crops + extra)
+                self.crops_prior += len(extra)
+
+        for start in range(0, len(jobs), self.batch_size):
+            chunk = jobs[start:start + self.batch_size]
+            with stage("slice"):
+                batch = [self._cut(frames[fi], crop) for fi, crop in chunk]
+            for (fi, crop), boxes in zip(chunk, self._forward(batch)):
+                if len(boxes):
+                    per_frame[fi].append(shift_to_frame(boxes, crop))
+            self.tiles_run += len(chunk)
+
+        return self._merge(per_frame)
+
+    def report(self):
+        return (f"{self.frames_run} frames, {self.tiles_run} crops ({self.crops_per_frame:.2f}/frame; "
+                f"{self.tiles_run - self.crops_prior} from stage 1, {self.crops_prior} from the prior) "
+                f"in {self.forward_passes} forward passes, {self.forward_seconds:.1f}s forward")
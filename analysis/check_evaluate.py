@@ -0,0 +1,132 @@
+import numpy as np
+
+from box_ops import to_box_array
+from evaluate import CONF_BINS, NUM_CLASSES, StreamingEvaluator
+
+try:
+    from pycocotools.coco import COCO
+    from pycocotools.cocoeval import COCOeval
+except ImportError:
+    COCOeval = None
+
+# Checks StreamingEvaluator against pycocotools' COCOeval on a small synthetic
+# fixture: Bosch-sized frames with a few GT lights each, and predictions that
+# are jittered, duplicated, missed, mislabelled or spurious. Every prediction
+# gets a confidence bin of its own, so the binned curves must equal COCOeval's
+# exact ones; mAP50, mAP50-95 and per-class AP50 are printed side by side and
+# any difference above TOL exits non-zero.
+
+IMG_W, IMG_H = 1280, 720
+IMAGES = 20
+MAX_GT = 12
+P_MISS = 0.2
+P_DUPLICATE = 0.2
+P_WRONG_CLASS = 0.1
+MAX_SPURIOUS = 3
+TOL = 1e-6
+RANDOM_SEED = 0
+
+
+def random_light(rng):
+    w = rng.uniform(4, 80)
+    h = w * rng.uniform(1.5, 3.0)
+    x1, y1 = rng.uniform(0, IMG_W - w), rng.uniform(0, IMG_H - h)
+    return x1, y1, x1 + w, y1 + h
+
+
+def fixture(rng):
+    # -> [(gts, preds)] box arrays per image
+    frames = []
+    for _ in range(IMAGES):
+        gts = [random_light(rng) + (int(rng.integers(NUM_CLASSES)), 1.0)
+               for _ in range(int(rng.integers(0, MAX_GT + 1)))]
+        preds = []
+        for x1, y1, x2, y2, cls, _ in gts:
+            if rng.random() < P_MISS:
+                continue
+            for _ in range(1 + int(rng.random() < P_DUPLICATE)):
+                jx1, jy1, jx2, jy2 = rng.normal(0, 0.15 * (x2 - x1), 4)
+                c = cls if rng.random() >= P_WRONG_CLASS else int(rng.integers(NUM_CLASSES))
+                px1, py1 = x1 + jx1, y1 + jy1
+                preds.append((px1, py1, max(x2 + jx2, px1 + 1), max(y2 + jy2, py1 + 1), c, 0.0))
+        preds += [random_light(rng) + (int(rng.integers(NUM_CLASSES)), 0.0)
+                  for _ in range(int(rng.integers(0, MAX_SPURIOUS + 1)))]
+        frames.append((to_box_array(gts), to_box_array(preds)))
+
+    # one distinct bin centre per prediction, so binning loses no ordering
+    n = sum(len(p) for _, p in frames)
+    assert n <= CONF_BINS, "fixture has more predictions than confidence bins"
+    conf = (rng.choice(CONF_BINS, size=n, replace=False) + 0.5) / CONF_BINS
+    k = 0
+    for _, preds in frames:
+        preds["conf"] = conf[k:k + len(preds)]
+        k += len(preds)
+    return frames
+
+
+def streaming_metrics(frames):
+    ev = StreamingEvaluator()
+    for gts, preds in frames:
+        ev.add(preds, gts)
+    return ev.summary()
+
+
+def coco_metrics(frames):
+    # same fixture through COCOeval; class c is category c + 1, ids start at 1
+    images, anns, dets = [], [], []
+    for img_id, (gts, preds) in enumerate(frames):
+        images.append({"id": img_id, "width": IMG_W, "height": IMG_H})
+        for b in gts:
+            w, h = float(b["x2"] - b["x1"]), float(b["y2"] - b["y1"])
+            anns.append({"id": len(anns) + 1, "image_id": img_id, "category_id": int(b["cls"]) + 1,
+                         "bbox": [float(b["x1"]), float(b["y1"]), w, h], "area": w * h, "iscrowd": 0})
+        for b in preds:
+            dets.append({"image_id": img_id, "category_id": int(b["cls"]) + 1,
+                         "bbox": [float(b["x1"]), float(b["y1"]), float(b["x2"] - b["x1"]),
+                                  float(b["y2"] - b["y1"])],
+                         "score": float(b["conf"])})
+    gt = COCO()
+    gt.dataset = {"images": images, "annotations": anns,
+                  "categories": [{"id": c + 1, "name": str(c)} for c in range(NUM_CLASSES)]}
+    gt.createIndex()
+    ev = COCOeval(gt, gt.loadRes(dets), "bbox")
+    ev.evaluate()
+    ev.accumulate()
+
+    # precision: (iou thr, recall pts, class, area range, max dets); -1 = no GT
+    prec = ev.eval["precision"][:, :, :, 0, -1]
+    ap = np.where((prec > -1).all(axis=1), prec.mean(axis=1), np.nan)
+    has_gt = ~np.isnan(ap[0])
+    out = {"map50": float(ap[0, has_gt].mean()), "map50_95": float(ap[:, has_gt].mean())}
+    for c in range(NUM_CLASSES):
+        out[f"ap50_cls{c}"] = None if np.isnan(ap[0, c]) else float(ap[0, c])
+    return out
+
+
+def main():
+    if COCOeval is None:
+        raise SystemExit("pycocotools not installed: pip install pycocotools")
+    frames = fixture(np.random.default_rng(RANDOM_SEED))
+    ours, ref = streaming_metrics(frames), coco_metrics(frames)
+
+    print(f"{len(frames)} images, {sum(len(g) for g, _ in frames)} GT, {sum(len(p) for _, p in frames)} predictions\n")
+    print("| Metric | StreamingEvaluator | COCOeval | diff |")
+    print("|---|---:|---:|---:|")
+    bad = 0
+    for key, want in ref.items():
+        got = ours[key]
+        if got is None or want is None:
+            same = got is None and want is None
+            diff_txt = "-"
+        else:
+            same = abs(got - want) <= TOL
+            diff_txt = f"{got - want:+.2e}"
+        bad += not same
+        got_txt = "-" if got is None else f"{got:.6f}"
+        want_txt = "-" if want is None else f"{want:.6f}"
+        print(f"| {key} | {got_txt} | {want_txt} | {diff_txt}{'' if same else ' DIFF'} |")
+    raise SystemExit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
-import os
 from pathlib import Path
 
-import os
-from pathlib import Path
+import numpy as np
+
+from dataset_index import load_index
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1] 
 root = PROJECT_ROOT / "data" / "bosch"
@@ -21,44 +21,19 @@ def scan_labels_for_split(split_name: str):
             "bad_lines": [],
         }
 
-    unique_ids = set()
-    total_boxes = 0
-    num_files = 0
-    num_empty_files = 0
-    bad_lines = []  
-
     print(f"Split: {split_name}")
     print(f"label dir: {label_dir}")
 
-    for fname in sorted(os.listdir(label_dir)):
-        if not fname.endswith(".txt"):
-            continue
-
-        num_files += 1
-        fpath = label_dir / fname
-
-        with open(fpath, "r") as f:
-            lines = [ln.strip() for ln in f.readlines() if ln.strip()]
-
-        if not lines:
-            num_empty_files += 1
-            continue
-
-        for ln in lines:
-            parts = ln.split()
-            if len(parts) < 5:
-                bad_lines.append((fname, ln))
-                continue
-
-            cls_raw = parts[0]
-            try:
-                cls_id = int(float(cls_raw))
-            except ValueError:
-                bad_lines.append((fname, ln))
-                continue
+    idx = load_index(split_name, root=root)
+    label_ids = np.array(idx.label_ids(), dtype=np.int64)
+    per_record = idx.boxes_per_record()
 
-            unique_ids.add(cls_id)
-            total_boxes += 1
+    num_files = len(label_ids)
+    has_bad = np.array([bool(idx.records[i]["bad_lines"]) for i in label_ids], dtype=bool)
+    num_empty_files = int(((per_record[label_ids] == 0) & ~has_bad).sum()) if num_files else 0
+    total_boxes = len(idx.boxes)
+    unique_ids = set(np.unique(idx.boxes["cls"]).tolist())
+    bad_lines = idx.bad_lines()
 
     print(f"num label files: {num_files}")
     print(f"empty label files: {num_empty_files}")
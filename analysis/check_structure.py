@@ -1,24 +1,11 @@
 from pathlib import Path
 
+from dataset_index import load_index
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 root = PROJECT_ROOT / "data" / "bosch"
 
 folders = ["train", "valid", "test"]
-img_extensions = (".jpg", ".jpeg", ".png", ".bmp")
-
-
-def get_files(dir_path, exts=None):
-    if not dir_path.exists():
-        return []
-
-    if exts is None:
-        return [p for p in dir_path.iterdir() if p.is_file()]
-
-    files = []
-    for p in dir_path.iterdir():
-        if p.is_file() and p.suffix.lower() in exts:
-            files.append(p)
-    return files
 
 
 def check_split(split):
@@ -37,17 +24,14 @@ def check_split(split):
         print("Missing label directory")
         return
 
-    images = get_files(img_dir, img_extensions)
-    labels = get_files(label_dir, (".txt",))
-
-    img_stems = {p.stem for p in images}
-    label_stems = {p.stem for p in labels}
+    idx = load_index(split, root=root)
+    records = idx.records
 
-    missing_labels = sorted(img_stems - label_stems)
-    missing_images = sorted(label_stems - img_stems)
+    missing_labels = sorted(r["stem"] for r in records if r["image"] is not None and r["label"] is None)
+    missing_images = sorted(r["stem"] for r in records if r["label"] is not None and r["image"] is None)
 
-    print(f"num images: {len(images)}")
-    print(f"num labels: {len(labels)}")
+    print(f"num images: {len(idx.image_ids())}")
+    print(f"num labels: {len(idx.label_ids())}")
 
     print(f"images with no label: {len(missing_labels)}")
     if missing_labels:
@@ -0,0 +1,123 @@
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+
+from backends import backend_name, load_model
+from dataset_index import load_index
+from evaluate import GroundTruth, StreamingEvaluator
+from frames import read_frame
+from parallel_runner import pin_threads
+from sliced_predictor import SlicedPredictor, result_to_array
+
+# Speed and accuracy of each inference backend against PyTorch FP32.
+# The same NUM_IMAGES valid images go through the single-shot path and the
+# batched sliced path (full frame + 640 tiles) on every backend; the table
+# gives ms/image, the speedup over torch and the mAP delta vs valid/labels.
+# Predictions are computed fresh (no pred_cache), since timing is the point.
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+MODEL_PATH = PROJECT_ROOT / "experiments" / "bosch_sanity" / "weights" / "best.pt"
+IMG_DIR = PROJECT_ROOT / "data" / "bosch" / "valid" / "images"
+OUT_DIR = PROJECT_ROOT / "debug" / "backends"
+
+CONF = 0.25
+SLICE = 640
+OVERLAP = 0.20
+TILE_BATCH = 16
+MERGE = "nmm"
+NUM_IMAGES = 50
+RANDOM_SEED = 0
+WARMUP = 2
+THREADS = 4
+DEVICE = "cpu"
+
+# (backend, int8); the first one is the reference
+VARIANTS = [("torch", False), ("onnx", False), ("onnx", True), ("openvino", False), ("openvino", True)]
+
+
+def run_variant(model, frames, ground_truth):
+    sliced = SlicedPredictor(model, SLICE, SLICE, OVERLAP, conf=CONF, batch_size=TILE_BATCH, device=DEVICE,
+                             merge_method=MERGE)
+    modes = {
+        "single": lambda f: result_to_array(model.predict(source=f.bgr, conf=CONF, device=DEVICE, verbose=False)[0]),
+        "sliced": lambda f: sliced.predict_arrays([f.bgr])[0],
+    }
+    out = {}
+    for mode, run in modes.items():
+        for frame in frames[:WARMUP]:
+            run(frame)
+        evaluator = StreamingEvaluator()
+        ms = []
+        for frame in frames:
+            t0 = time.perf_counter()
+            boxes = run(frame)
+            ms.append((time.perf_counter() - t0) * 1e3)
+            gts = ground_truth.boxes(frame.path, frame.shape[1], frame.shape[0])
+            if gts is not None:
+                evaluator.add(boxes, gts)
+        out[mode] = {"ms": sum(ms) / len(ms), **evaluator.summary()}
+    return out
+
+
+def fmt_delta(v, ref, scale=1.0):
+    return "-" if v is None or ref is None else f"{(v - ref) * scale:+.1f}"
+
+
+def format_table(results, ref):
+    lines = ["| Backend | Mode | ms/img | Speedup | mAP50 | mAP50 Δ (pts) | mAP50-95 Δ (pts) |",
+             "|---|---|---:|---:|---:|---:|---:|"]
+    for name, modes in results.items():
+        for mode, r in modes.items():
+            base = results[ref][mode]
+            map50 = "-" if r["map50"] is None else f"{r['map50']:.3f}"
+            lines.append(f"| {name} | {mode} | {r['ms']:.1f} | {base['ms'] / r['ms']:.2f}x | {map50} | "
+                         f"{fmt_delta(r['map50'], base['map50'], 100)} | "
+                         f"{fmt_delta(r['map50_95'], base['map50_95'], 100)} |")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare torch / ONNX Runtime / OpenVINO (FP32, INT8) inference.")
+    parser.add_argument("--variants", nargs="+", default=[backend_name(b, q) for b, q in VARIANTS],
+                        help="e.g. torch onnx_fp32 onnx_int8 openvino_fp32 openvino_int8")
+    parser.add_argument("--images", type=int, default=NUM_IMAGES)
+    args = parser.parse_args()
+
+    pin_threads(THREADS)
+    imgs = sorted(p for p in IMG_DIR.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    random.seed(RANDOM_SEED)
+    chosen = random.sample(imgs, k=min(args.images, len(imgs)))
+    frames = [f for f in (read_frame(p) for p in chosen) if f is not None]
+    ground_truth = GroundTruth(load_index("valid"))
+
+    results = {}
+    for backend, int8 in VARIANTS:
+        name = backend_name(backend, int8)
+        if name not in args.variants:
+            continue
+        print(f"[backend] {name} ...")
+        try:
+            model = load_model(MODEL_PATH, backend, int8)
+        except ImportError as e:
+            print(f"  skipped: {e}")
+            continue
+        results[name] = run_variant(model, frames, ground_truth)
+
+    ref = backend_name(*VARIANTS[0])
+    if ref not in results:
+        raise SystemExit(f"{ref} is the reference and must be in --variants")
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    out_path = OUT_DIR / "backends.json"
+    with open(out_path, "w") as f:
+        json.dump({"images": len(frames), "threads": THREADS, "reference": ref, "results": results}, f, indent=2)
+
+    print(f"\n{len(frames)} images, {THREADS} threads, reference {ref}\n")
+    print(format_table(results, ref))
+    print(f"\nSaved: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,33 @@
 from pathlib import Path
+import hashlib
+import os
 import random
+import socket
 import csv
+import time
 
 import cv2
 import numpy as np
 
-from ultralytics import YOLO
 from sahi.predict import get_sliced_prediction
 from sahi.models.ultralytics import UltralyticsDetectionModel
 
+from autotune import load_tuned
+from backends import backend_digest, backend_name, load_model, model_file
+from box_ops import count_duplicate_pairs, count_unmatched, to_box_array
+from cascade import CascadePredictor
+from dataset_index import load_index
+from evaluate import GroundTruth, StreamingEvaluator, format_metrics_table, write_metrics
+from pred_cache import PredictionCache, cached_boxes, file_digest, sahi_params
+from sliced_predictor import SlicedPredictor, slice_bboxes
+from sweep import SWEEP_FILE, load_sweep, mark_done, pending_cells
+from tile_prior import OccupancyPrior, TileSelector
+from parallel_runner import default_workers, iter_sharded
+from frames import decode_savings, read_frame, to_rgb
+from instrument import MemorySampler, StageTimes, ordered_columns, stage, torch_profile
+from pipeline import PipelineStats, run_pipeline
+from pred_store import FILE_NAME as RESULTS_FILE, ResultsWriter
+
 # Paths
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -27,35 +46,64 @@ RANDOM_SEED = 0
 IOU_MATCH = 0.50         
 IOU_DUP = 0.80           
 
-# SAHI configs to compare
-SAHI_CONFIGS = [
-    {"name": "tile640_ov10", "slice_h": 640, "slice_w": 640, "overlap": 0.10},
-    {"name": "tile640_ov20", "slice_h": 640, "slice_w": 640, "overlap": 0.20},  # your current default
-    {"name": "tile640_ov30", "slice_h": 640, "slice_w": 640, "overlap": 0.30},
-]
+# Reuse predictions from earlier runs (debug/pred_cache) when weights, image
+# and slicing params are unchanged
+USE_CACHE = True
+
+# "batched" runs all tiles of a frame through one forward pass (sliced_predictor),
+# "sahi" goes through sahi.predict.get_sliced_prediction one tile at a time
+SLICER = "batched"
+# workers / threads / tile batch measured on this host by autotune.py, if it has been run here
+TUNED = load_tuned()
+TILE_BATCH = TUNED.get("tile_batch", 16)
+# how the cascade merges its boxes (box_merge.py): "nmm" reproduces SAHI's default
+# GREEDYNMM / IOS 0.5, "nms" and "wbf" are the alternatives; sweep cells set their own
+MERGE = "nmm"
+# "torch" runs best.pt as is; "onnx" / "openvino" run an export of it (backends.py),
+# INT8 = True with static INT8 quantization calibrated on the valid split
+BACKEND = "torch"
+INT8 = False
+
+# Images are sharded across NUM_WORKERS processes, each with its own model and
+# THREADS_PER_WORKER torch threads (None = split the cores evenly)
+DEVICE = "cpu"
+NUM_WORKERS = TUNED.get("workers", default_workers())
+THREADS_PER_WORKER = TUNED.get("threads")
+SHARDS_PER_WORKER = 4
+
+# Per-worker decode-ahead / write-behind threads
+PREFETCH_THREADS = 2
+WRITER_THREADS = 2
+
+# Boxes and per-image columns go to each cell's results/ as shards finish and
+# overlays are drawn on request with render.py; True also writes every
+# side-by-side JPEG as before
+WRITE_IMAGES = False
+
+# Per-stage ms columns are always written to summary.csv (instrument.py);
+# these add per-image memory columns and a torch profiler trace per worker
+TRACE_MEMORY = False
+TORCH_PROFILE = False
+
+# SAHI configs to compare: the grid in configs/sweep_sahi.yaml (sweep.py).
+# Only cells without results for this run key are computed; RERUN_ALL redoes every cell.
+SAHI_CONFIGS = load_sweep(SWEEP_FILE)
+RERUN_ALL = False
+
+# Occupancy prior for the selective-tiling configs and the cascade's prior crops
+PRIOR_SPLIT = "train"
+PRIOR_MARGIN = 1         # grid cells of slack around each tile
+
+# per-image row of each cell's summary.csv (and columns of its results/), before the stage columns
+COLUMNS = ["image", "num_single", "num_sahi", "num_new_sahi_vs_single", "dup_pairs_sahi_est",
+           "num_gt", "tp50_single", "tp50_sahi", "tiles_run", "tiles_skipped", "sahi_ms",
+           "num_cascade", "num_new_cascade_vs_single", "tp50_cascade", "crops_cascade",
+           "crops_prior_cascade"]
 
 # Helpers
-def iou_xyxy(a, b):
-    ax1, ay1, ax2, ay2 = a
-    bx1, by1, bx2, by2 = b
-
-    inter_x1 = max(ax1, bx1)
-    inter_y1 = max(ay1, by1)
-    inter_x2 = min(ax2, bx2)
-    inter_y2 = min(ay2, by2)
-
-    inter_w = max(0, inter_x2 - inter_x1)
-    inter_h = max(0, inter_y2 - inter_y1)
-    inter = inter_w * inter_h
-
-    area_a = max(0, ax2 - ax1) * max(0, ay2 - ay1)
-    area_b = max(0, bx2 - bx1) * max(0, by2 - by1)
-    union = area_a + area_b - inter + 1e-9
-    return inter / union
-
-
-def get_single_shot_boxes(yolo_model, img_path):
-    results = yolo_model.predict(source=str(img_path), conf=CONF, verbose=False)[0]
+def get_single_shot_boxes(yolo_model, frame):
+    # frame.bgr goes straight to ultralytics, which expects BGR ndarrays
+    results = yolo_model.predict(source=frame.bgr, conf=CONF, device=DEVICE, verbose=False)[0]
     boxes_out = []
     if results.boxes is None or len(results.boxes) == 0:
         return boxes_out
@@ -69,9 +117,13 @@ def get_single_shot_boxes(yolo_model, img_path):
     return boxes_out
 
 
-def get_sahi_boxes(sahi_model, img_path, slice_h, slice_w, overlap):
+def get_sahi_boxes(sahi_model, frame, slice_h, slice_w, overlap, conf=CONF):
+    if isinstance(sahi_model, SlicedPredictor):
+        return [b for b in sahi_model.predict(frame.bgr) if b[5] >= conf]
+
+    # SAHI reads ndarrays as RGB
     result = get_sliced_prediction(
-        image=str(img_path),
+        image=to_rgb(frame.bgr),
         detection_model=sahi_model,
         slice_height=slice_h,
         slice_width=slice_w,
@@ -84,31 +136,18 @@ def get_sahi_boxes(sahi_model, img_path, slice_h, slice_w, overlap):
         bbox = op.bbox
         x1, y1, x2, y2 = bbox.minx, bbox.miny, bbox.maxx, bbox.maxy
         cls_id = int(op.category.id)
-        conf = float(op.score.value)
-        if conf >= CONF:
-            boxes_out.append((float(x1), float(y1), float(x2), float(y2), cls_id, conf))
+        score = float(op.score.value)
+        if score >= conf:
+            boxes_out.append((float(x1), float(y1), float(x2), float(y2), cls_id, score))
     return boxes_out
 
 
 def count_duplicates(boxes):
-    dup = 0
-    xyxy = [b[:4] for b in boxes]
-    for i in range(len(xyxy)):
-        for j in range(i + 1, len(xyxy)):
-            if iou_xyxy(xyxy[i], xyxy[j]) >= IOU_DUP:
-                dup += 1
-    return dup
+    return count_duplicate_pairs(boxes, IOU_DUP)
 
 
 def count_new_sahi_vs_single(sahi_boxes, single_boxes):
-    single_xyxy = [b[:4] for b in single_boxes]
-    new_count = 0
-    for sb in sahi_boxes:
-        s_xyxy = sb[:4]
-        matched = any(iou_xyxy(s_xyxy, bx) >= IOU_MATCH for bx in single_xyxy)
-        if not matched:
-            new_count += 1
-    return new_count
+    return count_unmatched(sahi_boxes, single_boxes, IOU_MATCH)
 
 
 def draw_boxes(img_bgr, boxes, color, title=None):
@@ -124,65 +163,339 @@ def draw_boxes(img_bgr, boxes, color, title=None):
     return out
 
 
+# Per-process state, filled once by init_worker
+_ctx = {}
+
+
+def init_worker(names, valid_index, prior):
+    # names: the sweep cells this run computes; valid_index / prior are loaded
+    # once in main so workers never (re)build the dataset index concurrently
+    configs = [cfg for cfg in SAHI_CONFIGS if cfg["name"] in names]
+    _ctx["configs"] = configs
+    yolo_model = load_model(MODEL_PATH, BACKEND, INT8)
+    _ctx["yolo_model"] = yolo_model
+    _ctx["cache"] = PredictionCache() if USE_CACHE else None
+    _ctx["weights_digest"] = backend_digest(file_digest(MODEL_PATH), BACKEND, INT8)
+
+    slicers = {}
+    sahi_model = None
+    if SLICER == "sahi":
+        sahi_model = UltralyticsDetectionModel(
+            model_path=str(model_file(MODEL_PATH, BACKEND, INT8)),
+            confidence_threshold=min([CONF] + [cfg["conf"] for cfg in configs]),
+            device=DEVICE,
+        )
+    for cfg in configs:
+        selector = None
+        if "prior_thr" in cfg:
+            selector = TileSelector(prior, cfg["prior_thr"], PRIOR_MARGIN)
+        # SAHI's own slicer cannot skip tiles and always merges with GREEDYNMM at
+        # the model's size, so those cells always run batched
+        sahi_ok = selector is None and cfg["merge"] == "nmm" and cfg["imgsz"] is None
+        if SLICER == "batched" or not sahi_ok:
+            slicer = SlicedPredictor(yolo_model, cfg["slice_h"], cfg["slice_w"], cfg["overlap"],
+                                     conf=cfg["conf"], batch_size=TILE_BATCH, imgsz=cfg["imgsz"], device=DEVICE,
+                                     tile_filter=selector, merge_method=cfg["merge"])
+            slicers[cfg["name"]] = (slicer, slicer.postprocess_name, selector)
+        else:
+            slicers[cfg["name"]] = (sahi_model, "sahi_default", None)
+    _ctx["slicers"] = slicers
+    # third column next to single-shot and SAHI: full frame + crops around uncertain boxes
+    # (plus crops over the prior's likeliest regions when stage 1 leaves room)
+    _ctx["cascade"] = CascadePredictor(yolo_model, conf=CONF, prior=prior, batch_size=TILE_BATCH, device=DEVICE,
+                                       merge_method=MERGE)
+    _ctx["ground_truth"] = GroundTruth(valid_index)
+    _ctx["memory"] = MemorySampler(trace_python=TRACE_MEMORY)
+
+
+def infer_image(img_path, frame):
+    # all configs for one image -> (single boxes, {config name: (sahi boxes, summary row, StageTimes)},
+    # decode ms, cascade boxes, StageTimes shared by every config)
+    times = StageTimes()
+    times.add("decode", frame.decode_ms)
+    _ctx["memory"].begin()
+    with times.activate():
+        single_boxes, cascade_boxes, shared_cols = infer_shared(img_path, frame)
+    per_cfg = {}
+    for cfg in _ctx["configs"]:
+        cfg_times = StageTimes()
+        with cfg_times.activate():
+            sahi_boxes, row = infer_config(cfg, img_path, frame, single_boxes, shared_cols)
+        per_cfg[cfg["name"]] = (sahi_boxes, row, cfg_times)
+    _ctx["memory"].end(times)
+    return single_boxes, per_cfg, frame.decode_ms, cascade_boxes, times
+
+
+def infer_shared(img_path, frame):
+    # single-shot, cascade and ground truth: run once per image, shared by every config
+    yolo_model = _ctx["yolo_model"]
+    cache = _ctx["cache"]
+    weights_digest = _ctx["weights_digest"]
+
+    with stage("single"):
+        single_boxes = cached_boxes(
+            cache, weights_digest, img_path, "single", {"conf": CONF},
+            lambda: get_single_shot_boxes(yolo_model, frame),
+            image_digest=frame.digest,
+        )
+
+    # evaluators are reset per shard by process_shard and merged in main
+    evals = _ctx["evals"]
+    with stage("eval"):
+        gts = _ctx["ground_truth"].boxes(img_path, frame.shape[1], frame.shape[0])
+        if gts is None:
+            num_gt, tp_single = "", ""
+        else:
+            num_gt, tp_single = evals["single"].add(single_boxes, gts)
+
+    cascade = _ctx["cascade"]
+    misses = cache.misses if cache else 0
+    crops_before, prior_before = cascade.tiles_run, cascade.crops_prior
+    with stage("cascade"):
+        cascade_boxes = cached_boxes(
+            cache, weights_digest, img_path, "cascade", {"conf": CONF, "cascade": cascade.cascade_name},
+            lambda: [b for b in cascade.predict(frame.bgr) if b[5] >= CONF],
+            image_digest=frame.digest,
+        )
+    computed = cache is None or cache.misses > misses
+    crops_cascade = cascade.tiles_run - crops_before if computed else ""
+    crops_prior = cascade.crops_prior - prior_before if computed else ""
+    with stage("eval"):
+        tp_cascade = "" if gts is None else evals["cascade"].add(cascade_boxes, gts)[1]
+    with stage("compare"):
+        new_cascade = count_new_sahi_vs_single(cascade_boxes, single_boxes)
+    shared_cols = {"gts": gts, "num_gt": num_gt, "tp_single": tp_single,
+                   "cascade": [len(cascade_boxes), new_cascade, tp_cascade, crops_cascade, crops_prior]}
+    return single_boxes, cascade_boxes, shared_cols
+
+
+def infer_config(cfg, img_path, frame, single_boxes, shared_cols):
+    cache = _ctx["cache"]
+    weights_digest = _ctx["weights_digest"]
+    evals = _ctx["evals"]
+    gts = shared_cols["gts"]
+
+    name = cfg["name"]
+    slice_h = cfg["slice_h"]
+    slice_w = cfg["slice_w"]
+    overlap = cfg["overlap"]
+    slicer, postprocess, selector = _ctx["slicers"][name]
+
+    h, w = frame.shape[:2]
+    tiles = slice_bboxes(h, w, slice_h, slice_w, overlap, overlap)
+    tiles_run = len(tiles) if selector is None else int(np.count_nonzero(selector(tiles, h, w)))
+
+    params = sahi_params(cfg["conf"], slice_h, slice_w, overlap, postprocess=postprocess,
+                         tiling=None if selector is None else selector.name, imgsz=cfg["imgsz"])
+    misses = cache.misses if cache else 0
+    t0 = time.perf_counter()
+    with stage("sahi"):
+        sahi_boxes = cached_boxes(
+            cache, weights_digest, img_path, "sahi", params,
+            lambda: get_sahi_boxes(slicer, frame, slice_h, slice_w, overlap, cfg["conf"]),
+            image_digest=frame.digest,
+        )
+    # latency only means something when the boxes were actually computed
+    computed = cache is None or cache.misses > misses
+    sahi_ms = round((time.perf_counter() - t0) * 1e3, 2) if computed else ""
+
+    with stage("compare"):
+        new_sahi = count_new_sahi_vs_single(sahi_boxes, single_boxes)
+        dup_sahi = count_duplicates(sahi_boxes)
+    with stage("eval"):
+        tp_sahi = "" if gts is None else evals[name].add(sahi_boxes, gts)[1]
+    row = ([img_path.name, len(single_boxes), len(sahi_boxes), new_sahi, dup_sahi,
+            shared_cols["num_gt"], shared_cols["tp_single"], tp_sahi, tiles_run, len(tiles) - tiles_run, sahi_ms]
+           + shared_cols["cascade"])
+    return sahi_boxes, row
+
+
+def render_image(img_path, frame, result):
+    # shared panels are timed into the image's StageTimes, the rest into each config's
+    single_boxes, per_cfg, _, cascade_boxes, times = result
+    img = frame.bgr
+    h = img.shape[0]
+    with times.activate():
+        with stage("draw"):
+            vis_single = draw_boxes(img, single_boxes, (0, 255, 0), title="Single-shot (no tiling)")
+            vis_cascade = draw_boxes(img, cascade_boxes, (255, 0, 0), title="Cascade")
+        with stage("resize"):
+            a = cv2.resize(vis_single, (int(vis_single.shape[1] * h / vis_single.shape[0]), h))
+            c = cv2.resize(vis_cascade, (int(vis_cascade.shape[1] * h / vis_cascade.shape[0]), h))
+
+    for cfg in _ctx["configs"]:
+        name = cfg["name"]
+        sahi_boxes, _, cfg_times = per_cfg[name]
+        with cfg_times.activate():
+            with stage("draw"):
+                vis_sahi = draw_boxes(img, sahi_boxes, (0, 0, 255),
+                                      title=f"SAHI {cfg['slice_w']}x{cfg['slice_h']} ov={cfg['overlap']:.2f}")
+            with stage("resize"):
+                b = cv2.resize(vis_sahi, (int(vis_sahi.shape[1] * h / vis_sahi.shape[0]), h))
+                side = np.hstack([a, b, c])
+            with stage("imwrite"):
+                cv2.imwrite(str(BASE_OUT / name / "side_by_side" / img_path.name), side)
+
+
+def process_shard(shard):
+    # decode ahead / write behind within the worker (see pipeline.py)
+    # each image is decoded once and shared by the single-shot pass and every config
+    _ctx["evals"] = {name: StreamingEvaluator() for name in ["single", "cascade"] + [c["name"] for c in _ctx["configs"]]}
+    trace = BASE_OUT / f"torch_trace_{os.getpid()}_{shard[0].stem}.json" if shard else None
+    with torch_profile(TORCH_PROFILE, trace, row_limit=0):
+        results, stats = run_pipeline(shard, read_frame, infer_image, render_image if WRITE_IMAGES else None,
+                                      prefetch_threads=PREFETCH_THREADS, writer_threads=WRITER_THREADS)
+    rows = [None if r is None else {name: row for name, (_, row, _) in r[1].items()} for r in results]
+    # stage columns per config: the image's shared stages plus that config's own
+    stage_cols = [None if r is None else {name: {**r[4].columns(), **cfg_times.columns()}
+                                          for name, (_, _, cfg_times) in r[1].items()}
+                  for r in results]
+    # boxes as arrays, which pickle back to the main process far smaller than tuple lists
+    boxes = [None if r is None else {"single": to_box_array(r[0]), "cascade": to_box_array(r[3]),
+                                     **{name: to_box_array(b) for name, (b, _, _) in r[1].items()}}
+             for r in results]
+    decode_ms = [r[2] for r in results if r is not None]
+    return rows, stage_cols, boxes, stats.as_dict(), decode_ms, _ctx["evals"]
+
+
+def print_selective_tiling(results, all_metrics, configs):
+    # tiles skipped, latency saved and recall lost for each prior config vs its base
+    prior_cfgs = [cfg for cfg in configs if "prior_thr" in cfg]
+    if not prior_cfgs:
+        return
+
+    def per_image(name):
+        rows = [r[name] for r in results if r is not None]
+        run = sum(r[8] for r in rows)
+        skipped = sum(r[9] for r in rows)
+        ms = [r[10] for r in rows if r[10] != ""]
+        return len(rows), run, skipped, (sum(ms) / len(ms) if ms else None)
+
+    def delta(a, b, scale=1.0):
+        return "-" if a is None or b is None else f"{(a - b) * scale:+.1f}"
+
+    print("| Config | Tiles/img | Skipped | SAHI ms/img | Saved ms/img | Recall50 | Recall lost (pts) | Tiny recall lost (pts) |")
+    print("|---|---:|---:|---:|---:|---:|---:|---:|")
+    for cfg in prior_cfgs:
+        name, base = cfg["name"], cfg["base"]
+        n, run, skipped, ms = per_image(name)
+        _, _, _, base_ms = per_image(base)
+        m, bm = all_metrics[name], all_metrics[base]
+        skip_pct = 100.0 * skipped / max(run + skipped, 1)
+        ms_txt = "-" if ms is None else f"{ms:.1f}"
+        recall_txt = "-" if m["recall50"] is None else f"{m['recall50']:.3f}"
+        print(f"| {name} | {run / max(n, 1):.2f} | {skip_pct:.0f}% | {ms_txt} | {delta(base_ms, ms)} | "
+              f"{recall_txt} | {delta(bm['recall50'], m['recall50'], 100)} | "
+              f"{delta(bm['recall50_tiny'], m['recall50_tiny'], 100)} |")
+    print()
+
+
 def main():
-    yolo_model = YOLO(str(MODEL_PATH))
-    sahi_model = UltralyticsDetectionModel(
-        model_path=str(MODEL_PATH),
-        confidence_threshold=CONF,
-        device="cpu",
-    )
     imgs = sorted([p for p in IMG_DIR.iterdir() if p.suffix.lower() in [".jpg", ".jpeg", ".png"]])
     random.seed(RANDOM_SEED)
     chosen = random.sample(imgs, k=min(NUM_IMAGES, len(imgs)))
 
-    # Baseline single-shot results 
-    single_boxes_map = {}
-    for p in chosen:
-        single_boxes_map[p.name] = get_single_shot_boxes(yolo_model, p)
-
-    # each SAHI config
-    for cfg in SAHI_CONFIGS:
+    # a cell's results are reused only if they came from the same model, images and slicer
+    run_key = {
+        "weights": backend_digest(file_digest(MODEL_PATH), BACKEND, INT8),
+        "images": hashlib.sha1("\n".join(p.name for p in chosen).encode("utf-8")).hexdigest(),
+        "conf_single": CONF,
+        "slicer": SLICER,
+    }
+    configs = pending_cells(SAHI_CONFIGS, BASE_OUT, run_key, force=RERUN_ALL)
+    skipped = [cfg["name"] for cfg in SAHI_CONFIGS if cfg not in configs]
+    if skipped:
+        print(f"[SKIP] {len(skipped)} cells already done: {', '.join(skipped)}")
+    if not configs:
+        print("Nothing to run; summarize with summarize_sahi_runs.py")
+        return
+
+    for cfg in configs:
+        out_dir = BASE_OUT / cfg["name"]
+        (out_dir / "side_by_side" if WRITE_IMAGES else out_dir).mkdir(parents=True, exist_ok=True)
+
+    # contiguous shards, a few per worker so a slow shard doesn't hold up the rest
+    n_shards = max(1, min(len(chosen), NUM_WORKERS * SHARDS_PER_WORKER))
+    shards = [chosen[k * len(chosen) // n_shards:(k + 1) * len(chosen) // n_shards] for k in range(n_shards)]
+
+    # export and index once here, not in every worker at the same time
+    model_file(MODEL_PATH, BACKEND, INT8)
+    valid_index = load_index("valid")
+    prior = OccupancyPrior.from_split(PRIOR_SPLIT)
+
+    stores = {cfg["name"]: ResultsWriter(BASE_OUT / cfg["name"] / RESULTS_FILE, image_dir=IMG_DIR)
+              for cfg in configs}
+
+    t0 = time.perf_counter()
+    results = []
+    stage_cols = []
+    decode_ms = []
+    stats = PipelineStats()
+    evals = {}
+    # shards come back in `chosen` order as they finish; each goes straight into
+    # every cell's results/, so a long sweep can be inspected while it runs
+    for rows, shard_cols, shard_boxes, shard_stats, shard_decode_ms, shard_evals in iter_sharded(
+            process_shard, shards, num_workers=NUM_WORKERS, threads=THREADS_PER_WORKER,
+            init_fn=init_worker, init_args=([cfg["name"] for cfg in configs], valid_index, prior)):
+        results.extend(rows)
+        stage_cols.extend(shard_cols)
+        decode_ms.extend(shard_decode_ms)
+        stats.merge(shard_stats)
+        for name, ev in shard_evals.items():
+            evals[name] = evals[name].merge(ev) if name in evals else ev
+        for row, cols, b in zip(rows, shard_cols, shard_boxes):
+            if row is None:
+                continue
+            for name, store in stores.items():
+                store.append(row[name][0], {"single": b["single"], "sahi": b[name], "cascade": b["cascade"]},
+                             {**dict(zip(COLUMNS[1:], row[name][1:])), **cols[name]})
+    elapsed = time.perf_counter() - t0
+    stats.wall = elapsed
+    single_metrics = evals["single"].summary()
+    cascade_metrics = evals["cascade"].summary()
+
+    # results come back in `chosen` order, so the CSVs match a serial run
+    all_metrics = {"single": single_metrics, "cascade": cascade_metrics}
+    for cfg in configs:
         name = cfg["name"]
-        slice_h = cfg["slice_h"]
-        slice_w = cfg["slice_w"]
-        overlap = cfg["overlap"]
-
         out_dir = BASE_OUT / name
-        out_dir.mkdir(parents=True, exist_ok=True)
-        side_dir = out_dir / "side_by_side"
-        side_dir.mkdir(parents=True, exist_ok=True)
-
         csv_path = out_dir / "summary.csv"
+        cfg_cols = [cols[name] for cols in stage_cols if cols is not None]
+        extra = ordered_columns(cfg_cols)
         with open(csv_path, "w", newline="") as f:
             writer = csv.writer(f)
-            writer.writerow(["image", "num_single", "num_sahi", "num_new_sahi_vs_single", "dup_pairs_sahi_est"])
-
-            for img_path in chosen:
-                img = cv2.imread(str(img_path))
-                if img is None:
-                    continue
-
-                single_boxes = single_boxes_map[img_path.name]
-                sahi_boxes = get_sahi_boxes(sahi_model, img_path, slice_h, slice_w, overlap)
-
-                new_sahi = count_new_sahi_vs_single(sahi_boxes, single_boxes)
-                dup_sahi = count_duplicates(sahi_boxes)
-
-                vis_single = draw_boxes(img, single_boxes, (0, 255, 0), title="Single-shot (no tiling)")
-                vis_sahi = draw_boxes(img, sahi_boxes, (0, 0, 255), title=f"SAHI {slice_w}x{slice_h} ov={overlap:.2f}")
-
-                h = img.shape[0]
-                a = cv2.resize(vis_single, (int(vis_single.shape[1] * h / vis_single.shape[0]), h))
-                b = cv2.resize(vis_sahi, (int(vis_sahi.shape[1] * h / vis_sahi.shape[0]), h))
-                side = np.hstack([a, b])
-
-                cv2.imwrite(str(side_dir / img_path.name), side)
-
-                writer.writerow([img_path.name, len(single_boxes), len(sahi_boxes), new_sahi, dup_sahi])
-
-        print(f"[DONE] {name}: wrote {csv_path} and {side_dir}")
-
-    print("\nAblation outputs saved in:")
+            writer.writerow(COLUMNS + extra)
+            for rows, cols in zip(results, stage_cols):
+                if rows is not None:
+                    writer.writerow(rows[name] + [cols[name].get(c, "") for c in extra])
+
+        # summarize_sahi_runs.py picks this up next to summary.csv
+        metrics = {"single": single_metrics, "sahi": evals[name].summary(), "cascade": cascade_metrics}
+        write_metrics(out_dir / "metrics.json", metrics)
+        all_metrics[name] = metrics["sahi"]
+        stores[name].close()
+        ms = [rows[name][10] for rows in results if rows is not None and rows[name][10] != ""]
+        latency = {"sahi_ms": sum(ms) / len(ms), "images": len(ms), "host": socket.gethostname()} if ms else None
+        mark_done(out_dir, cfg, run_key, latency)
+
+        images = f" and {out_dir / 'side_by_side'}" if WRITE_IMAGES else f" (overlays: render.py {out_dir})"
+        print(f"[DONE] {name}: wrote {csv_path}, metrics.json, {RESULTS_FILE}{images}")
+
+    print(f"\n{len(chosen)} images x {len(configs)} configs in {elapsed:.1f}s "
+          f"({len(chosen) / max(elapsed, 1e-9):.2f} images/sec, {NUM_WORKERS} workers, "
+          f"{backend_name(BACKEND, INT8)} backend)")
+    print("\n" + format_metrics_table(all_metrics) + "\n")
+    print_selective_tiling(results, all_metrics, configs)
+    crops = [rows[configs[0]["name"]][14] for rows in results if rows is not None]
+    crops = [c for c in crops if c != ""]
+    if crops:
+        print(f"cascade: {sum(crops) / len(crops):.2f} crops/frame (plus the full-frame pass)\n")
+    print(stats.report())
+    # the old loop decoded each image once for the single-shot pass, then again
+    # for drawing and for SAHI in every config
+    per_decode, saved = decode_savings(decode_ms, decodes_before=1 + 2 * len(configs))
+    print(f"decode: {per_decode:.1f} ms/image, ~{saved:.1f} ms/image saved by decoding once")
+    print("Ablation outputs saved in:")
     print(BASE_OUT)
 
 
@@ -5,10 +5,24 @@ import csv
 import cv2
 import numpy as np
 
-from ultralytics import YOLO
 from sahi.predict import get_sliced_prediction
 from sahi.models.ultralytics import UltralyticsDetectionModel
 
+from autotune import load_tuned
+from backends import backend_digest, backend_name, load_model, model_file
+from box_ops import count_duplicate_pairs, count_unmatched
+from cascade import CascadePredictor
+from dataset_index import load_index
+from evaluate import GroundTruth, StreamingEvaluator, format_metrics_table, write_metrics
+from pred_cache import PredictionCache, cached_boxes, file_digest, sahi_params
+from sliced_predictor import SlicedPredictor, slice_bboxes
+from tile_prior import OccupancyPrior
+from frames import decode_savings, read_frame, to_rgb
+from instrument import MemorySampler, StageTimes, ordered_columns, stage, torch_profile
+from parallel_runner import pin_threads
+from pipeline import run_pipeline
+from pred_store import FILE_NAME as RESULTS_FILE, ResultsWriter
+
 
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -23,26 +37,44 @@ CONF = 0.25
 SLICE_H = 640
 SLICE_W = 640
 OVERLAP = 0.20
+# "batched" runs all tiles of a frame through one forward pass (sliced_predictor),
+# "sahi" goes through sahi.predict.get_sliced_prediction one tile at a time
+SLICER = "batched"
+# tile batch (and threads, if tuned with one worker) from autotune.py on this host
+TUNED = load_tuned()
+TILE_BATCH = TUNED.get("tile_batch", 16)
+# how the batched slicer merges tile + full-frame boxes (box_merge.py):
+# "nmm" reproduces SAHI's default GREEDYNMM / IOS 0.5, "nms" and "wbf" are the alternatives
+MERGE = "nmm"
+# the cascade also crops the likeliest light regions of this split's label
+# prior (tile_prior.py) when stage 1 finds little; None disables that
+CASCADE_PRIOR_SPLIT = "train"
+# "torch" runs best.pt as is; "onnx" / "openvino" run an export of it (backends.py),
+# INT8 = True with static INT8 quantization calibrated on the valid split
+BACKEND = "torch"
+INT8 = False
 NUM_IMAGES = 20
 RANDOM_SEED = 0
 IOU_MATCH = 0.50
 IOU_DUP = 0.80
 
+# Reuse predictions from earlier runs (debug/pred_cache) when weights, image
+# and slicing params are unchanged
+USE_CACHE = True
+
+# Decode ahead / write behind the inference loop (see pipeline.py)
+PREFETCH_THREADS = 2
+WRITER_THREADS = 2
+
+# Boxes and per-image columns go to results/ as images finish and overlays
+# are drawn on request with render.py;
+# True also writes every single / sahi / cascade / side-by-side JPEG as before
+WRITE_IMAGES = False
 
-def iou_xyxy(a, b):
-    ax1, ay1, ax2, ay2 = a
-    bx1, by1, bx2, by2 = b
-    inter_x1 = max(ax1, bx1)
-    inter_y1 = max(ay1, by1)
-    inter_x2 = min(ax2, bx2)
-    inter_y2 = min(ay2, by2)
-    inter_w = max(0, inter_x2 - inter_x1)
-    inter_h = max(0, inter_y2 - inter_y1)
-    inter = inter_w * inter_h
-    area_a = max(0, ax2 - ax1) * max(0, ay2 - ay1)
-    area_b = max(0, bx2 - bx1) * max(0, by2 - by1)
-    union = area_a + area_b - inter + 1e-9
-    return inter / union
+# Per-stage ms columns are always written to summary.csv (instrument.py);
+# these add per-image memory columns and a torch profiler trace
+TRACE_MEMORY = False
+TORCH_PROFILE = False
 
 
 def draw_boxes(img_bgr, boxes, color=(0, 255, 0), prefix=""):
@@ -56,8 +88,9 @@ def draw_boxes(img_bgr, boxes, color=(0, 255, 0), prefix=""):
     return out
 
 
-def get_single_shot_boxes(yolo_model, img_path):
-    results = yolo_model.predict(source=str(img_path), conf=CONF, verbose=False)[0]
+def get_single_shot_boxes(yolo_model, frame):
+    # frame.bgr goes straight to ultralytics, which expects BGR ndarrays
+    results = yolo_model.predict(source=frame.bgr, conf=CONF, verbose=False)[0]
     boxes_out = []
     if results.boxes is None or len(results.boxes) == 0:
         return boxes_out
@@ -71,9 +104,13 @@ def get_single_shot_boxes(yolo_model, img_path):
     return boxes_out
 
 
-def get_sahi_boxes(sahi_model, img_path):
+def get_sahi_boxes(sahi_model, frame):
+    if isinstance(sahi_model, SlicedPredictor):
+        return [b for b in sahi_model.predict(frame.bgr) if b[5] >= CONF]
+
+    # SAHI reads ndarrays as RGB
     result = get_sliced_prediction(
-        image=str(img_path),
+        image=to_rgb(frame.bgr),
         detection_model=sahi_model,
         slice_height=SLICE_H,
         slice_width=SLICE_W,
@@ -93,96 +130,234 @@ def get_sahi_boxes(sahi_model, img_path):
 
 
 def count_duplicates(boxes):
-    dup = 0
-    xyxy = [b[:4] for b in boxes]
-    for i in range(len(xyxy)):
-        for j in range(i + 1, len(xyxy)):
-            if iou_xyxy(xyxy[i], xyxy[j]) >= IOU_DUP:
-                dup += 1
-    return dup
+    return count_duplicate_pairs(boxes, IOU_DUP)
 
 
 def count_new_sahi_vs_single(sahi_boxes, single_boxes):
-    single_xyxy = [b[:4] for b in single_boxes]
-    new_count = 0
-    for sb in sahi_boxes:
-        s_xyxy = sb[:4]
-        matched = any(iou_xyxy(s_xyxy, bx) >= IOU_MATCH for bx in single_xyxy)
-        if not matched:
-            new_count += 1
-    return new_count
-
+    return count_unmatched(sahi_boxes, single_boxes, IOU_MATCH)
+
+
+# per-image row of summary.csv (and columns of results/), before the stage columns
+COLUMNS = [
+    "image",
+    "num_single",
+    "num_sahi",
+    "num_new_sahi_vs_single",
+    "dup_pairs_sahi_est",
+    "num_gt",
+    "tp50_single",
+    "tp50_sahi",
+    "num_cascade",
+    "num_new_cascade_vs_single",
+    "tp50_cascade",
+    "tiles_sahi",
+    "crops_cascade",
+    "crops_prior_cascade",
+]
 
 
 def main():
     OUT_DIR.mkdir(parents=True, exist_ok=True)
     out_single = OUT_DIR / "single"
     out_sahi = OUT_DIR / "sahi"
+    out_cascade = OUT_DIR / "cascade"
     out_side = OUT_DIR / "side_by_side"
-    for d in [out_single, out_sahi, out_side]:
-        d.mkdir(parents=True, exist_ok=True)
-
-    yolo_model = YOLO(str(MODEL_PATH))
-    sahi_model = UltralyticsDetectionModel(
-        model_path=str(MODEL_PATH),
-        confidence_threshold=CONF,
-        device="cpu",
-    )
+    if WRITE_IMAGES:
+        for d in [out_single, out_sahi, out_cascade, out_side]:
+            d.mkdir(parents=True, exist_ok=True)
+
+    if TUNED.get("workers") == 1:
+        pin_threads(TUNED["threads"])
+    yolo_model = load_model(MODEL_PATH, BACKEND, INT8)
+    if SLICER == "batched":
+        sahi_model = SlicedPredictor(yolo_model, SLICE_H, SLICE_W, OVERLAP, conf=CONF, batch_size=TILE_BATCH,
+                                     merge_method=MERGE)
+        postprocess = sahi_model.postprocess_name
+    else:
+        sahi_model = UltralyticsDetectionModel(
+            model_path=str(model_file(MODEL_PATH, BACKEND, INT8)),
+            confidence_threshold=CONF,
+            device="cpu",
+        )
+        postprocess = "sahi_default"
+    # full-frame pass, then full-res crops only around uncertain / small detections
+    # (and around the prior's likeliest regions when stage 1 leaves room)
+    prior = None if CASCADE_PRIOR_SPLIT is None else OccupancyPrior.from_split(CASCADE_PRIOR_SPLIT)
+    cascade_model = CascadePredictor(yolo_model, SLICE_H, SLICE_W, conf=CONF, prior=prior, batch_size=TILE_BATCH,
+                                     merge_method=MERGE)
+    cascade_params = {"conf": CONF, "cascade": cascade_model.cascade_name}
 
     imgs = sorted([p for p in IMG_DIR.iterdir() if p.suffix.lower() in [".jpg", ".jpeg", ".png"]])
     random.seed(RANDOM_SEED)
     chosen = random.sample(imgs, k=min(NUM_IMAGES, len(imgs)))
 
-    csv_path = OUT_DIR / "summary.csv"
-    with open(csv_path, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            "image",
-            "num_single",
-            "num_sahi",
-            "num_new_sahi_vs_single",
-            "dup_pairs_sahi_est",
-        ])
-
-        for img_path in chosen:
-            img = cv2.imread(str(img_path))
-            if img is None:
-                print("Could not read:", img_path)
-                continue
-
-            single_boxes = get_single_shot_boxes(yolo_model, img_path)
-            sahi_boxes = get_sahi_boxes(sahi_model, img_path)
-
+    cache = PredictionCache() if USE_CACHE else None
+    weights_digest = backend_digest(file_digest(MODEL_PATH), BACKEND, INT8)
+    params = sahi_params(CONF, SLICE_H, SLICE_W, OVERLAP, postprocess=postprocess)
+
+    # score every method against valid/labels as images stream through
+    ground_truth = GroundTruth(load_index("valid"))
+    eval_single = StreamingEvaluator()
+    eval_sahi = StreamingEvaluator()
+    eval_cascade = StreamingEvaluator()
+    memory = MemorySampler(trace_python=TRACE_MEMORY)
+    store = ResultsWriter(OUT_DIR / RESULTS_FILE, image_dir=IMG_DIR)
+
+    # each image is read and decoded once; the bytes also give the cache digest
+    def decode(img_path):
+        frame = read_frame(img_path)
+        if frame is None:
+            print("Could not read:", img_path)
+        return frame
+
+    def infer(img_path, frame):
+        times = StageTimes()
+        times.add("decode", frame.decode_ms)
+        memory.begin()
+        with times.activate():
+            result = infer_stages(img_path, frame, times)
+        # with images on, render() records the result once its stages are timed too
+        if not WRITE_IMAGES:
+            record(result)
+        return result
+
+    def record(result):
+        single_boxes, sahi_boxes, cascade_boxes, row, times = result
+        store.append(row[0], {"single": single_boxes, "sahi": sahi_boxes, "cascade": cascade_boxes},
+                     {**dict(zip(COLUMNS[1:], row[1:])), **times.columns()})
+
+    def infer_stages(img_path, frame, times):
+        with stage("single"):
+            single_boxes = cached_boxes(
+                cache, weights_digest, img_path, "single", {"conf": CONF},
+                lambda: get_single_shot_boxes(yolo_model, frame),
+                image_digest=frame.digest,
+            )
+        with stage("sahi"):
+            sahi_boxes = cached_boxes(
+                cache, weights_digest, img_path, "sahi", params,
+                lambda: get_sahi_boxes(sahi_model, frame),
+                image_digest=frame.digest,
+            )
+        misses = cache.misses if cache else 0
+        crops_before, prior_before = cascade_model.tiles_run, cascade_model.crops_prior
+        with stage("cascade"):
+            cascade_boxes = cached_boxes(
+                cache, weights_digest, img_path, "cascade", cascade_params,
+                lambda: [b for b in cascade_model.predict(frame.bgr) if b[5] >= CONF],
+                image_digest=frame.digest,
+            )
+        decode_ms.append(frame.decode_ms)
+
+        # tiles per frame: SAHI runs every tile; the cascade's crop count is only
+        # known when it actually ran (not on a cache hit)
+        tiles_sahi = len(slice_bboxes(frame.shape[0], frame.shape[1], SLICE_H, SLICE_W, OVERLAP, OVERLAP))
+        computed = cache is None or cache.misses > misses
+        crops_cascade = cascade_model.tiles_run - crops_before if computed else ""
+        crops_prior = cascade_model.crops_prior - prior_before if computed else ""
+
+        with stage("compare"):
             new_sahi = count_new_sahi_vs_single(sahi_boxes, single_boxes)
             dup_sahi = count_duplicates(sahi_boxes)
-
+            new_cascade = count_new_sahi_vs_single(cascade_boxes, single_boxes)
+        with stage("eval"):
+            gts = ground_truth.boxes(img_path, frame.shape[1], frame.shape[0])
+            if gts is None:
+                num_gt, tp_single, tp_sahi, tp_cascade = "", "", "", ""
+            else:
+                num_gt, tp_single = eval_single.add(single_boxes, gts)
+                _, tp_sahi = eval_sahi.add(sahi_boxes, gts)
+                _, tp_cascade = eval_cascade.add(cascade_boxes, gts)
+        memory.end(times)
+        print(f"{img_path.name}: single={len(single_boxes)} sahi={len(sahi_boxes)} cascade={len(cascade_boxes)} "
+              f"new_sahi={new_sahi} new_cascade={new_cascade} dup_est={dup_sahi} gt={num_gt} "
+              f"tp50 single/sahi/cascade={tp_single}/{tp_sahi}/{tp_cascade}")
+        return single_boxes, sahi_boxes, cascade_boxes, [
+            img_path.name, len(single_boxes), len(sahi_boxes), new_sahi, dup_sahi,
+            num_gt, tp_single, tp_sahi,
+            len(cascade_boxes), new_cascade, tp_cascade, tiles_sahi, crops_cascade, crops_prior,
+        ], times
+
+    def render(img_path, frame, result):
+        # runs on a writer thread once infer is done with this image, so it can
+        # keep adding to the same StageTimes
+        single_boxes, sahi_boxes, cascade_boxes, _, times = result
+        with times.activate():
+            render_stages(img_path, frame, single_boxes, sahi_boxes, cascade_boxes)
+        record(result)
+
+    def render_stages(img_path, frame, single_boxes, sahi_boxes, cascade_boxes):
+        img = frame.bgr
+        with stage("draw"):
             vis_single = draw_boxes(img, single_boxes, color=(0, 255, 0), prefix="")
             vis_sahi = draw_boxes(img, sahi_boxes, color=(0, 0, 255), prefix="")
+            vis_cascade = draw_boxes(img, cascade_boxes, color=(255, 0, 0), prefix="")
 
-            out1 = out_single / img_path.name
-            out2 = out_sahi / img_path.name
-            cv2.imwrite(str(out1), vis_single)
-            cv2.imwrite(str(out2), vis_sahi)
+        with stage("imwrite"):
+            cv2.imwrite(str(out_single / img_path.name), vis_single)
+            cv2.imwrite(str(out_sahi / img_path.name), vis_sahi)
+            cv2.imwrite(str(out_cascade / img_path.name), vis_cascade)
 
+        with stage("resize"):
             h = img.shape[0]
-            a = cv2.resize(vis_single, (int(vis_single.shape[1] * h / vis_single.shape[0]), h))
-            b = cv2.resize(vis_sahi, (int(vis_sahi.shape[1] * h / vis_sahi.shape[0]), h))
-            side = np.hstack([a, b])
-
-            cv2.putText(side, "Single-shot (no tiling)", (20, 40),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 3, cv2.LINE_AA)
-            cv2.putText(side, "SAHI tiling", (a.shape[1] + 20, 40),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 3, cv2.LINE_AA)
-
+            panels = [cv2.resize(v, (int(v.shape[1] * h / v.shape[0]), h))
+                      for v in (vis_single, vis_sahi, vis_cascade)]
+            side = np.hstack(panels)
+
+        with stage("draw"):
+            x = 0
+            for panel, title in zip(panels, ["Single-shot (no tiling)", "SAHI tiling", "Cascade"]):
+                cv2.putText(side, title, (x + 20, 40),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 3, cv2.LINE_AA)
+                x += panel.shape[1]
+
+        with stage("imwrite"):
             out3 = out_side / img_path.name
             cv2.imwrite(str(out3), side)
 
-            writer.writerow([img_path.name, len(single_boxes), len(sahi_boxes), new_sahi, dup_sahi])
-            print(f"{img_path.name}: single={len(single_boxes)} sahi={len(sahi_boxes)} new_sahi={new_sahi} dup_est={dup_sahi}")
+    decode_ms = []
+    with torch_profile(TORCH_PROFILE, OUT_DIR / "torch_trace.json"):
+        results, stats = run_pipeline(chosen, decode, infer, render if WRITE_IMAGES else None,
+                                      prefetch_threads=PREFETCH_THREADS, writer_threads=WRITER_THREADS)
+    done = [r for r in results if r is not None]
+    stage_cols = ordered_columns(r[4].columns() for r in done)
+
+    results_path = store.close()
+
+    csv_path = OUT_DIR / "summary.csv"
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS + stage_cols)
+        for result in done:
+            cols = result[4].columns()
+            writer.writerow(result[3] + [cols.get(c, "") for c in stage_cols])
+
+    metrics = {"single": eval_single.summary(), "sahi": eval_sahi.summary(), "cascade": eval_cascade.summary()}
+    metrics_path = OUT_DIR / "metrics.json"
+    write_metrics(metrics_path, metrics)
 
+    print("\n" + format_metrics_table(metrics))
     print("\nSaved:")
-    print("  Side-by-side:", out_side)
+    print("  Results:", results_path, f"(overlays: python analysis/render.py {OUT_DIR} --gallery)")
+    if WRITE_IMAGES:
+        print("  Side-by-side:", out_side)
     print("  CSV summary:", csv_path)
+    print("  Metrics:", metrics_path)
+    print(stats.report())
+    # the old loop decoded every image three times: for drawing, single-shot and SAHI
+    per_decode, saved = decode_savings(decode_ms, decodes_before=3)
+    print(f"  decode: {per_decode:.1f} ms/image, ~{saved:.1f} ms/image saved by decoding once")
+    if isinstance(sahi_model, SlicedPredictor):
+        print("  Sliced predictor:", sahi_model.report())
+    print("  Cascade:", cascade_model.report())
+    print("  Backend:", backend_name(BACKEND, INT8))
+    rows = [r[3] for r in done]
+    crops = [r[12] for r in rows if r[12] != ""]
+    if rows:
+        print(f"  Tiles/frame (plus one full-frame pass each): SAHI {sum(r[11] for r in rows) / len(rows):.2f}, "
+              f"cascade {sum(crops) / len(crops) if crops else float('nan'):.2f}")
+    if cache is not None:
+        print(f"  Prediction cache: {cache.hits} hits, {cache.misses} misses ({cache.cache_dir})")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,330 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# Cached manifest + columnar label table for data/bosch/{train,valid,test}.
+# One record per file stem (image and/or label file). Each record holds the
+# image's width/height read from the file header (no decode), a sha1 of the
+# image bytes, and where its boxes live in a flat table saved as .npy and
+# memory-mapped on load. The index is rebuilt only for files whose size or
+# mtime changed, so every analysis script can call load_index() cheaply and
+# run its summaries as NumPy queries.
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DATA_ROOT = PROJECT_ROOT / "data" / "bosch"
+INDEX_DIR = PROJECT_ROOT / "debug" / "dataset_index"
+SPLITS = ["train", "valid", "test"]
+IMG_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+INDEX_VERSION = 2
+
+BOX_DTYPE = np.dtype([
+    ("image_id", np.uint32),
+    ("cls", np.uint8),       # parse_label_file rejects ids outside 0..255
+    ("x", np.float32),
+    ("y", np.float32),
+    ("w", np.float32),
+    ("h", np.float32),
+])
+
+
+def image_size(path):
+    # (width, height) from the JPEG SOF / PNG IHDR / BMP header, or None
+    with open(path, "rb") as f:
+        head = f.read(26)
+        if head[:8] == b"\x89PNG\r\n\x1a\n":
+            w, h = struct.unpack(">II", head[16:24])
+            return int(w), int(h)
+        if head[:2] == b"BM":
+            w, h = struct.unpack("<ii", head[18:26])
+            return int(w), abs(int(h))
+        if head[:2] != b"\xff\xd8":
+            return None
+
+        f.seek(2)
+        while True:
+            byte = f.read(1)
+            while byte and byte != b"\xff":
+                byte = f.read(1)
+            while byte == b"\xff":
+                byte = f.read(1)
+            if not byte:
+                return None
+            marker = byte[0]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                continue
+            seg = f.read(2)
+            if len(seg) < 2:
+                return None
+            seg_len = struct.unpack(">H", seg)[0]
+            # SOF0..SOF15, minus DHT (C4), JPG (C8) and DAC (CC)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                data = f.read(5)
+                if len(data) < 5:
+                    return None
+                h, w = struct.unpack(">HH", data[1:5])
+                return int(w), int(h)
+            f.seek(seg_len - 2, 1)
+
+
+def sha1_file(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def parse_label_file(path):
+    # -> (rows as [cls, x, y, w, h], bad lines); same rules as check_labels.py:
+    # a line needs at least 5 fields and a numeric class id that fits the
+    # uint8 cls column (0..255), so bad ids are reported instead of wrapping
+    rows = []
+    bad = []
+    with open(path, "r") as f:
+        for ln in f:
+            ln = ln.strip()
+            if not ln:
+                continue
+            parts = ln.split()
+            if len(parts) < 5:
+                bad.append(ln)
+                continue
+            try:
+                row = [int(float(parts[0]))] + [float(v) for v in parts[1:5]]
+            except ValueError:
+                bad.append(ln)
+                continue
+            if not 0 <= row[0] <= np.iinfo(BOX_DTYPE["cls"]).max:
+                bad.append(ln)
+                continue
+            rows.append(row)
+    return rows, bad
+
+
+def scan_dir(dir_path, exts):
+    out = {}
+    if not dir_path.exists():
+        return out
+    with os.scandir(dir_path) as it:
+        for e in it:
+            if e.is_file() and e.name.lower().endswith(exts):
+                st = e.stat()
+                out[os.path.splitext(e.name)[0]] = (e.name, st.st_size, st.st_mtime_ns)
+    return out
+
+
+def _signature(images, labels):
+    h = hashlib.sha1()
+    for kind, files in (("i", images), ("l", labels)):
+        for stem in sorted(files):
+            h.update(f"{kind}|{files[stem][0]}|{files[stem][1]}|{files[stem][2]}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+class DatasetIndex:
+    def __init__(self, split, records, boxes, root=DATA_ROOT):
+        self.split = split
+        self.root = Path(root)
+        self.records = records
+        self.boxes = boxes
+
+    @property
+    def img_dir(self):
+        return self.root / self.split / "images"
+
+    @property
+    def label_dir(self):
+        return self.root / self.split / "labels"
+
+    def image_ids(self):
+        return [i for i, r in enumerate(self.records) if r["image"] is not None]
+
+    def label_ids(self):
+        return [i for i, r in enumerate(self.records) if r["label"] is not None]
+
+    def image_path(self, rid):
+        name = self.records[rid]["image"]
+        return None if name is None else self.img_dir / name
+
+    def label_path(self, rid):
+        name = self.records[rid]["label"]
+        return None if name is None else self.label_dir / name
+
+    def image_paths(self):
+        return [self.image_path(i) for i in self.image_ids()]
+
+    def boxes_for(self, rid):
+        r = self.records[rid]
+        return self.boxes[r["box_start"]:r["box_start"] + r["box_count"]]
+
+    def boxes_per_record(self):
+        return np.bincount(self.boxes["image_id"], minlength=len(self.records))
+
+    def class_counts(self, minlength=0):
+        return np.bincount(self.boxes["cls"], minlength=minlength)
+
+    def boxes_pixels(self):
+        # xyxy pixel coords for every box, using each image's header size
+        wh = np.array([(r["width"] or 0, r["height"] or 0) for r in self.records], dtype=np.float32)
+        if len(self.boxes) == 0:
+            return np.zeros((0, 4), dtype=np.float32)
+        iw = wh[self.boxes["image_id"], 0]
+        ih = wh[self.boxes["image_id"], 1]
+        cx, cy = self.boxes["x"] * iw, self.boxes["y"] * ih
+        bw, bh = self.boxes["w"] * iw, self.boxes["h"] * ih
+        return np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+
+    def bad_lines(self):
+        return [(r["label"], ln) for r in self.records for ln in r["bad_lines"]]
+
+
+def _index_paths(split, index_dir):
+    return index_dir / f"{split}_manifest.json", index_dir / f"{split}_boxes.npy"
+
+
+def _load_saved(split, index_dir, mmap=True):
+    manifest_path, boxes_path = _index_paths(split, index_dir)
+    if not manifest_path.exists() or not boxes_path.exists():
+        return None, None
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != INDEX_VERSION:
+        return None, None
+    return manifest, np.load(boxes_path, mmap_mode="r" if mmap else None)
+
+
+def build_index(split, root=DATA_ROOT, index_dir=INDEX_DIR, workers=8, incremental=True, verbose=True):
+    root = Path(root)
+    index_dir = Path(index_dir)
+    img_dir = root / split / "images"
+    label_dir = root / split / "labels"
+    images = scan_dir(img_dir, IMG_EXTENSIONS)
+    labels = scan_dir(label_dir, (".txt",))
+
+    # read the old table fully (no mmap) so it can be replaced on disk below
+    old_manifest, old_boxes = _load_saved(split, index_dir, mmap=False) if incremental else (None, None)
+    old = {r["stem"]: r for r in old_manifest["records"]} if old_manifest else {}
+
+    stems = sorted(set(images) | set(labels))
+    records = []
+    hash_jobs = []
+    label_jobs = []
+    for stem in stems:
+        prev = old.get(stem)
+        r = {"stem": stem, "image": None, "image_sig": None, "width": None, "height": None,
+             "digest": None, "label": None, "label_sig": None, "bad_lines": [],
+             "box_start": 0, "box_count": 0}
+
+        if stem in images:
+            name, size, mtime = images[stem]
+            r["image"], r["image_sig"] = name, [size, mtime]
+            if prev and prev["image"] == name and prev["image_sig"] == [size, mtime]:
+                r["width"], r["height"], r["digest"] = prev["width"], prev["height"], prev["digest"]
+            else:
+                hash_jobs.append(len(records))
+
+        if stem in labels:
+            name, size, mtime = labels[stem]
+            r["label"], r["label_sig"] = name, [size, mtime]
+            if prev and prev["label"] == name and prev["label_sig"] == [size, mtime]:
+                r["_rows"] = old_boxes[prev["box_start"]:prev["box_start"] + prev["box_count"]]
+                r["bad_lines"] = prev["bad_lines"]
+            else:
+                label_jobs.append(len(records))
+        records.append(r)
+
+    def hash_image(rid):
+        path = img_dir / records[rid]["image"]
+        size = image_size(path)
+        if size is not None:
+            records[rid]["width"], records[rid]["height"] = size
+        records[rid]["digest"] = sha1_file(path)
+
+    def parse_label(rid):
+        rows, bad = parse_label_file(label_dir / records[rid]["label"])
+        records[rid]["_rows"] = rows
+        records[rid]["bad_lines"] = bad
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(hash_image, hash_jobs))
+        list(pool.map(parse_label, label_jobs))
+
+    total = sum(len(r.get("_rows", ())) for r in records)
+    boxes = np.zeros(total, dtype=BOX_DTYPE)
+    pos = 0
+    for rid, r in enumerate(records):
+        rows = r.pop("_rows", None)
+        n = 0 if rows is None else len(rows)
+        r["box_start"], r["box_count"] = pos, n
+        if n == 0:
+            continue
+        if isinstance(rows, np.ndarray):
+            chunk = rows.copy()
+        else:
+            arr = np.asarray(rows, dtype=np.float64)
+            chunk = np.zeros(n, dtype=BOX_DTYPE)
+            chunk["cls"] = arr[:, 0]
+            chunk["x"], chunk["y"], chunk["w"], chunk["h"] = arr[:, 1], arr[:, 2], arr[:, 3], arr[:, 4]
+        chunk["image_id"] = rid
+        boxes[pos:pos + n] = chunk
+        pos += n
+
+    index_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path, boxes_path = _index_paths(split, index_dir)
+    manifest = {
+        "version": INDEX_VERSION,
+        "split": split,
+        "signature": _signature(images, labels),
+        "records": records,
+    }
+    # write boxes first: the manifest signature is what marks the index as fresh;
+    # per-process temp names so concurrent builders never share a half-written file
+    tmp = boxes_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, boxes)
+    os.replace(tmp, boxes_path)
+    tmp = manifest_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, manifest_path)
+
+    if verbose:
+        print(f"[{split}] indexed {len(records)} stems, {len(boxes)} boxes "
+              f"({len(hash_jobs)} images and {len(label_jobs)} label files re-read)")
+    return DatasetIndex(split, records, np.load(boxes_path, mmap_mode="r"), root=root)
+
+
+def load_index(split, root=DATA_ROOT, index_dir=INDEX_DIR, rebuild=False, verbose=False):
+    root = Path(root)
+    index_dir = Path(index_dir)
+    if not rebuild:
+        manifest, boxes = _load_saved(split, index_dir)
+        if manifest is not None:
+            images = scan_dir(root / split / "images", IMG_EXTENSIONS)
+            labels = scan_dir(root / split / "labels", (".txt",))
+            if manifest["signature"] == _signature(images, labels):
+                return DatasetIndex(split, manifest["records"], boxes, root=root)
+    return build_index(split, root=root, index_dir=index_dir, incremental=not rebuild, verbose=verbose)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or refresh the Bosch dataset index.")
+    parser.add_argument("--splits", nargs="+", default=SPLITS)
+    parser.add_argument("--rebuild", action="store_true", help="ignore the saved index and re-read everything")
+    args = parser.parse_args()
+
+    for split in args.splits:
+        idx = load_index(split, rebuild=args.rebuild, verbose=True)
+        counts = idx.class_counts()
+        print(f"[{split}] images={len(idx.image_ids())} label_files={len(idx.label_ids())} "
+              f"boxes={len(idx.boxes)} class_counts={dict(enumerate(counts.tolist()))}")
+
+
+if __name__ == "__main__":
+    main()
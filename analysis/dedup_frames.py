@@ -0,0 +1,336 @@
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+from dataset_index import DATA_ROOT, load_index
+
+# Near-duplicate frame detection for the train split.
+# The Bosch export is consecutive dashcam frames, so many train images are
+# nearly identical. Every image gets a 64-bit difference hash (dHash: a 9x8
+# grayscale thumbnail, one bit per left/right neighbour comparison), computed
+# on a thread pool from a reduced-size JPEG decode and cached by the image
+# sha1 from the dataset index. Near-duplicates are found with a multi-index
+# hash rather than all pairs: the 64 bits are split into THRESHOLD + 1 bands,
+# and two hashes within THRESHOLD bits of each other must agree exactly on at
+# least one band, so only images sharing a band bucket are compared, a block
+# of rows at a time. A bucket larger than MAX_BUCKET (near-blank frames that
+# agree on a whole band) is split again the same way on its remaining bits.
+# Pairs are kept as i * n + j keys and deduplicated with np.unique.
+# Clusters are built around leaders rather than by joining pairs
+# transitively: frames are visited most boxes first, and an unassigned frame
+# becomes a leader that takes its unassigned neighbours within THRESHOLD. A
+# cluster therefore never spans more than 2 * THRESHOLD bits, and a slowly
+# changing drive segment (A~B~C~...) splits into several clusters instead of
+# collapsing into one. Each cluster keeps KEEP_PER_CLUSTER images (most boxes
+# first) and the rest are left out of a train list that
+# step4_makeyaml_and_train.py can train on instead. dedup_yaml refuses to
+# write a list that keeps less than MIN_KEPT of the frames and warns when a
+# cluster grows past MAX_CLUSTER or a class loses more than 1 - MIN_KEPT of
+# its boxes.
+# --report compares Ultralytics runs (seconds per epoch against val mAP).
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = PROJECT_ROOT / "debug" / "dedup"
+OUT_ROOT = PROJECT_ROOT / "data" / "bosch_dedup"
+
+THRESHOLD = 4            # max Hamming distance (of 64 bits) between near-duplicates
+KEEP_PER_CLUSTER = 1
+MIN_KEPT = 0.3           # sanity bounds checked by dedup_yaml
+MAX_CLUSTER = 50
+MAX_BUCKET = 4096        # band buckets above this are split again on their other bits
+BLOCK = 1 << 22          # Hamming distances computed per step within a bucket
+WORKERS = min(16, (os.cpu_count() or 1) * 2)
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash(path):
+    # 64-bit dHash as an int, or None if the image can't be decoded
+    data = np.fromfile(str(path), dtype=np.uint8)
+    gray = cv2.imdecode(data, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hash_split(split="train", workers=WORKERS, verbose=True):
+    # -> (record ids, uint64 hashes) for every decodable image; only images
+    # whose sha1 is not in debug/dedup/<split>_dhash.json are decoded
+    index = load_index(split)
+    cache_path = CACHE_DIR / f"{split}_dhash.json"
+    cache = {}
+    if cache_path.exists():
+        with open(cache_path, "r") as f:
+            cache = json.load(f)
+
+    rids = index.image_ids()
+    todo = [rid for rid in rids if index.records[rid]["digest"] not in cache]
+
+    def run(rid):
+        return rid, dhash(index.image_path(rid))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for rid, h in pool.map(run, todo):
+            if h is None:
+                print(f"  could not decode {index.image_path(rid)}")
+                continue
+            cache[index.records[rid]["digest"]] = f"{h:016x}"
+
+    live = {index.records[rid]["digest"] for rid in rids}
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = cache_path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump({d: h for d, h in cache.items() if d in live}, f)
+    os.replace(tmp, cache_path)
+    if verbose:
+        print(f"[{split}] dHash: {len(rids)} images, {len(todo)} decoded ({len(rids) - len(todo)} cached)")
+
+    rids = [rid for rid in rids if index.records[rid]["digest"] in cache]
+    hashes = np.array([int(cache[index.records[rid]["digest"]], 16) for rid in rids], dtype=np.uint64)
+    return index, np.array(rids, dtype=np.int64), hashes
+
+
+def hamming(a, b):
+    # popcount of a ^ b for uint64 arrays (broadcasting)
+    x = np.bitwise_xor(a, b)
+    return _POPCOUNT[x.view(np.uint8).reshape(x.shape + (8,))].sum(axis=-1, dtype=np.int64)
+
+
+def band_masks(threshold, bits=64):
+    # threshold + 1 contiguous bit bands covering the low `bits` bits
+    edges = np.linspace(0, bits, threshold + 2).astype(int)
+    return [(int(lo), (1 << int(hi - lo)) - 1) for lo, hi in zip(edges[:-1], edges[1:])]
+
+
+def buckets(keys):
+    # -> index arrays of the groups of 2 or more equal keys
+    order = np.argsort(keys, kind="stable")
+    starts = np.flatnonzero(np.r_[True, keys[order][1:] != keys[order][:-1]])
+    return [order[lo:hi] for lo, hi in zip(starts, np.r_[starts[1:], len(order)]) if hi - lo > 1]
+
+
+def without_band(hashes, shift, mask):
+    # the bits outside band (shift, mask), packed into the low 64 - width bits
+    width = mask.bit_length()
+    low = hashes & np.uint64((1 << shift) - 1)
+    if shift + width >= 64:
+        return low
+    return ((hashes >> np.uint64(shift + width)) << np.uint64(shift)) | low
+
+
+def bucket_pairs(hashes, members, threshold, found):
+    # append i * n + j (i < j) for every pair of members within `threshold`
+    # bits; rows go in blocks so a distance block never exceeds BLOCK entries
+    n, m = len(hashes), len(members)
+    h = hashes[members]
+    rows = max(1, BLOCK // m)
+    for lo in range(0, m - 1, rows):
+        hi = min(lo + rows, m - 1)
+        # rows lo..hi-1 against columns lo+1..m-1, upper triangle only
+        r, c = np.nonzero(hamming(h[lo:hi, None], h[None, lo + 1:]) <= threshold)
+        r, c = r + lo, c + lo + 1
+        keep = c > r
+        a, b = members[r[keep]], members[c[keep]]
+        found.append(np.minimum(a, b) * n + np.maximum(a, b))
+
+
+def near_duplicate_pairs(hashes, threshold=THRESHOLD, max_bucket=MAX_BUCKET):
+    # -> (i, j) index arrays, i < j, of every pair within `threshold` bits
+    n = len(hashes)
+    found = []
+    for shift, mask in band_masks(threshold):
+        keys = (hashes >> np.uint64(shift)) & np.uint64(mask)
+        for members in buckets(keys):
+            subs = [members]
+            if len(members) > max_bucket:
+                # a near-duplicate pair in this bucket also agrees on one of
+                # threshold + 1 sub-bands of the remaining bits; split on
+                # those unless the bucket is one near-identical scene anyway
+                rest = without_band(hashes[members], shift, mask)
+                split = [members[s] for sub_shift, sub_mask in band_masks(threshold, 64 - mask.bit_length())
+                         for s in buckets((rest >> np.uint64(sub_shift)) & np.uint64(sub_mask))]
+                if sum(len(s) ** 2 for s in split) < len(members) ** 2:
+                    subs = split
+            for s in subs:
+                bucket_pairs(hashes, s, threshold, found)
+    if not found:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # the same pair can turn up in several bands / sub-bands
+    key = np.unique(np.concatenate(found))
+    return key // n, key % n
+
+
+def clusters(n, i, j, priority=None):
+    # leader clustering over the pairs -> cluster label per item (0..k-1);
+    # items are visited by decreasing priority (then position), and every
+    # member is a direct neighbour of its cluster's leader
+    src, dst = np.r_[i, j], np.r_[j, i]
+    order = np.argsort(src, kind="stable")
+    src, dst = src[order], dst[order]
+    starts = np.searchsorted(src, np.arange(n + 1))
+    visit = np.arange(n) if priority is None else np.argsort(-np.asarray(priority), kind="stable")
+    labels = np.full(n, -1, dtype=np.int64)
+    k = 0
+    for a in visit.tolist():
+        if labels[a] >= 0:
+            continue
+        nb = dst[starts[a]:starts[a + 1]]
+        labels[nb[labels[nb] < 0]] = k
+        labels[a] = k
+        k += 1
+    return labels
+
+
+def select(index, rids, labels, keep=KEEP_PER_CLUSTER):
+    # -> bool mask over rids: `keep` images per cluster, most boxes first
+    boxes = index.boxes_per_record()[rids]
+    order = np.lexsort((np.arange(len(rids)), -boxes, labels))
+    sorted_labels = labels[order]
+    first = np.r_[0, np.flatnonzero(sorted_labels[1:] != sorted_labels[:-1]) + 1]
+    rank = np.arange(len(order)) - np.repeat(first, np.diff(np.r_[first, len(order)]))
+    mask = np.zeros(len(rids), dtype=bool)
+    mask[order[rank < keep]] = True
+    return mask
+
+
+def dedup_stems(split="train", threshold=THRESHOLD, keep=KEEP_PER_CLUSTER, verbose=True):
+    # -> (stems to keep, stats dict)
+    index, rids, hashes = hash_split(split, verbose=verbose)
+    i, j = near_duplicate_pairs(hashes, threshold)
+    labels = clusters(len(rids), i, j, priority=index.boxes_per_record()[rids])
+    mask = select(index, rids, labels, keep)
+    sizes = np.bincount(labels)
+
+    has_image = np.zeros(len(index.records), dtype=bool)
+    has_image[rids[mask]] = True
+    cls = index.boxes["cls"]
+    kept_cls = np.bincount(cls[has_image[index.boxes["image_id"]]], minlength=int(cls.max()) + 1 if len(cls) else 0)
+    stats = {
+        "threshold": threshold,
+        "keep_per_cluster": keep,
+        "images": int(len(rids)),
+        "kept": int(mask.sum()),
+        "pairs": int(len(i)),
+        "clusters": int(len(sizes)),
+        "largest_cluster": int(sizes.max()) if len(sizes) else 0,
+        "boxes_per_class": np.bincount(cls, minlength=len(kept_cls)).tolist(),
+        "kept_boxes_per_class": kept_cls.tolist(),
+    }
+    return {index.records[rid]["stem"] for rid in rids[mask]}, stats
+
+
+def write_train_list(stems, images_dir, out_path):
+    # every image under images_dir whose source stem is kept; tiles from
+    # build_tile_dataset.py are named <stem>__x.._y.. and follow their frame
+    images = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png", ".bmp"))
+    kept = [p for p in images if p.stem.split("__")[0] in stems]
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, "w") as f:
+        f.write("".join(f"{p.resolve()}\n" for p in kept))
+    return len(kept), len(images)
+
+
+def check(stats, min_kept=MIN_KEPT, max_cluster=MAX_CLUSTER):
+    # refuse a list that drops most of the split; warn on suspicious clusters / classes
+    kept = stats["kept"] / max(stats["images"], 1)
+    if kept < min_kept:
+        raise ValueError(f"dedup at threshold {stats['threshold']} keeps only {kept:.0%} of the train frames "
+                         f"(< {min_kept:.0%}); lower the threshold or raise KEEP_PER_CLUSTER")
+    if stats["largest_cluster"] > max_cluster:
+        print(f"[WARN] dedup: largest cluster has {stats['largest_cluster']} frames (> {max_cluster}); "
+              "check that they really are the same scene")
+    for c, (k, n) in enumerate(zip(stats["kept_boxes_per_class"], stats["boxes_per_class"])):
+        if n and k / n < min_kept:
+            print(f"[WARN] dedup: class {c} keeps only {k}/{n} boxes ({k / n:.0%})")
+
+
+def dedup_yaml(src_yaml, images_dir, threshold=THRESHOLD, keep=KEEP_PER_CLUSTER, out_root=OUT_ROOT):
+    # data yaml training on the deduplicated list of images_dir (full frames or
+    # tiles), validating on the untouched valid/images next to it
+    stems, stats = dedup_stems("train", threshold, keep)
+    check(stats)
+    tag = f"{Path(images_dir).parents[1].name}_t{threshold}_k{keep}"
+    list_path = out_root / f"train_{tag}.txt"
+    n_kept, n_all = write_train_list(stems, images_dir, list_path)
+
+    with open(src_yaml, "r") as f:
+        src = yaml.safe_load(f)
+    data = {"train": str(list_path), "val": str(Path(images_dir).parents[1] / "valid" / "images"),
+            "nc": src["nc"], "names": src["names"], "dedup": stats}
+    path = out_root / f"data_{tag}.yaml"
+    with open(path, "w") as f:
+        yaml.safe_dump(data, f, sort_keys=False)
+    print(f"[dedup] {stats['kept']}/{stats['images']} frames kept ({stats['clusters']} clusters, "
+          f"largest {stats['largest_cluster']}); {n_kept}/{n_all} training images in {list_path}")
+    return path
+
+
+def read_results(run_dir):
+    # Ultralytics results.csv -> (epochs, seconds per epoch or None, best mAP50, best mAP50-95)
+    with open(Path(run_dir) / "results.csv", "r", newline="") as f:
+        rows = [{k.strip(): v.strip() for k, v in r.items()} for r in csv.DictReader(f)]
+    if not rows:
+        return 0, None, None, None
+    map50 = np.array([float(r["metrics/mAP50(B)"]) for r in rows])
+    map50_95 = np.array([float(r["metrics/mAP50-95(B)"]) for r in rows])
+    # "time" (cumulative seconds) is only written by newer Ultralytics versions
+    sec = float(rows[-1]["time"]) / len(rows) if rows[-1].get("time") else None
+    return len(rows), sec, float(map50.max()), float(map50_95.max())
+
+
+def report(run_dirs):
+    base = None
+    print("| Run | Epochs | s/epoch | vs first | best mAP50 | best mAP50-95 |")
+    print("|---|---:|---:|---:|---:|---:|")
+    for run in run_dirs:
+        epochs, sec, m50, m5095 = read_results(run)
+        if base is None:
+            base = sec
+        rel = f"{sec / base:.2f}x" if sec and base else "-"
+        sec_txt = "-" if sec is None else f"{sec:.1f}"
+        m50_txt = "-" if m50 is None else f"{m50:.3f}"
+        m5095_txt = "-" if m5095 is None else f"{m5095:.3f}"
+        print(f"| {Path(run).name} | {epochs} | {sec_txt} | {rel} | {m50_txt} | {m5095_txt} |")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate train frames and write a deduplicated train list.")
+    parser.add_argument("--threshold", type=int, nargs="+", default=[THRESHOLD],
+                        help="max dHash Hamming distance; several values print a comparison")
+    parser.add_argument("--keep", type=int, default=KEEP_PER_CLUSTER, help="images kept per cluster")
+    parser.add_argument("--images", type=Path, default=DATA_ROOT / "train" / "images",
+                        help="train images to list (full frames or build_tile_dataset.py tiles)")
+    parser.add_argument("--write", action="store_true", help="write the train list + data yaml for the first threshold")
+    parser.add_argument("--report", type=Path, nargs="+", default=None,
+                        help="experiment run dirs: seconds per epoch against val mAP (first run is the baseline)")
+    args = parser.parse_args()
+
+    if args.report:
+        report(args.report)
+        return
+
+    print("| Threshold | Kept frames | Clusters | Largest | Pairs | Boxes kept per class |")
+    print("|---:|---:|---:|---:|---:|---|")
+    for t in args.threshold:
+        _, s = dedup_stems("train", t, args.keep, verbose=t == args.threshold[0])
+        per_class = ", ".join(f"{c}: {k}/{n}" for c, (k, n) in enumerate(zip(s["kept_boxes_per_class"],
+                                                                              s["boxes_per_class"])) if n)
+        print(f"| {t} | {s['kept']}/{s['images']} ({s['kept'] / max(s['images'], 1):.0%}) | {s['clusters']} | "
+              f"{s['largest_cluster']} | {s['pairs']} | {per_class} |")
+
+    if args.write:
+        path = dedup_yaml(DATA_ROOT / "data.yaml", args.images, args.threshold[0], args.keep)
+        print("Wrote", path)
+
+
+if __name__ == "__main__":
+    main()
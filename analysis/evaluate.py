@@ -0,0 +1,183 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+from box_ops import iou_matrix, to_box_array
+
+# Streaming COCO-style evaluator for single-shot vs SAHI predictions.
+# Each image is matched against its ground truth as soon as it is predicted
+# and only fixed-size counters are kept: TP/FP histograms over confidence bins
+# per (class, IoU threshold), GT counts per class, and GT/hit counts per box
+# area bucket. Memory is the same for 10 images or 10k, and evaluators from
+# different worker processes merge by adding their counters.
+
+IOU_THRESHOLDS = np.round(np.linspace(0.5, 0.95, 10), 2)
+CONF_BINS = 1000
+NUM_CLASSES = 5
+
+# (name, min area, max area) in pixels^2; "tiny" is split off COCO's "small"
+# because that is where most Bosch lights live
+AREA_BUCKETS = [
+    ("tiny", 0, 16 ** 2),
+    ("small", 16 ** 2, 32 ** 2),
+    ("medium", 32 ** 2, 96 ** 2),
+    ("large", 96 ** 2, float("inf")),
+]
+
+
+def gt_boxes_from_index(index, rid, width, height):
+    # dataset_index rows (normalized xywh) -> (x1, y1, x2, y2, cls, 1.0) in pixels
+    rows = index.boxes_for(rid)
+    out = np.zeros(len(rows), dtype=to_box_array([]).dtype)
+    if len(rows) == 0:
+        return out
+    cx = rows["x"].astype(np.float64) * width
+    cy = rows["y"].astype(np.float64) * height
+    bw = rows["w"].astype(np.float64) * width
+    bh = rows["h"].astype(np.float64) * height
+    out["x1"], out["y1"] = cx - bw / 2, cy - bh / 2
+    out["x2"], out["y2"] = cx + bw / 2, cy + bh / 2
+    out["cls"] = rows["cls"]
+    out["conf"] = 1.0
+    return out
+
+
+class GroundTruth:
+    # stem -> pixel GT boxes for one split, backed by the dataset index
+    def __init__(self, index):
+        self.index = index
+        self.rid_by_stem = {r["stem"]: i for i, r in enumerate(index.records)}
+
+    def boxes(self, img_path, width, height):
+        rid = self.rid_by_stem.get(Path(img_path).stem)
+        if rid is None:
+            return None
+        return gt_boxes_from_index(self.index, rid, width, height)
+
+
+class StreamingEvaluator:
+    def __init__(self, nc=NUM_CLASSES, iou_thresholds=IOU_THRESHOLDS, conf_bins=CONF_BINS):
+        self.nc = nc
+        self.iou_thresholds = np.asarray(iou_thresholds, dtype=np.float64)
+        self.conf_bins = conf_bins
+        shape = (nc, len(self.iou_thresholds), conf_bins)
+        self.tp = np.zeros(shape, dtype=np.int64)
+        self.fp = np.zeros(shape, dtype=np.int64)
+        self.n_gt = np.zeros(nc, dtype=np.int64)
+        self.area_gt = np.zeros(len(AREA_BUCKETS), dtype=np.int64)
+        self.area_hit = np.zeros(len(AREA_BUCKETS), dtype=np.int64)
+        self.images = 0
+
+    def add(self, preds, gts):
+        # preds / gts: box tuples or box_ops arrays in pixels.
+        # Returns (num GT, num GT matched at IoU 0.5) for this image.
+        preds = to_box_array(preds)
+        gts = to_box_array(gts)
+        self.images += 1
+
+        p_cls = preds["cls"].astype(np.int64)
+        g_cls = gts["cls"].astype(np.int64)
+        keep = (p_cls >= 0) & (p_cls < self.nc)
+        preds, p_cls = preds[keep], p_cls[keep]
+        np.add.at(self.n_gt, g_cls[(g_cls >= 0) & (g_cls < self.nc)], 1)
+
+        g_area = (gts["x2"] - gts["x1"]) * (gts["y2"] - gts["y1"])
+        g_bucket = np.searchsorted([b[1] for b in AREA_BUCKETS[1:]], g_area, side="right")
+        np.add.at(self.area_gt, g_bucket, 1)
+
+        n_t = len(self.iou_thresholds)
+        is_tp = np.zeros((n_t, len(preds)), dtype=bool)
+        gt_hit = np.zeros((n_t, len(gts)), dtype=bool)
+
+        if len(preds) and len(gts):
+            iou = iou_matrix(preds, gts)
+            iou = np.where(p_cls[:, None] == g_cls[None, :], iou, -1.0)
+            order = np.argsort(-preds["conf"], kind="stable")
+            # a prediction below the lowest threshold with every GT is an FP
+            # everywhere; only the rest need matching
+            order = order[iou[order].max(axis=1) >= self.iou_thresholds.min()]
+            # COCO matching: by descending score, each prediction takes the
+            # best-overlapping GT that is still free at that threshold; all
+            # thresholds at once, one row of gt_hit per threshold
+            t_idx = np.arange(n_t)
+            for i in order:
+                row = np.where(gt_hit, -1.0, iou[i])
+                j = row.argmax(axis=1)
+                hit = row[t_idx, j] >= self.iou_thresholds
+                gt_hit[t_idx[hit], j[hit]] = True
+                is_tp[hit, i] = True
+
+        bins = np.clip((preds["conf"] * self.conf_bins).astype(np.int64), 0, self.conf_bins - 1)
+        for ti in range(n_t):
+            np.add.at(self.tp[:, ti], (p_cls[is_tp[ti]], bins[is_tp[ti]]), 1)
+            np.add.at(self.fp[:, ti], (p_cls[~is_tp[ti]], bins[~is_tp[ti]]), 1)
+
+        np.add.at(self.area_hit, g_bucket[gt_hit[0]], 1)
+        return len(gts), int(gt_hit[0].sum())
+
+    def merge(self, other):
+        self.tp += other.tp
+        self.fp += other.fp
+        self.n_gt += other.n_gt
+        self.area_gt += other.area_gt
+        self.area_hit += other.area_hit
+        self.images += other.images
+        return self
+
+    def _ap(self, c, ti):
+        n = self.n_gt[c]
+        if n == 0:
+            return np.nan
+        # walk the confidence bins from high to low
+        tp = np.cumsum(self.tp[c, ti, ::-1])
+        fp = np.cumsum(self.fp[c, ti, ::-1])
+        if tp[-1] == 0:
+            return 0.0
+        recall = tp / n
+        precision = tp / np.maximum(tp + fp, 1)
+        # COCO 101-point interpolated AP on the precision envelope
+        envelope = np.maximum.accumulate(precision[::-1])[::-1]
+        points = np.linspace(0, 1, 101)
+        idx = np.searchsorted(recall, points, side="left")
+        prec_at = np.append(envelope, 0.0)[idx]
+        return float(prec_at.mean())
+
+    def summary(self):
+        ap = np.array([[self._ap(c, ti) for ti in range(len(self.iou_thresholds))]
+                       for c in range(self.nc)])
+        has_gt = self.n_gt > 0
+        out = {
+            "images": int(self.images),
+            "num_gt": int(self.n_gt.sum()),
+            "map50": float(np.nanmean(ap[has_gt, 0])) if has_gt.any() else 0.0,
+            "map50_95": float(np.nanmean(ap[has_gt])) if has_gt.any() else 0.0,
+        }
+        out["recall50"] = float(self.area_hit.sum() / self.area_gt.sum()) if self.area_gt.sum() else None
+        for c in range(self.nc):
+            out[f"ap50_cls{c}"] = None if np.isnan(ap[c, 0]) else float(ap[c, 0])
+        for k, (name, _, _) in enumerate(AREA_BUCKETS):
+            out[f"recall50_{name}"] = (float(self.area_hit[k] / self.area_gt[k])
+                                       if self.area_gt[k] else None)
+            out[f"num_gt_{name}"] = int(self.area_gt[k])
+        return out
+
+
+def metric_columns(nc=NUM_CLASSES):
+    cols = ["map50", "map50_95", "recall50"] + [f"ap50_cls{c}" for c in range(nc)]
+    cols += [f"recall50_{name}" for name, _, _ in AREA_BUCKETS]
+    return cols
+
+
+def write_metrics(path, metrics_by_method):
+    with open(path, "w") as f:
+        json.dump(metrics_by_method, f, indent=2)
+
+
+def format_metrics_table(metrics_by_method):
+    cols = metric_columns()
+    lines = ["| Method | " + " | ".join(cols) + " |", "|---|" + "---:|" * len(cols)]
+    for method, m in metrics_by_method.items():
+        vals = ["-" if m.get(c) is None else f"{m[c]:.3f}" for c in cols]
+        lines.append(f"| {method} | " + " | ".join(vals) + " |")
+    return "\n".join(lines)
@@ -0,0 +1,188 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Lightweight per-image instrumentation for the compare scripts.
+# A StageTimes collects milliseconds per stage for one image (or one image x
+# config). While it is active on a thread (times.activate()), every
+# `with stage("name"):` on that thread adds its elapsed time under a nested key
+# such as "sahi/forward"; with no active StageTimes, stage() costs one
+# attribute lookup. The predictors mark slice / forward / merge themselves, so
+# callers only wrap the top-level steps. columns() turns the result into
+# ms_<stage> (and mem_<what>) CSV columns.
+# Optional extras: MemorySampler (tracemalloc peak and RSS per image) and
+# torch_profile(), which runs torch.profiler and labels each stage in the
+# trace with record_function. LoaderWait does the same job for training,
+# timing dataloader waits per epoch through Ultralytics callbacks.
+
+_local = threading.local()
+_profiling = False
+
+
+class StageTimes:
+    __slots__ = ("ms", "mem")
+
+    def __init__(self):
+        self.ms = {}
+        self.mem = {}
+
+    def add(self, name, ms):
+        self.ms[name] = self.ms.get(name, 0.0) + ms
+
+    @contextmanager
+    def activate(self):
+        prev = (getattr(_local, "times", None), getattr(_local, "stack", None))
+        _local.times, _local.stack = self, []
+        try:
+            yield self
+        finally:
+            _local.times, _local.stack = prev
+
+    def columns(self):
+        out = {f"ms_{k.replace('/', '_')}": round(v, 2) for k, v in self.ms.items()}
+        out.update({f"mem_{k}": round(v, 1) for k, v in self.mem.items()})
+        return out
+
+
+@contextmanager
+def stage(name):
+    times = getattr(_local, "times", None)
+    if times is None:
+        yield
+        return
+
+    stack = _local.stack
+    stack.append(name)
+    key = "/".join(stack)
+    label = None
+    if _profiling:
+        import torch
+        label = torch.profiler.record_function(key)
+        label.__enter__()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        times.add(key, (time.perf_counter() - t0) * 1e3)
+        if label is not None:
+            label.__exit__(None, None, None)
+        stack.pop()
+
+
+def ordered_columns(column_dicts):
+    # union of keys in first-seen order, ms_ columns before mem_ columns
+    seen = {}
+    for cols in column_dicts:
+        for k in cols:
+            seen.setdefault(k, len(seen))
+    return sorted(seen, key=lambda k: (k.startswith("mem_"), seen[k]))
+
+
+def rss_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    if sys.platform.startswith("linux"):
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    return None
+
+
+class MemorySampler:
+    # Per-image memory columns. With trace_python, tracemalloc tracks the peak
+    # of Python-side allocations between begin() and end(); it is process-wide,
+    # so with overlapping threads the peak is attributed to whichever image
+    # was being inferred. RSS is sampled at end().
+    def __init__(self, trace_python=False):
+        self.trace_python = trace_python
+        if trace_python and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def begin(self):
+        if self.trace_python:
+            tracemalloc.reset_peak()
+
+    def end(self, times):
+        if self.trace_python:
+            times.mem["py_peak_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        rss = rss_mb()
+        if rss is not None:
+            times.mem["rss_mb"] = rss
+
+
+@contextmanager
+def torch_profile(enabled, trace_path=None, row_limit=15):
+    # wraps a whole run; stage() labels show up as record_function ranges
+    global _profiling
+    if not enabled:
+        yield None
+        return
+
+    from torch.profiler import ProfilerActivity, profile
+
+    with profile(activities=[ProfilerActivity.CPU]) as prof:
+        _profiling = True
+        try:
+            yield prof
+        finally:
+            _profiling = False
+    if trace_path is not None:
+        prof.export_chrome_trace(str(trace_path))
+    if row_limit:
+        print(prof.key_averages().table(sort_by="cpu_time_total", row_limit=row_limit))
+
+
+class LoaderWait:
+    # Training-side counterpart: Ultralytics trainer callbacks that time how
+    # long the train loop waits for each batch (epoch start or the previous
+    # batch's end -> next batch start). One row per epoch goes to
+    # <save_dir>/dataloader_wait.csv; attach with LoaderWait().attach(model).
+    def __init__(self):
+        self.rows = []
+        self._mark = self._epoch_t0 = None
+        self._wait = 0.0
+        self._batches = 0
+
+    def attach(self, model):
+        model.add_callback("on_train_epoch_start", self.epoch_start)
+        model.add_callback("on_train_batch_start", self.batch_start)
+        model.add_callback("on_train_batch_end", self.batch_end)
+        model.add_callback("on_train_epoch_end", self.epoch_end)
+        model.add_callback("on_train_end", self.train_end)
+        return self
+
+    def epoch_start(self, trainer):
+        self._mark = self._epoch_t0 = time.perf_counter()
+        self._wait = 0.0
+        self._batches = 0
+
+    def batch_start(self, trainer):
+        self._wait += time.perf_counter() - self._mark
+        self._batches += 1
+
+    def batch_end(self, trainer):
+        self._mark = time.perf_counter()
+
+    def epoch_end(self, trainer):
+        epoch_s = time.perf_counter() - self._epoch_t0
+        row = {"epoch": trainer.epoch + 1, "batches": self._batches, "wait_s": round(self._wait, 3),
+               "train_s": round(epoch_s, 3), "wait_frac": round(self._wait / max(epoch_s, 1e-9), 4)}
+        self.rows.append(row)
+        path = os.path.join(str(trainer.save_dir), "dataloader_wait.csv")
+        new = not os.path.exists(path)
+        with open(path, "a") as f:
+            if new:
+                f.write(",".join(row) + "\n")
+            f.write(",".join(str(v) for v in row.values()) + "\n")
+
+    def train_end(self, trainer):
+        if self.rows:
+            wait = sum(r["wait_s"] for r in self.rows) / len(self.rows)
+            train = sum(r["train_s"] for r in self.rows) / len(self.rows)
+            print(f"dataloader wait: {wait:.1f}s of {train:.1f}s per epoch ({wait / max(train, 1e-9):.1%}), "
+                  f"{len(self.rows)} epochs -> {os.path.join(str(trainer.save_dir), 'dataloader_wait.csv')}")
@@ -0,0 +1,70 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Shards per-image work across a process pool.
+# Each worker runs `init_fn` once (load the model, open the cache, ...) and
+# pins torch to `threads` intra-op threads so N workers don't each spin up a
+# full-machine thread pool. Results come back in input order, so CSVs written
+# from them are identical to a serial run.
+
+
+def default_workers():
+    return max(1, (os.cpu_count() or 1) // 2)
+
+
+def threads_per_worker(num_workers):
+    return max(1, (os.cpu_count() or 1) // max(1, num_workers))
+
+
+def pin_threads(threads):
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # only settable before the first parallel op in this process
+        pass
+
+    try:
+        import cv2
+        cv2.setNumThreads(1)
+    except ImportError:
+        pass
+
+
+def _init_worker(threads, init_fn, init_args):
+    pin_threads(threads)
+    if init_fn is not None:
+        init_fn(*init_args)
+
+
+def iter_sharded(fn, items, num_workers=None, threads=None, init_fn=None, init_args=()):
+    # like run_sharded, but yields each result (in input order) as soon as it
+    # is ready, so the caller can write it out while later shards still run
+    items = list(items)
+    if num_workers is None:
+        num_workers = default_workers()
+    num_workers = max(1, min(num_workers, len(items)))
+    if threads is None:
+        threads = threads_per_worker(num_workers)
+
+    if num_workers == 1:
+        _init_worker(threads, init_fn, init_args)
+        for item in items:
+            yield fn(item)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_worker,
+        initargs=(threads, init_fn, init_args),
+    ) as pool:
+        yield from pool.map(fn, items)
+
+
+def run_sharded(fn, items, num_workers=None, threads=None, init_fn=None, init_args=()):
+    # fn / init_fn must be module-level functions so they pickle on Windows (spawn)
+    return list(iter_sharded(fn, items, num_workers, threads, init_fn, init_args))
@@ -0,0 +1,168 @@
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Overlapped decode -> inference -> render/write pipeline.
+# Prefetch threads decode upcoming frames into a bounded queue, the calling
+# thread runs inference, and a small writer pool draws and encodes the output
+# images off the critical path. cv2.imread / imwrite release the GIL, so the
+# threads really do overlap with the forward passes.
+
+PREFETCH_THREADS = 2
+WRITER_THREADS = 2
+MAX_QUEUE = 8
+
+_DONE = object()
+
+
+class PipelineStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.busy = defaultdict(float)
+        self.count = defaultdict(int)
+        self.depth_sum = defaultdict(int)
+        self.depth_max = defaultdict(int)
+        self.depth_n = defaultdict(int)
+        self.wall = 0.0
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.busy[stage] += seconds
+            self.count[stage] += 1
+
+    def sample(self, name, depth):
+        with self.lock:
+            self.depth_sum[name] += depth
+            self.depth_n[name] += 1
+            self.depth_max[name] = max(self.depth_max[name], depth)
+
+    def as_dict(self):
+        return {
+            "wall": self.wall,
+            "busy": dict(self.busy),
+            "count": dict(self.count),
+            "depth_sum": dict(self.depth_sum),
+            "depth_max": dict(self.depth_max),
+            "depth_n": dict(self.depth_n),
+        }
+
+    def merge(self, other):
+        # other: a PipelineStats or its as_dict(), e.g. from a worker process
+        if isinstance(other, PipelineStats):
+            other = other.as_dict()
+        self.wall = max(self.wall, other["wall"])
+        for k, v in other["busy"].items():
+            self.busy[k] += v
+        for k, v in other["count"].items():
+            self.count[k] += v
+        for k, v in other["depth_sum"].items():
+            self.depth_sum[k] += v
+        for k, v in other["depth_n"].items():
+            self.depth_n[k] += v
+        for k, v in other["depth_max"].items():
+            self.depth_max[k] = max(self.depth_max[k], v)
+
+    def report(self):
+        lines = [f"pipeline wall time: {self.wall:.1f}s"]
+        for stage in ("decode", "infer", "render"):
+            n = self.count.get(stage, 0)
+            if not n:
+                continue
+            busy = self.busy[stage]
+            rate = n / self.wall if self.wall > 0 else 0.0
+            lines.append(f"  {stage:<7} {n:5d} items  busy {busy:7.1f}s  "
+                         f"{busy / n * 1e3:7.1f} ms/item  {rate:6.2f} items/sec")
+        for name in ("decoded", "render"):
+            n = self.depth_n.get(name, 0)
+            if not n:
+                continue
+            lines.append(f"  queue {name:<8} mean depth {self.depth_sum[name] / n:.1f}  "
+                         f"max {self.depth_max[name]}")
+        return "\n".join(lines)
+
+
+def run_pipeline(items, decode, infer, render=None, prefetch_threads=PREFETCH_THREADS,
+                 writer_threads=WRITER_THREADS, max_queue=MAX_QUEUE):
+    # decode(item) -> frame or None (skipped)
+    # infer(item, frame) -> result, kept in item order
+    # render(item, frame, result) -> None, runs on the writer pool
+    items = list(items)
+    stats = PipelineStats()
+    results = [None] * len(items)
+    errors = []
+
+    todo = queue.Queue()
+    for i, item in enumerate(items):
+        todo.put((i, item))
+    decoded = queue.Queue(maxsize=max_queue)
+
+    def prefetch():
+        try:
+            while not errors:
+                try:
+                    i, item = todo.get_nowait()
+                except queue.Empty:
+                    break
+                t0 = time.perf_counter()
+                frame = decode(item)
+                stats.add("decode", time.perf_counter() - t0)
+                decoded.put((i, item, frame))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            decoded.put(_DONE)
+
+    pending_lock = threading.Lock()
+    pending = [0]
+    slots = threading.BoundedSemaphore(max_queue)
+
+    def write_job(item, frame, result):
+        try:
+            t0 = time.perf_counter()
+            render(item, frame, result)
+            stats.add("render", time.perf_counter() - t0)
+        finally:
+            with pending_lock:
+                pending[0] -= 1
+            slots.release()
+
+    t_start = time.perf_counter()
+    prefetchers = [threading.Thread(target=prefetch, daemon=True) for _ in range(max(1, prefetch_threads))]
+    for t in prefetchers:
+        t.start()
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=max(1, writer_threads)) as writers:
+        finished = 0
+        while finished < len(prefetchers):
+            stats.sample("decoded", decoded.qsize())
+            got = decoded.get()
+            if got is _DONE:
+                finished += 1
+                continue
+
+            i, item, frame = got
+            if frame is None or errors:
+                continue
+
+            t0 = time.perf_counter()
+            result = infer(item, frame)
+            stats.add("infer", time.perf_counter() - t0)
+            results[i] = result
+
+            if render is not None:
+                slots.acquire()
+                with pending_lock:
+                    pending[0] += 1
+                    stats.sample("render", pending[0])
+                futures.append(writers.submit(write_job, item, frame, result))
+
+        for fut in futures:
+            fut.result()
+
+    stats.wall = time.perf_counter() - t_start
+    if errors:
+        raise errors[0]
+    return results, stats
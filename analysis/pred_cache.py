@@ -0,0 +1,219 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from box_ops import BOX_DTYPE, to_box_array, to_box_list
+
+# On-disk cache of per-image predictions.
+# Entries are keyed by (weights digest, image digest, mode, params) and stored
+# as small .npy files under CACHE_DIR/<weights digest>/. Reads bump the file
+# mtime so eviction can drop the least recently used entries once the cache
+# grows past MAX_CACHE_BYTES. Worker processes share the directory, so any
+# entry can vanish under another worker's eviction at any time; a missing
+# file is a miss or zero bytes, never an error.
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = PROJECT_ROOT / "debug" / "pred_cache"
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+_digest_memo = {}
+
+
+def file_digest(path):
+    path = Path(path)
+    st = path.stat()
+    memo_key = (str(path.resolve()), st.st_size, st.st_mtime_ns)
+    if memo_key in _digest_memo:
+        return _digest_memo[memo_key]
+
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    _digest_memo[memo_key] = digest
+    return digest
+
+
+def _stat(path):
+    # os.stat_result, or None if another process removed the file
+    try:
+        return path.stat()
+    except FileNotFoundError:
+        return None
+
+
+def _size(path):
+    st = _stat(path)
+    return 0 if st is None else st.st_size
+
+
+class PredictionCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = sum(_size(p) for p in self._entries())
+
+    def _entries(self):
+        return self.cache_dir.glob("*/*/*.npy")
+
+    def make_key(self, weights_digest, image_digest, mode, params):
+        payload = json.dumps(
+            {"image": image_digest, "mode": mode, "params": params},
+            sort_keys=True,
+        )
+        key = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+        return f"{weights_digest[:16]}/{key[:2]}/{key}"
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.npy"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            arr = np.load(path, allow_pickle=False)
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+        if arr.dtype != BOX_DTYPE:
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return arr
+
+    def put(self, key, boxes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        old_size = _size(path)
+
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, to_box_array(boxes), allow_pickle=False)
+        os.replace(tmp, path)
+
+        self.total_bytes += _size(path) - old_size
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self, target_bytes=None):
+        if target_bytes is None:
+            # leave some headroom so we don't evict again on the next put
+            target_bytes = int(self.max_bytes * 0.9)
+
+        entries = []
+        for p in self._entries():
+            st = _stat(p)
+            if st is not None:
+                entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+
+        total = sum(e[1] for e in entries)
+        removed = 0
+        for _, size, p in entries:
+            if total <= target_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+
+        self.total_bytes = total
+        return removed
+
+    def invalidate(self, weights_digest=None):
+        if weights_digest is None:
+            targets = [p for p in self.cache_dir.iterdir() if p.is_dir()]
+        else:
+            targets = [self.cache_dir / weights_digest[:16]]
+
+        for d in targets:
+            shutil.rmtree(d, ignore_errors=True)
+        self.total_bytes = sum(_size(p) for p in self._entries())
+
+    def stats(self):
+        return {
+            "dir": str(self.cache_dir),
+            "entries": sum(1 for _ in self._entries()),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def sahi_params(conf, slice_h, slice_w, overlap_h, overlap_w=None, postprocess="sahi_default", tiling=None,
+                imgsz=None):
+    # canonical key params so every script hits the same entries for the same setup;
+    # tiling names a tile selection (e.g. TileSelector.name) when not every tile runs,
+    # imgsz the inference size when it is not the model's own
+    if overlap_w is None:
+        overlap_w = overlap_h
+    params = {
+        "conf": conf,
+        "slice_h": int(slice_h),
+        "slice_w": int(slice_w),
+        "overlap_h": float(overlap_h),
+        "overlap_w": float(overlap_w),
+        "postprocess": postprocess,
+    }
+    if tiling is not None:
+        params["tiling"] = tiling
+    if imgsz is not None:
+        params["imgsz"] = int(imgsz)
+    return params
+
+
+def cached_boxes(cache, weights_digest, img_path, mode, params, compute, image_digest=None):
+    # pass image_digest when the file bytes are already in memory (frames.read_frame)
+    if cache is None:
+        return compute()
+
+    if image_digest is None:
+        image_digest = file_digest(img_path)
+    key = cache.make_key(weights_digest, image_digest, mode, params)
+    arr = cache.get(key)
+    if arr is not None:
+        return to_box_list(arr)
+
+    boxes = compute()
+    cache.put(key, boxes)
+    return boxes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the prediction cache.")
+    parser.add_argument("--dir", default=str(CACHE_DIR))
+    parser.add_argument("--clear", action="store_true", help="drop every cached prediction")
+    parser.add_argument("--clear-model", metavar="WEIGHTS", help="drop predictions made with these weights")
+    parser.add_argument("--max-mb", type=float, help="evict least recently used entries down to this size")
+    args = parser.parse_args()
+
+    cache = PredictionCache(args.dir)
+    if args.clear:
+        cache.invalidate()
+    if args.clear_model:
+        cache.invalidate(file_digest(args.clear_model))
+    if args.max_mb is not None:
+        removed = cache.evict(int(args.max_mb * 1024 * 1024))
+        print(f"evicted {removed} entries")
+
+    s = cache.stats()
+    print(f"cache dir: {s['dir']}")
+    print(f"entries:   {s['entries']}")
+    print(f"size:      {s['bytes'] / 1e6:.1f} MB / {s['max_bytes'] / 1e6:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from box_ops import BOX_DTYPE, to_box_array
+
+# Per-run results store (a results/ directory) for the compare scripts:
+# predicted boxes plus per-image metric columns, growing while the run is
+# going. Images are grouped in chunks of up to CHUNK_SIZE, one .npz per chunk:
+#   results/meta.json                          image dir
+#   results/chunkNNNNN.npz  names              image file names
+#                           boxes_<method>     float32 coords, uint8 class, float16 score
+#                           offsets_<method>   image i owns rows offsets[i]:offsets[i+1]
+#                           col_<column>       one float32 per image, NaN where blank
+# Every chunk is written to a temp name and os.replace'd into place, so a
+# reader (or a crash) only ever sees whole chunks: a crash loses at most the
+# open one. ResultsStore reads all chunks back as whole-run arrays, so
+# summaries are numpy reductions over columns (summarize_sahi_runs.py) and
+# overlays are drawn on request (render.py). A 50-image run is a few KB,
+# against hundreds of MB of full-resolution JPEGs.
+
+FILE_NAME = "results"
+META = "meta.json"
+CHUNK_SIZE = 32          # images per chunk
+
+STORE_DTYPE = np.dtype([
+    ("x1", np.float32),
+    ("y1", np.float32),
+    ("x2", np.float32),
+    ("y2", np.float32),
+    ("cls", np.uint8),
+    ("conf", np.float16),
+])
+
+
+def pack(per_image):
+    # list of per-image boxes -> (packed STORE_DTYPE rows, offsets)
+    arrs = [to_box_array(b) for b in per_image]
+    offsets = np.zeros(len(arrs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(a) for a in arrs])
+    flat = np.concatenate(arrs) if arrs else np.zeros(0, dtype=BOX_DTYPE)
+    packed = np.zeros(len(flat), dtype=STORE_DTYPE)
+    for name in STORE_DTYPE.names:
+        packed[name] = flat[name]
+    return packed, offsets
+
+
+def as_column(values):
+    # CSV-style cells (numbers, "" / None when blank) -> float32, NaN for blanks
+    return np.array([np.nan if v is None or v == "" else float(v) for v in values], dtype=np.float32)
+
+
+def _keys(dicts):
+    # union of the keys, in first-seen order
+    return list(dict.fromkeys(k for d in dicts for k in d))
+
+
+class ResultsWriter:
+    # Starts a fresh results/ directory (replacing an earlier run's chunks) and
+    # appends one image at a time; safe to call from the pipeline's writer threads.
+    def __init__(self, path, image_dir=None, chunk_size=CHUNK_SIZE):
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+        self.chunks = 0
+        self.images = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self.path.mkdir(parents=True, exist_ok=True)
+        for old in self.path.glob("chunk*.npz"):
+            old.unlink()
+        meta = {"version": 2, "image_dir": None if image_dir is None else str(image_dir)}
+        tmp = self.path / f"{META}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.path / META)
+
+    def append(self, name, boxes_by_method, columns=None):
+        # boxes_by_method: {method: boxes}; columns: {column: number or ""}
+        with self._lock:
+            self._pending.append((name, boxes_by_method, columns or {}))
+            self.images += 1
+            if len(self._pending) >= self.chunk_size:
+                self._write_chunk()
+
+    def flush(self):
+        with self._lock:
+            self._write_chunk()
+
+    def close(self):
+        self.flush()
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_chunk(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        arrays = {"names": np.asarray([name for name, _, _ in rows], dtype=str)}
+        for method in _keys(boxes for _, boxes, _ in rows):
+            arrays[f"boxes_{method}"], arrays[f"offsets_{method}"] = pack([boxes.get(method, ()) for _, boxes, _ in rows])
+        for col in _keys(cols for _, _, cols in rows):
+            arrays[f"col_{col}"] = as_column([cols.get(col) for _, _, cols in rows])
+
+        out = self.path / f"chunk{self.chunks:05d}.npz"
+        tmp = out.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp, out)
+        self.chunks += 1
+
+
+def save_predictions(path, names, boxes_by_method, image_dir=None):
+    # whole run at once; names: image file names, boxes_by_method: {method: per-image boxes in `names` order}
+    for method, per_image in boxes_by_method.items():
+        if len(per_image) != len(names):
+            raise ValueError(f"{method}: {len(per_image)} images of boxes for {len(names)} names")
+    with ResultsWriter(path, image_dir, chunk_size=max(1, len(names))) as writer:
+        for i, name in enumerate(names):
+            writer.append(name, {m: per_image[i] for m, per_image in boxes_by_method.items()})
+    return writer.path
+
+
+class ResultsStore:
+    def __init__(self, path):
+        # path: the results/ directory or the run directory holding it
+        path = Path(path)
+        if not (path / META).exists():
+            path = path / FILE_NAME
+        self.path = path
+        with open(path / META, "r") as f:
+            meta = json.load(f)
+        chunks = []
+        for chunk_path in sorted(path.glob("chunk*.npz")):
+            with np.load(chunk_path, allow_pickle=False) as z:
+                chunks.append({k: z[k] for k in z.files})
+        sizes = [len(c["names"]) for c in chunks]
+
+        self.image_dir = None if meta["image_dir"] is None else Path(meta["image_dir"])
+        self.names = [str(n) for c in chunks for n in c["names"]]
+        self.methods = [k[len("boxes_"):] for k in _keys(chunks) if k.startswith("boxes_")]
+        self._boxes, self._offsets = {}, {}
+        for m in self.methods:
+            # a chunk without this method counts as no boxes for its images
+            counts = np.concatenate([np.diff(c[f"offsets_{m}"]) if f"offsets_{m}" in c else np.zeros(n, np.int64)
+                                     for c, n in zip(chunks, sizes)])
+            self._boxes[m] = np.concatenate([c.get(f"boxes_{m}", np.zeros(0, STORE_DTYPE)) for c in chunks])
+            self._offsets[m] = np.concatenate([[0], np.cumsum(counts)])
+        # {column: float32 per image}, NaN where an image (or a whole chunk) has no value
+        self.columns = {
+            k[len("col_"):]: np.concatenate([c.get(k, np.full(n, np.nan, np.float32)) for c, n in zip(chunks, sizes)])
+            for k in _keys(chunks) if k.startswith("col_")
+        }
+        self._index = {n: i for i, n in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def boxes(self, method, image):
+        # image: file name or position -> box_ops array (float64 coords, as everywhere else)
+        i = self._index[image] if isinstance(image, str) else int(image)
+        rows = self._boxes[method][self._offsets[method][i]:self._offsets[method][i + 1]]
+        out = np.zeros(len(rows), dtype=BOX_DTYPE)
+        for name in BOX_DTYPE.names:
+            out[name] = rows[name]
+        return out
+
+    def counts(self, method):
+        return np.diff(self._offsets[method])
+
+    def image_path(self, image):
+        name = self.names[image] if not isinstance(image, str) else image
+        return name if self.image_dir is None else self.image_dir / name
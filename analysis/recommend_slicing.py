@@ -0,0 +1,206 @@
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from dataset_index import load_index
+from sliced_predictor import slice_bboxes
+
+# Slice size / overlap recommender from the label statistics.
+# Per class, histograms of box width and height (pixels), aspect ratio (h / w)
+# and centre position are built from the dataset index with one bincount each.
+# A box counts as covered by a tiling if it lies whole inside at least one
+# tile and its shorter side is still >= MIN_SIDE px once the tile is resized
+# to the model input (IMGSZ). With the full-frame pass on (as in
+# SlicedPredictor), boxes big enough at full-frame resolution are covered
+# whatever the tiles do, so overlap only has to look after the small ones.
+# slice_bboxes tiles form a grid of column x row intervals, so "whole inside
+# some tile" is checked per axis. For every candidate tile size the smallest
+# overlap reaching TARGET coverage is found; the one with the fewest tiles per
+# frame is the recommendation for configs/sweep_sahi.yaml.
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+OUT_DIR = PROJECT_ROOT / "debug" / "slice_recommend"
+
+IMGSZ = 640              # model input side a tile (or the full frame) is resized to
+MIN_SIDE = 8             # px at model input; YOLOv8's finest stride
+TARGET = 0.95            # fraction of boxes that must stay covered
+SLICES = [320, 384, 448, 512, 576, 640, 768, 896, 1024]
+OVERLAPS = [round(0.05 * k, 2) for k in range(11)]      # 0.00 .. 0.50
+
+SIZE_BINS = [0, 4, 8, 16, 32, 64, 128, 256, np.inf]     # box side, px
+ASPECT_BINS = [0, 0.5, 1, 1.5, 2, 3, 4, np.inf]         # h / w
+POS_BINS = 10                                           # normalized centre x / y
+
+
+def load_boxes(split):
+    # -> (index rows, xyxy px clipped to the frame, frame (w, h) per box,
+    #     (w, h) of every image); boxes of images without a readable size are dropped
+    idx = load_index(split)
+    wh = np.array([(r["width"] or 0, r["height"] or 0) for r in idx.records], dtype=np.int64).reshape(-1, 2)
+    box_wh = wh[idx.boxes["image_id"]]
+    keep = (box_wh > 0).all(axis=1)
+    box_wh = box_wh[keep]
+    xyxy = np.clip(idx.boxes_pixels()[keep].astype(np.float64), 0, np.tile(box_wh, (1, 2)))
+    frame_wh = wh[idx.image_ids()]
+    return idx.boxes[keep], xyxy, box_wh, frame_wh[(frame_wh > 0).all(axis=1)]
+
+
+def bin_labels(bins):
+    return [f"{lo:g}+" if np.isinf(hi) else f"{lo:g}-{hi:g}" for lo, hi in zip(bins[:-1], bins[1:])]
+
+
+def class_hist(cls, values, bins, num_classes):
+    # (num_classes, len(bins) - 1) counts, one bincount for every class at once
+    nb = len(bins) - 1
+    b = np.clip(np.digitize(values, bins) - 1, 0, nb - 1)
+    return np.bincount(cls.astype(np.int64) * nb + b, minlength=num_classes * nb).reshape(num_classes, nb)
+
+
+def histograms(boxes, xyxy, num_classes):
+    cls = boxes["cls"]
+    bw = xyxy[:, 2] - xyxy[:, 0]
+    bh = xyxy[:, 3] - xyxy[:, 1]
+    pos_bins = np.linspace(0.0, 1.0, POS_BINS + 1)
+    return {
+        "width": (SIZE_BINS, class_hist(cls, bw, SIZE_BINS, num_classes)),
+        "height": (SIZE_BINS, class_hist(cls, bh, SIZE_BINS, num_classes)),
+        "aspect": (ASPECT_BINS, class_hist(cls, bh / np.maximum(bw, 1e-6), ASPECT_BINS, num_classes)),
+        "x": (pos_bins, class_hist(cls, boxes["x"], pos_bins, num_classes)),
+        "y": (pos_bins, class_hist(cls, boxes["y"], pos_bins, num_classes)),
+    }
+
+
+def axis_whole(lo, hi, intervals):
+    # [lo, hi] inside at least one (start, end) interval, per box
+    return ((lo[:, None] >= intervals[None, :, 0]) & (hi[:, None] <= intervals[None, :, 1])).any(axis=1)
+
+
+def coverage(xyxy, box_wh, slice_size, overlap, imgsz=IMGSZ, min_side=MIN_SIDE, full_frame=True):
+    # -> (whole inside some tile, covered) bool per box
+    short = np.minimum(xyxy[:, 2] - xyxy[:, 0], xyxy[:, 3] - xyxy[:, 1])
+    whole = np.zeros(len(xyxy), dtype=bool)
+    covered = np.zeros(len(xyxy), dtype=bool)
+    for w, h in np.unique(box_wh, axis=0):
+        sel = (box_wh[:, 0] == w) & (box_wh[:, 1] == h)
+        tiles = np.array(slice_bboxes(int(h), int(w), slice_size, slice_size, overlap, overlap), dtype=np.float64)
+        cols = np.unique(tiles[:, [0, 2]], axis=0)
+        rows = np.unique(tiles[:, [1, 3]], axis=0)
+        b = xyxy[sel]
+        whole[sel] = axis_whole(b[:, 0], b[:, 2], cols) & axis_whole(b[:, 1], b[:, 3], rows)
+        covered[sel] = whole[sel] & (short[sel] * imgsz / slice_size >= min_side)
+        if full_frame:
+            covered[sel] |= short[sel] * imgsz / max(w, h) >= min_side
+    return whole, covered
+
+
+def tiles_per_frame(frame_wh, slice_size, overlap):
+    sizes, counts = np.unique(frame_wh, axis=0, return_counts=True)
+    n = [len(slice_bboxes(int(h), int(w), slice_size, slice_size, overlap, overlap)) for w, h in sizes]
+    return float(np.dot(n, counts) / max(counts.sum(), 1))
+
+
+def sweep(xyxy, box_wh, frame_wh, slices=SLICES, overlaps=OVERLAPS, target=TARGET, **kwargs):
+    # per tile size: the smallest overlap reaching `target` (or the best one if none does)
+    table = []
+    for s in slices:
+        best = None
+        for ov in sorted(overlaps):
+            whole, covered = coverage(xyxy, box_wh, s, ov, **kwargs)
+            frac = float(covered.mean()) if len(covered) else 1.0
+            if best is None or frac > best["covered"]:
+                best = {"slice": s, "overlap": ov, "whole": float(whole.mean()) if len(whole) else 1.0,
+                        "covered": frac}
+            if frac >= target:
+                break
+        best["meets"] = best["covered"] >= target
+        best["tiles"] = tiles_per_frame(frame_wh, s, best["overlap"])
+        table.append(best)
+    return table
+
+
+def pick(table):
+    # fewest tiles per frame among the sizes that reach the target, then less
+    # overlap, then the smaller tile; None if no size reaches it
+    ok = [row for row in table if row["meets"]]
+    return min(ok, key=lambda r: (r["tiles"], r["overlap"], r["slice"])) if ok else None
+
+
+def print_hist(title, bins, hist, labels=None):
+    labels = labels or bin_labels(bins)
+    print(f"\n{title}\n")
+    print("| Class | " + " | ".join(labels) + " |")
+    print("|---|" + "---:|" * len(labels))
+    for c, counts in enumerate(hist):
+        if counts.sum():
+            print(f"| {c} | " + " | ".join(str(int(v)) for v in counts) + " |")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommend SAHI tile size and overlap from the label statistics.")
+    parser.add_argument("--split", default="train")
+    parser.add_argument("--imgsz", type=int, default=IMGSZ, help="model input size each tile is resized to")
+    parser.add_argument("--min-side", type=float, default=MIN_SIDE, help="smallest box side (px at model input)")
+    parser.add_argument("--target", type=float, default=TARGET, help="fraction of boxes to keep covered")
+    parser.add_argument("--slices", type=int, nargs="+", default=SLICES)
+    parser.add_argument("--overlaps", type=float, nargs="+", default=OVERLAPS)
+    parser.add_argument("--no-full-frame", action="store_true", help="tiles alone must cover every box")
+    args = parser.parse_args()
+
+    boxes, xyxy, box_wh, frame_wh = load_boxes(args.split)
+    if len(frame_wh) == 0:
+        print(f"[MISSING] no images with a readable size in {args.split}")
+        return
+    num_classes = int(boxes["cls"].max()) + 1 if len(boxes) else 0
+    sizes, counts = np.unique(frame_wh, axis=0, return_counts=True)
+    print(f"{args.split}: {len(frame_wh)} images, {len(boxes)} boxes, frame sizes "
+          + ", ".join(f"{w}x{h} ({n})" for (w, h), n in zip(sizes, counts)))
+
+    hists = histograms(boxes, xyxy, num_classes)
+    print_hist("Box width (px)", *hists["width"])
+    print_hist("Box height (px)", *hists["height"])
+    print_hist("Aspect ratio (h / w)", *hists["aspect"])
+    pos_labels = [f"{lo:.1f}" for lo in hists["y"][0][:-1]]
+    print_hist("Centre y (normalized, bin start)", hists["y"][0], hists["y"][1], pos_labels)
+
+    opts = {"imgsz": args.imgsz, "min_side": args.min_side, "full_frame": not args.no_full_frame}
+    table = sweep(xyxy, box_wh, frame_wh, args.slices, args.overlaps, args.target, **opts)
+    print(f"\n=== Smallest overlap per tile size for {args.target:.0%} coverage "
+          f"(>= {args.min_side:g}px at imgsz {args.imgsz}"
+          f"{', full-frame pass on' if opts['full_frame'] else ''}) ===\n")
+    print("| Tile | Overlap | Tiles/frame | Whole in a tile | Covered |")
+    print("|---:|---:|---:|---:|---:|")
+    for row in table:
+        mark = "" if row["meets"] else " (max)"
+        print(f"| {row['slice']} | {row['overlap']:.2f}{mark} | {row['tiles']:.2f} | "
+              f"{row['whole']:.1%} | {row['covered']:.1%} |")
+
+    best = pick(table)
+    if best is None:
+        print(f"\nNo tile size reaches {args.target:.0%}; try smaller --slices, a lower --min-side or --target.")
+    else:
+        _, covered = coverage(xyxy, box_wh, best["slice"], best["overlap"], **opts)
+        per_class = np.bincount(boxes["cls"], weights=covered.astype(np.float64), minlength=num_classes)
+        totals = np.bincount(boxes["cls"], minlength=num_classes)
+        print(f"\nRecommended: {best['slice']}px tiles, overlap {best['overlap']:.2f} -> "
+              f"{best['tiles']:.2f} tiles/frame plus the full-frame pass, {best['covered']:.1%} of boxes covered")
+        print("  per class: " + ", ".join(f"{c} {per_class[c] / totals[c]:.1%}" for c in range(num_classes)
+                                          if totals[c]))
+        print("  sweep cell (configs/sweep_sahi.yaml, extra): "
+              f"- {{slice: {best['slice']}, overlap: {best['overlap']:.2f}}}")
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    out = OUT_DIR / f"{args.split}.json"
+    with open(out, "w") as f:
+        json.dump({
+            "split": args.split, **opts, "target": args.target,
+            "histograms": {k: {"bins": bin_labels(b), "counts": h.tolist()} for k, (b, h) in hists.items()},
+            "table": table,
+            "recommended": best,
+        }, f, indent=2)
+    print(f"\nSaved histograms and table to: {out}")
+
+
+if __name__ == "__main__":
+    main()
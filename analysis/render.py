@@ -0,0 +1,148 @@
+import argparse
+import html
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from box_ops import count_unmatched
+from frames import read_frame
+from pred_store import ResultsStore
+
+# On-demand overlays from a run's results/ store (pred_store.py).
+# The compare scripts no longer write JPEGs for every image; point this at a
+# run directory (debug/compare_sahi_vs_single, debug/sahi_ablation/<cell>,
+# debug/sahi_tiling_valid) and ask for
+#   --image NAME ...   full-resolution side-by-side panels of those images
+#   --new              the same for every image where SAHI found boxes the
+#                      single-shot pass missed (--min-new to raise the bar)
+#   --gallery          downscaled side-by-side thumbnails plus index.html,
+#                      sorted by new boxes, to page through a whole run
+# Output goes to <run>/render/ unless --out is given.
+
+IOU_MATCH = 0.50
+THUMB_W = 960            # width of a whole side-by-side thumbnail
+JPEG_QUALITY = 85
+
+# color (BGR) and panel title per method
+METHOD_STYLE = {
+    "single": ((0, 255, 0), "Single-shot (no tiling)"),
+    "sahi": ((0, 0, 255), "SAHI tiling"),
+    "cascade": ((255, 0, 0), "Cascade"),
+    "temporal": ((255, 0, 255), "Sequence mode"),
+}
+
+
+def draw_boxes(img_bgr, boxes, color, thickness=2):
+    out = img_bgr.copy()
+    for b in boxes:
+        x1, y1, x2, y2 = int(b["x1"]), int(b["y1"]), int(b["x2"]), int(b["y2"])
+        cv2.rectangle(out, (x1, y1), (x2, y2), color, thickness)
+        cv2.putText(out, f"{int(b['cls'])} {float(b['conf']):.2f}", (x1, max(0, y1 - 6)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2, cv2.LINE_AA)
+    return out
+
+
+def side_by_side(preds, name, methods=None):
+    # -> one BGR image with a titled panel per method, or None if the image is gone
+    frame = read_frame(preds.image_path(name))
+    if frame is None:
+        return None
+    panels = []
+    for method in methods or preds.methods:
+        color, title = METHOD_STYLE.get(method, ((255, 255, 255), method))
+        panel = draw_boxes(frame.bgr, preds.boxes(method, name), color)
+        cv2.putText(panel, title, (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 3, cv2.LINE_AA)
+        panels.append(panel)
+    return np.hstack(panels)
+
+
+def new_boxes(preds, method="sahi", ref="single"):
+    # -> per-image count of `method` boxes with no IoU >= IOU_MATCH partner in `ref`
+    return np.array([count_unmatched(preds.boxes(method, i), preds.boxes(ref, i), IOU_MATCH)
+                     for i in range(len(preds))], dtype=np.int64)
+
+
+def render_images(preds, names, out_dir):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = 0
+    for name in names:
+        img = side_by_side(preds, name)
+        if img is None:
+            print(f"[SKIP] could not read {preds.image_path(name)}")
+            continue
+        cv2.imwrite(str(out_dir / name), img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        written += 1
+    return written
+
+
+def write_gallery(preds, out_dir, thumb_w=THUMB_W):
+    thumbs = out_dir / "thumbs"
+    thumbs.mkdir(parents=True, exist_ok=True)
+    has_sahi = "sahi" in preds.methods and "single" in preds.methods
+    new = new_boxes(preds) if has_sahi else np.zeros(len(preds), dtype=np.int64)
+    counts = {m: preds.counts(m) for m in preds.methods}
+
+    cards = []
+    for i in np.argsort(-new, kind="stable"):
+        name = preds.names[i]
+        img = side_by_side(preds, name)
+        if img is None:
+            continue
+        h = int(round(img.shape[0] * thumb_w / img.shape[1]))
+        cv2.imwrite(str(thumbs / name), cv2.resize(img, (thumb_w, h), interpolation=cv2.INTER_AREA),
+                    [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        caption = " &middot; ".join(f"{m} {counts[m][i]}" for m in preds.methods)
+        if has_sahi:
+            caption += f" &middot; new {new[i]}"
+        cards.append(f'<figure><a href="thumbs/{html.escape(name)}"><img src="thumbs/{html.escape(name)}" '
+                     f'loading="lazy"></a><figcaption>{html.escape(name)}<br>{caption}</figcaption></figure>')
+
+    page = out_dir / "index.html"
+    page.write_text(
+        "<!doctype html><meta charset=\"utf-8\"><title>" + html.escape(str(preds.path.parent)) + "</title>\n"
+        "<style>body{font-family:sans-serif;background:#222;color:#ddd}"
+        f"figure{{display:inline-block;margin:6px;width:{thumb_w}px}}img{{width:100%}}</style>\n"
+        + "\n".join(cards) + "\n",
+        encoding="utf-8",
+    )
+    return page, len(cards)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Draw overlays from a run's results store on request.")
+    parser.add_argument("run", type=Path, help="run directory or its results/ directory")
+    parser.add_argument("--image", nargs="*", default=[], help="image file names to render at full resolution")
+    parser.add_argument("--new", action="store_true", help="render images where SAHI found boxes single-shot missed")
+    parser.add_argument("--min-new", type=int, default=1)
+    parser.add_argument("--gallery", action="store_true", help="thumbnails + index.html for every image")
+    parser.add_argument("--thumb-width", type=int, default=THUMB_W)
+    parser.add_argument("--out", type=Path, default=None, help="default <run>/render")
+    args = parser.parse_args()
+
+    preds = ResultsStore(args.run)
+    out_dir = args.out or preds.path.parent / "render"
+    if not (args.image or args.new or args.gallery):
+        parser.error("nothing to render: give --image, --new and/or --gallery")
+
+    if args.image:
+        unknown = [n for n in args.image if n not in preds.names]
+        if unknown:
+            parser.error(f"not in {preds.path}: {', '.join(unknown)}")
+        n = render_images(preds, args.image, out_dir / "side_by_side")
+        print(f"wrote {n} side-by-side images to {out_dir / 'side_by_side'}")
+    if args.new:
+        if "sahi" not in preds.methods or "single" not in preds.methods:
+            parser.error("--new needs both single and sahi predictions")
+        new = new_boxes(preds)
+        names = [preds.names[i] for i in np.flatnonzero(new >= args.min_new)]
+        n = render_images(preds, names, out_dir / "new_boxes")
+        print(f"{len(names)} of {len(preds)} images have >= {args.min_new} new SAHI boxes; "
+              f"wrote {n} to {out_dir / 'new_boxes'}")
+    if args.gallery:
+        page, n = write_gallery(preds, out_dir / "gallery", args.thumb_width)
+        print(f"gallery of {n} images: {page}")
+
+
+if __name__ == "__main__":
+    main()
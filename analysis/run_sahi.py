@@ -1,6 +1,18 @@
 from pathlib import Path
-from sahi.predict import get_sliced_prediction
-from sahi.models.ultralytics import UltralyticsDetectionModel
+
+import csv
+
+import cv2
+from ultralytics import YOLO
+
+from autotune import load_tuned
+from box_ops import to_box_list
+from frames import read_frame
+from parallel_runner import pin_threads
+from pred_store import FILE_NAME as RESULTS_FILE, ResultsWriter, save_predictions
+from pred_cache import PredictionCache, file_digest, sahi_params
+from sliced_predictor import SlicedPredictor
+from temporal import TemporalPredictor, recall_vs, split_sequences
 
 # Paths
 MODEL_PATH = Path("experiments/bosch_sanity/weights/best.pt")
@@ -8,32 +20,169 @@ IMG_DIR = Path("data/bosch/valid/images")
 OUT_DIR = Path("debug/sahi_tiling_valid")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
-detection_model = UltralyticsDetectionModel(
-    model_path=str(MODEL_PATH),
-    confidence_threshold=0.25,
-    device="cpu",  
-)
+# threads / tile batch measured on this host by autotune.py, if it has been run here
+TUNED = load_tuned()
 
-SLICE_H, SLICE_W = 640, 640
+CONF = 0.25
+SLICE_H = SLICE_W = 640
 OVERLAP_H, OVERLAP_W = 0.2, 0.2
 MAX_IMAGES = 50
+USE_CACHE = True
+# boxes go to results/ (draw them with render.py); True also writes a JPEG per image
+WRITE_IMAGES = False
+
+# tiles per forward pass, and how many frames get sliced together
+TILE_BATCH = TUNED.get("tile_batch", 16)
+FRAMES_PER_CALL = 4
+
+# Sequence mode (temporal.py): frames in capture order, tiles re-run only where
+# the frame changed or there were detections; scored against full SAHI
+SEQUENCE_MODE = False
+
+if TUNED.get("workers") == 1:
+    # a single process only matches the tuned setting when it was tuned with one worker
+    pin_threads(TUNED["threads"])
+yolo_model = YOLO(str(MODEL_PATH))
+detection_model = SlicedPredictor(
+    yolo_model,
+    slice_h=SLICE_H,
+    slice_w=SLICE_W,
+    overlap_h=OVERLAP_H,
+    overlap_w=OVERLAP_W,
+    conf=CONF,
+    batch_size=TILE_BATCH,
+)
+
+
+def draw_boxes(img_bgr, boxes, color=(0, 0, 255)):
+    out = img_bgr.copy()
+    for (x1, y1, x2, y2, cls_id, conf) in boxes:
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        cv2.rectangle(out, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(out, f"{cls_id} {conf:.2f}", (x1, max(0, y1 - 6)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2, cv2.LINE_AA)
+    return out
+
+
+def reference_boxes(p, frame):
+    # full-SAHI boxes for one frame, through the cache like the normal mode
+    key = cache.make_key(weights_digest, frame.digest, "sahi", params) if cache else None
+    hit = cache.get(key) if cache else None
+    if hit is not None:
+        return hit
+    boxes = detection_model.predict_arrays([frame.bgr])[0]
+    if cache:
+        cache.put(key, boxes)
+    return boxes
+
+
+def run_sequences(imgs):
+    seq_dir = OUT_DIR / "sequence"
+    seq_dir.mkdir(parents=True, exist_ok=True)
+    temporal_model = TemporalPredictor(yolo_model, SLICE_H, SLICE_W, OVERLAP_H, OVERLAP_W,
+                                       conf=CONF, batch_size=TILE_BATCH)
+    sequences = split_sequences(imgs)
+    print(f"Sequence mode: {len(imgs)} frames in {len(sequences)} sequences ({temporal_model.temporal_name})")
+
+    rows = []
+    matched = 0
+    names, seq_boxes, ref_boxes = [], [], []
+    for seq_id, seq in enumerate(sequences):
+        temporal_model.reset()
+        for p in seq:
+            frame = read_frame(p)
+            if frame is None:
+                continue
+            boxes, info = temporal_model.predict_frame(frame.bgr)
+            ref = reference_boxes(p, frame)
+            n_matched, recall = recall_vs(boxes, ref)
+            matched += n_matched
+            rows.append([p.name, seq_id, int(info["refresh"]), info["tiles_run"], info["tiles_total"],
+                         "" if info["change_mean"] is None else round(info["change_mean"], 2),
+                         len(boxes), len(ref), "" if recall is None else round(recall, 4)])
+            names.append(p.name)
+            seq_boxes.append(boxes)
+            ref_boxes.append(ref)
+            if WRITE_IMAGES:
+                cv2.imwrite(str(seq_dir / p.name), draw_boxes(frame.bgr, to_box_list(boxes)))
+
+    csv_path = OUT_DIR / "sequence_mode.csv"
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["image", "sequence", "refresh", "tiles_run", "tiles_total", "change_mean",
+                         "num_boxes", "num_ref", "recall_vs_sahi"])
+        writer.writerows(rows)
+    save_predictions(seq_dir / RESULTS_FILE, names, {"sahi": ref_boxes, "temporal": seq_boxes}, image_dir=IMG_DIR)
+
+    tiles_run = sum(r[3] for r in rows)
+    tiles_total = sum(r[4] for r in rows)
+    num_ref = sum(r[7] for r in rows)
+    print(f"tiles/frame: {tiles_run / max(len(rows), 1):.2f} run of {tiles_total / max(len(rows), 1):.2f} "
+          f"({100.0 * (1 - tiles_run / max(tiles_total, 1)):.0f}% reused)")
+    # pooled recall: matched reference boxes (exact counts) over all reference boxes
+    print(f"recall vs full SAHI: {matched / num_ref:.3f}" if num_ref else "recall vs full SAHI: - (no reference boxes)")
+    print("Temporal predictor:", temporal_model.report())
+    print("Saved sequence predictions to:", seq_dir, "and", csv_path)
+
 
 imgs = sorted([p for p in IMG_DIR.glob("*.jpg")])
+if SEQUENCE_MODE:
+    # first MAX_IMAGES in capture order, so the sequences stay contiguous
+    imgs = [p for seq in split_sequences(imgs) for p in seq]
 if MAX_IMAGES:
     imgs = imgs[:MAX_IMAGES]
 
+cache = PredictionCache() if USE_CACHE else None
+weights_digest = file_digest(MODEL_PATH)
+params = sahi_params(CONF, SLICE_H, SLICE_W, OVERLAP_H, OVERLAP_W,
+                     postprocess=detection_model.postprocess_name)
+
+if SEQUENCE_MODE:
+    run_sequences(imgs)
+    if cache is not None:
+        print(f"Prediction cache: {cache.hits} hits, {cache.misses} misses")
+    raise SystemExit(0)
+
 print(f"Running SAHI on {len(imgs)} images...")
-for i, img_path in enumerate(imgs, 1):
-    result = get_sliced_prediction(
-        image=str(img_path),
-        detection_model=detection_model,
-        slice_height=SLICE_H,
-        slice_width=SLICE_W,
-        overlap_height_ratio=OVERLAP_H,
-        overlap_width_ratio=OVERLAP_W,
-    )
-    result.export_visuals(export_dir=str(OUT_DIR))
-    if i % 10 == 0:
-        print(f"  done {i}/{len(imgs)}")
-
-print("Saved SAHI visuals to:", OUT_DIR)
+done = 0
+# appended as frames finish, so an interrupted run keeps what it got through
+results = ResultsWriter(OUT_DIR / RESULTS_FILE, image_dir=IMG_DIR)
+for start in range(0, len(imgs), FRAMES_PER_CALL):
+    group = imgs[start:start + FRAMES_PER_CALL]
+    frames = {p: read_frame(p) for p in group}
+    frames = {p: f for p, f in frames.items() if f is not None}
+
+    boxes_by_img = {}
+    todo = []
+    for p in frames:
+        key = cache.make_key(weights_digest, frames[p].digest, "sahi", params) if cache else None
+        hit = cache.get(key) if cache else None
+        if hit is not None:
+            boxes_by_img[p] = to_box_list(hit)
+        else:
+            todo.append((p, key))
+
+    if todo:
+        preds = detection_model.predict_many([frames[p].bgr for p, _ in todo])
+        for (p, key), boxes in zip(todo, preds):
+            boxes_by_img[p] = boxes
+            if cache:
+                cache.put(key, boxes)
+
+    for p, frame in frames.items():
+        results.append(p.name, {"sahi": boxes_by_img[p]})
+        if WRITE_IMAGES:
+            cv2.imwrite(str(OUT_DIR / p.name), draw_boxes(frame.bgr, boxes_by_img[p]))
+
+    prev = done
+    done += len(group)
+    if done // 10 > prev // 10:
+        print(f"  done {done}/{len(imgs)}")
+
+predictions_path = results.close()
+print("Saved SAHI predictions to:", predictions_path, "(overlays: python analysis/render.py", OUT_DIR, "--gallery)")
+if WRITE_IMAGES:
+    print("Saved SAHI visuals to:", OUT_DIR)
+print("Sliced predictor:", detection_model.report())
+if cache is not None:
+    print(f"Prediction cache: {cache.hits} hits, {cache.misses} misses")
@@ -0,0 +1,213 @@
+import time
+
+import cv2
+import numpy as np
+
+from box_merge import merge_boxes
+from box_ops import BOX_DTYPE, to_box_list
+from instrument import stage
+
+# Batched replacement for sahi.predict.get_sliced_prediction.
+# SAHI runs the detector once per tile; here every tile of a frame (or of a
+# group of frames) is cut into a fixed-size batch and pushed through the YOLO
+# model in as few forward passes as BATCH_SIZE allows. Tile boxes are shifted
+# back to frame coordinates and merged with the full-frame pass using
+# box_merge (MERGE_METHOD: "nms", "nmm" = SAHI's GREEDYNMM, or "wbf").
+# An optional tile_filter(tiles, image_h, image_w) -> bool mask drops tiles
+# before they are cut (see tile_prior.py); it requires the full-frame pass.
+
+BATCH_SIZE = 16
+PAD_VALUE = 114          # same gray ultralytics uses for letterboxing
+MERGE_METHOD = "nmm"     # same as the compare scripts and the sweep
+MERGE_METRIC = "ios"     # SAHI's default postprocess matches on IOS...
+MERGE_THR = 0.5          # ...with a 0.5 threshold
+
+
+def slice_bboxes(image_h, image_w, slice_h, slice_w, overlap_h, overlap_w):
+    # Same tile geometry as sahi.slicing.get_slice_bboxes so results stay
+    # comparable with the SAHI runs: tiles that would run off the frame are
+    # shifted back inside it rather than cropped.
+    y_overlap = int(overlap_h * slice_h)
+    x_overlap = int(overlap_w * slice_w)
+
+    bboxes = []
+    y_min = y_max = 0
+    while y_max < image_h:
+        x_min = x_max = 0
+        y_max = y_min + slice_h
+        while x_max < image_w:
+            x_max = x_min + slice_w
+            if y_max > image_h or x_max > image_w:
+                xmax = min(image_w, x_max)
+                ymax = min(image_h, y_max)
+                xmin = max(0, xmax - slice_w)
+                ymin = max(0, ymax - slice_h)
+                bboxes.append((xmin, ymin, xmax, ymax))
+            else:
+                bboxes.append((x_min, y_min, x_max, y_max))
+            x_min = x_max - x_overlap
+        y_min = y_max - y_overlap
+    return bboxes
+
+
+def load_frame(image):
+    if isinstance(image, np.ndarray):
+        return image
+    frame = cv2.imread(str(image))
+    if frame is None:
+        raise FileNotFoundError(f"Could not read image: {image}")
+    return frame
+
+
+def result_to_array(result):
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.zeros(0, dtype=BOX_DTYPE)
+
+    xyxy = boxes.xyxy.cpu().numpy()
+    out = np.zeros(len(xyxy), dtype=BOX_DTYPE)
+    out["x1"] = xyxy[:, 0]
+    out["y1"] = xyxy[:, 1]
+    out["x2"] = xyxy[:, 2]
+    out["y2"] = xyxy[:, 3]
+    out["cls"] = boxes.cls.cpu().numpy().astype(np.int16)
+    out["conf"] = boxes.conf.cpu().numpy()
+    return out
+
+
+def shift_to_frame(boxes, tile):
+    # tile-local boxes -> frame coords, clipped to the tile (drops the padding)
+    x1, y1, x2, y2 = tile
+    boxes["x1"] = np.clip(boxes["x1"], 0, x2 - x1) + x1
+    boxes["x2"] = np.clip(boxes["x2"], 0, x2 - x1) + x1
+    boxes["y1"] = np.clip(boxes["y1"], 0, y2 - y1) + y1
+    boxes["y2"] = np.clip(boxes["y2"], 0, y2 - y1) + y1
+    return boxes
+
+
+class SlicedPredictor:
+    def __init__(self, yolo_model, slice_h=640, slice_w=640, overlap_h=0.2, overlap_w=None,
+                 conf=0.25, batch_size=BATCH_SIZE, full_frame=True, imgsz=None, device=None,
+                 merge_metric=MERGE_METRIC, merge_thr=MERGE_THR, tile_filter=None, merge_method=MERGE_METHOD):
+        if tile_filter is not None and not full_frame:
+            raise ValueError("tile_filter needs full_frame=True so skipped regions are still covered")
+        self.model = yolo_model
+        self.slice_h = slice_h
+        self.slice_w = slice_w
+        self.overlap_h = overlap_h
+        self.overlap_w = overlap_h if overlap_w is None else overlap_w
+        self.conf = conf
+        self.batch_size = batch_size
+        self.full_frame = full_frame
+        self.imgsz = imgsz
+        self.device = device
+        self.merge_metric = merge_metric
+        self.merge_thr = merge_thr
+        self.merge_method = merge_method
+        self.tile_filter = tile_filter
+
+        self.tiles_run = 0
+        self.tiles_skipped = 0
+        self.forward_passes = 0
+        self.forward_seconds = 0.0
+
+    @property
+    def postprocess_name(self):
+        return f"batched_{self.merge_method}_{self.merge_metric}{self.merge_thr:g}"
+
+    @property
+    def tiles_per_sec(self):
+        return self.tiles_run / self.forward_seconds if self.forward_seconds > 0 else 0.0
+
+    def tiles_for(self, frame):
+        h, w = frame.shape[:2]
+        tiles = slice_bboxes(h, w, self.slice_h, self.slice_w, self.overlap_h, self.overlap_w)
+        if self.tile_filter is None:
+            return tiles
+        mask = self.tile_filter(tiles, h, w)
+        kept = [t for t, keep in zip(tiles, mask) if keep]
+        self.tiles_skipped += len(tiles) - len(kept)
+        return kept
+
+    def _cut(self, frame, tile):
+        x1, y1, x2, y2 = tile
+        crop = frame[y1:y2, x1:x2]
+        if crop.shape[0] == self.slice_h and crop.shape[1] == self.slice_w:
+            return np.ascontiguousarray(crop)
+
+        # frame smaller than a tile: pad bottom/right so the batch stays uniform
+        padded = np.full((self.slice_h, self.slice_w, frame.shape[2]), PAD_VALUE, dtype=frame.dtype)
+        padded[:crop.shape[0], :crop.shape[1]] = crop
+        return padded
+
+    def _forward(self, images, conf=None):
+        kwargs = {"conf": self.conf if conf is None else conf, "verbose": False}
+        if self.imgsz is not None:
+            kwargs["imgsz"] = self.imgsz
+        if self.device is not None:
+            kwargs["device"] = self.device
+
+        with stage("forward"):
+            t0 = time.perf_counter()
+            results = self.model.predict(source=images, **kwargs)
+            self.forward_seconds += time.perf_counter() - t0
+        self.forward_passes += 1
+        return [result_to_array(r) for r in results]
+
+    def _full_frame_pass(self, frames, conf=None):
+        # frames of one size letterbox identically, so they share a batch
+        out = [None] * len(frames)
+        by_shape = {}
+        for fi, frame in enumerate(frames):
+            by_shape.setdefault(frame.shape, []).append(fi)
+        for idxs in by_shape.values():
+            for start in range(0, len(idxs), self.batch_size):
+                chunk = idxs[start:start + self.batch_size]
+                for fi, boxes in zip(chunk, self._forward([frames[i] for i in chunk], conf=conf)):
+                    out[fi] = boxes
+        return out
+
+    def predict_arrays(self, frames):
+        frames = [load_frame(f) for f in frames]
+        per_frame = [[] for _ in frames]
+
+        jobs = []
+        with stage("slice"):
+            for fi, frame in enumerate(frames):
+                for tile in self.tiles_for(frame):
+                    jobs.append((fi, tile))
+
+        for start in range(0, len(jobs), self.batch_size):
+            chunk = jobs[start:start + self.batch_size]
+            with stage("slice"):
+                batch = [self._cut(frames[fi], tile) for fi, tile in chunk]
+            for (fi, tile), boxes in zip(chunk, self._forward(batch)):
+                if len(boxes):
+                    per_frame[fi].append(shift_to_frame(boxes, tile))
+            self.tiles_run += len(chunk)
+
+        if self.full_frame:
+            for fi, boxes in enumerate(self._full_frame_pass(frames)):
+                per_frame[fi].append(boxes)
+
+        return self._merge(per_frame)
+
+    def _merge(self, per_frame):
+        merged = []
+        with stage("merge"):
+            for parts in per_frame:
+                boxes = np.concatenate(parts) if parts else np.zeros(0, dtype=BOX_DTYPE)
+                merged.append(merge_boxes(boxes, self.merge_method, self.merge_thr, metric=self.merge_metric))
+        return merged
+
+    def predict_many(self, images):
+        return [to_box_list(arr) for arr in self.predict_arrays(images)]
+
+    def predict(self, image):
+        return self.predict_many([image])[0]
+
+    def report(self):
+        skipped = f" ({self.tiles_skipped} skipped)" if self.tile_filter is not None else ""
+        return (f"{self.tiles_run} tiles{skipped} in {self.forward_passes} forward passes, "
+                f"{self.forward_seconds:.1f}s forward, {self.tiles_per_sec:.1f} tiles/sec")
+
@@ -1,6 +1,35 @@
 from pathlib import Path
 from ultralytics import YOLO
 
+from build_tile_dataset import OUT_ROOT as TILE_ROOT, build_tiles
+from dedup_frames import dedup_yaml
+from instrument import LoaderWait
+from train_sampler import balanced_trainer
+from train_store import pack_store, packed_trainer
+
+# Train on 640x640 tiles cut with the SAHI inference geometry (build_tile_dataset.py)
+# instead of full frames at imgsz=1280: same pixels per light, a quarter of
+# the pixels per sample. Set False for the original full-frame run.
+USE_TILES = True
+
+# Train on one frame per cluster of near-identical dashcam frames
+# (dedup_frames.py, dHash Hamming distance <= DEDUP_THRESHOLD); None trains on
+# every frame. Compare runs with: python analysis/dedup_frames.py --report <runs>
+DEDUP_THRESHOLD = None
+
+# Read batches from pre-decoded, pre-resized uint8 shards (train_store.py)
+# instead of decoding every JPEG and label file each epoch; packed once, and
+# again only when the images or labels change. Per-epoch dataloader wait goes
+# to <run>/dataloader_wait.csv either way. Off until a train_store.py --bench /
+# dataloader_wait.csv comparison shows the wait drop with unchanged val mAP.
+USE_PACKED = False
+
+# Oversample images with rare classes and small boxes, and every few epochs
+# the train images the current model gets wrong (train_sampler.py); False
+# keeps uniform shuffling. Compare wall-clock time to a target mAP with:
+# python analysis/train_sampler.py --report <uniform run> <balanced run>
+BALANCED_SAMPLING = False
+
 def find_project_root() -> Path:
     p = Path(__file__).resolve()
     for parent in [p] + list(p.parents):
@@ -11,22 +40,45 @@ def find_project_root() -> Path:
 def main():
     project_root = find_project_root()
 
-    data_yaml = project_root / "data" / "bosch" / "data.yaml"
+    if USE_TILES:
+        # incremental: only images changed since the last build are re-cut
+        data_yaml = build_tiles(out_root=TILE_ROOT)
+        imgsz, batch, name = 640, 32, "step4_aug_tiles640"
+    else:
+        data_yaml = project_root / "data" / "bosch" / "data.yaml"
+        imgsz, batch, name = 1280, 8, "step4_aug_imgsz1280"
     assert data_yaml.exists(), f"Missing dataset yaml: {data_yaml}"
 
+    if DEDUP_THRESHOLD is not None:
+        images_dir = (TILE_ROOT if USE_TILES else project_root / "data" / "bosch") / "train" / "images"
+        data_yaml = dedup_yaml(project_root / "data" / "bosch" / "data.yaml", images_dir, DEDUP_THRESHOLD)
+        name += f"_dedup{DEDUP_THRESHOLD}"
+
+    trainer = None
+    if USE_PACKED:
+        store = pack_store(src_root=TILE_ROOT if USE_TILES else project_root / "data" / "bosch", imgsz=imgsz)
+        trainer = packed_trainer(store)
+        name += "_packed"
+
+    if BALANCED_SAMPLING:
+        trainer = balanced_trainer(trainer)
+        name += "_balanced"
+
     model = YOLO("yolov8n.pt")
+    LoaderWait().attach(model)
 
     model.train(
         data=str(data_yaml),
-        imgsz=1280,
+        imgsz=imgsz,
         epochs=50,
-        batch=8,          
+        batch=batch,
         patience=10,
         close_mosaic=10,
         project=str(project_root / "experiments"),
-        name="step4_aug_imgsz1280",
+        name=name,
         pretrained=True,
         device=0,         
+        trainer=trainer,
     )
 
 if __name__ == "__main__":
@@ -1,72 +1,116 @@
 from pathlib import Path
 import csv
+import json
 
-PROJECT_ROOT = Path(__file__).resolve().parents[1]
+import numpy as np
+
+from evaluate import metric_columns
+from pred_store import FILE_NAME as RESULTS_FILE, ResultsStore, as_column
+from sweep import discover, load_marker, pareto_front
 
-CSV_PATHS = [
-    PROJECT_ROOT / "debug" / "sahi_ablation" / "tile640_ov10" / "summary.csv",
-    PROJECT_ROOT / "debug" / "sahi_ablation" / "tile640_ov20" / "summary.csv",
-    PROJECT_ROOT / "debug" / "sahi_ablation" / "tile640_ov30" / "summary.csv",
-]
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
 
+# every sweep cell under OUT_DIR (compare_sahi_ablation.py / configs/sweep_sahi.yaml)
 OUT_DIR = PROJECT_ROOT / "debug" / "sahi_ablation"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
-def load_rows(csv_path: Path):
-    rows = []
-    with open(csv_path, "r", newline="") as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            rows.append({
-                "image": r["image"],
-                "num_single": int(r["num_single"]),
-                "num_sahi": int(r["num_sahi"]),
-                "num_new": int(r["num_new_sahi_vs_single"]),
-                "dup_pairs": int(r["dup_pairs_sahi_est"]),
-            })
-    return rows
-
-def summarize(rows):
-    n = len(rows)
-    total_single = sum(r["num_single"] for r in rows)
-    total_sahi = sum(r["num_sahi"] for r in rows)
-    total_new = sum(r["num_new"] for r in rows)
-    total_dup_pairs = sum(r["dup_pairs"] for r in rows)
-
-    imgs_single_ge1 = sum(1 for r in rows if r["num_single"] > 0)
-    imgs_sahi_ge1 = sum(1 for r in rows if r["num_sahi"] > 0)
-    imgs_new_ge1 = sum(1 for r in rows if r["num_new"] > 0)
-    imgs_dup_ge1 = sum(1 for r in rows if r["dup_pairs"] > 0)
+def load_columns(run_dir: Path):
+    # {column: float32 per image, NaN where blank} from the run's results/;
+    # runs from before the results store only have summary.csv
+    if (run_dir / RESULTS_FILE).exists():
+        return ResultsStore(run_dir / RESULTS_FILE).columns
+    with open(run_dir / "summary.csv", "r", newline="") as f:
+        rows = list(csv.DictReader(f))
+    fields = [k for k in (rows[0] if rows else {}) if k != "image"]
+    return {k: as_column([r[k] for r in rows]) for k in fields}
+
+def stage_means(cols):
+    # mean per image of every ms_* / mem_* column (instrument.py), over the images that have it
+    out = {}
+    for k, v in cols.items():
+        if k.startswith(("ms_", "mem_")) and not np.isnan(v).all():
+            out[k] = float(np.nanmean(v))
+    return out
+
+def summarize(cols):
+    # a results/ whose run has not flushed a chunk yet has no columns at all
+    empty = np.zeros(0, np.float32)
+    single = cols.get("num_single", empty)
+    sahi = cols.get("num_sahi", empty)
+    new = cols.get("num_new_sahi_vs_single", empty)
+    dup_pairs = cols.get("dup_pairs_sahi_est", empty)
+    n = len(single)
+    # blank (NaN) when the boxes came from pred_cache
+    sahi_ms = cols.get("sahi_ms", np.full(n, np.nan, np.float32))
 
     return {
         "images": n,
-        "total_single": total_single,
-        "total_sahi": total_sahi,
-        "avg_single": total_single / n if n else 0.0,
-        "avg_sahi": total_sahi / n if n else 0.0,
-        "imgs_single_ge1": imgs_single_ge1,
-        "imgs_sahi_ge1": imgs_sahi_ge1,
-        "imgs_new_ge1": imgs_new_ge1,
-        "total_new": total_new,
-        "imgs_dup_ge1": imgs_dup_ge1,
-        "total_dup_pairs": total_dup_pairs,
+        "total_single": int(single.sum()),
+        "total_sahi": int(sahi.sum()),
+        "avg_single": float(single.mean()) if n else 0.0,
+        "avg_sahi": float(sahi.mean()) if n else 0.0,
+        "imgs_single_ge1": int(np.count_nonzero(single > 0)),
+        "imgs_sahi_ge1": int(np.count_nonzero(sahi > 0)),
+        "imgs_new_ge1": int(np.count_nonzero(new > 0)),
+        "total_new": int(new.sum()),
+        "imgs_dup_ge1": int(np.count_nonzero(dup_pairs > 0)),
+        "total_dup_pairs": int(dup_pairs.sum()),
+        "sahi_ms": None if np.isnan(sahi_ms).all() else float(np.nanmean(sahi_ms)),
+        **stage_means(cols),
     }
 
+METHODS = ["single", "sahi", "cascade"]
+
+def load_metrics(run_dir: Path):
+    # metrics.json is written next to summary.csv by compare_sahi_ablation.py;
+    # runs from before the evaluator existed just get empty metric columns
+    path = run_dir / "metrics.json"
+    out = {}
+    if not path.exists():
+        return out
+    with open(path, "r") as f:
+        metrics = json.load(f)
+    for method in METHODS:
+        for col in metric_columns():
+            out[f"{col}_{method}"] = metrics.get(method, {}).get(col)
+    return out
+
+METRIC_FIELDS = [f"{col}_{method}" for col in metric_columns() for method in METHODS]
+
+def fmt(v, digits=3):
+    return "-" if v is None or v == "" else f"{v:.{digits}f}"
+
+# stages shown in the cost table; every ms_* / mem_* column still goes to the CSV
+COST_STAGES = ["ms_decode", "ms_single", "ms_sahi", "ms_sahi_slice", "ms_sahi_forward", "ms_sahi_merge",
+               "ms_cascade", "ms_eval", "ms_draw", "ms_resize", "ms_imwrite"]
+
 def main():
     all_summaries = []
 
-    for csv_path in CSV_PATHS:
-        if not csv_path.exists():
-            print(f"[MISSING] {csv_path}")
-            continue
+    run_dirs = discover(OUT_DIR)
+    if not run_dirs:
+        print(f"[MISSING] no {RESULTS_FILE} or summary.csv under {OUT_DIR}")
+        return
 
-        rows = load_rows(csv_path)
-        s = summarize(rows)
+    for run_dir in run_dirs:
+        s = summarize(load_columns(run_dir))
+        s.update(load_metrics(run_dir))
+        if s["sahi_ms"] is None:
+            # every image came from pred_cache: use the latency cell.json kept from when it was computed
+            marker = load_marker(run_dir)
+            if marker is not None and marker.get("latency"):
+                s["sahi_ms"] = marker["latency"]["sahi_ms"]
 
-        label = csv_path.parent.name
+        label = run_dir.name
         s["run"] = label
         all_summaries.append(s)
 
+    stage_fields = []
+    for s in all_summaries:
+        for k in s:
+            if k.startswith(("ms_", "mem_")) and k not in stage_fields:
+                stage_fields.append(k)
+
     out_csv = OUT_DIR / "ablation_summary.csv"
     with open(out_csv, "w", newline="") as f:
         writer = csv.DictWriter(f, fieldnames=[
@@ -74,8 +118,8 @@ def main():
             "total_single","total_sahi","avg_single","avg_sahi",
             "imgs_single_ge1","imgs_sahi_ge1",
             "imgs_new_ge1","total_new",
-            "imgs_dup_ge1","total_dup_pairs"
-        ])
+            "imgs_dup_ge1","total_dup_pairs","sahi_ms"
+        ] + METRIC_FIELDS + stage_fields, restval="")
         writer.writeheader()
         for s in all_summaries:
             writer.writerow(s)
@@ -92,7 +136,42 @@ def main():
             f"{s['imgs_dup_ge1']} | {s['total_dup_pairs']} |"
         )
 
+    print("\n=== Accuracy vs ground truth (valid/labels) ===\n")
+    cols = ["map50", "map50_95", "recall50_tiny", "recall50_small"]
+    titles = {"map50": "mAP50", "map50_95": "mAP50-95", "recall50_tiny": "R50 tiny", "recall50_small": "R50 small"}
+    print("| Run | " + " | ".join(f"{titles[c]} {m}" for c in cols for m in METHODS) + " |")
+    print("|---|" + "---:|" * (len(cols) * len(METHODS)))
+    for s in all_summaries:
+        vals = [fmt(s.get(f"{c}_{m}")) for c in cols for m in METHODS]
+        print(f"| {s['run']} | " + " | ".join(vals) + " |")
+
+    shown = [k for k in COST_STAGES if k in stage_fields]
+    if shown:
+        print("\n=== Cost per config (mean ms per image) ===\n")
+        print("| Run | " + " | ".join(k[3:] for k in shown) + " | mAP50 SAHI | R50 tiny SAHI |")
+        print("|---|" + "---:|" * (len(shown) + 2))
+        for s in all_summaries:
+            vals = [fmt(s.get(k), 1) for k in shown]
+            print(f"| {s['run']} | " + " | ".join(vals) + f" | {fmt(s.get('map50_sahi'))} | "
+                  f"{fmt(s.get('recall50_tiny_sahi'))} |")
+
+    print_pareto(all_summaries)
+
     print(f"\nSaved combined summary to: {out_csv}")
 
+def print_pareto(all_summaries):
+    # SAHI latency (computed images only, else the figure kept in cell.json)
+    # against mAP50 / recall50; * marks the runs no other run beats on both
+    # latency and that metric
+    runs = sorted(all_summaries, key=lambda s: (s["sahi_ms"] is None, s["sahi_ms"] or 0.0))
+    fronts = {m: set(pareto_front([(s["sahi_ms"], s.get(f"{m}_sahi")) for s in runs]))
+              for m in ("map50", "recall50")}
+    print("\n=== Pareto: latency vs accuracy (SAHI) ===\n")
+    print("| Run | SAHI ms/img | mAP50 | Recall50 | Pareto mAP50 | Pareto recall50 |")
+    print("|---|---:|---:|---:|:---:|:---:|")
+    for i, s in enumerate(runs):
+        print(f"| {s['run']} | {fmt(s['sahi_ms'], 1)} | {fmt(s.get('map50_sahi'))} | {fmt(s.get('recall50_sahi'))} | "
+              f"{'*' if i in fronts['map50'] else ''} | {'*' if i in fronts['recall50'] else ''} |")
+
 if __name__ == "__main__":
     main()
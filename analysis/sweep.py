@@ -0,0 +1,131 @@
+import itertools
+import json
+from pathlib import Path
+
+import yaml
+
+from pred_store import FILE_NAME as RESULTS_FILE
+
+# Resumable parameter sweep for compare_sahi_ablation.py.
+# configs/sweep_sahi.yaml gives a grid over slice size, overlap, conf, merge
+# method and inference size, plus `extra` cells (selective tiling). Each
+# cell gets a stable name and its own results directory; a cell.json written
+# after summary.csv and metrics.json marks it done for one run key (weights,
+# image sample, ...). pending_cells() returns only the cells without a
+# matching marker, so an interrupted sweep picks up where it stopped; images
+# already predicted for an unfinished cell come back from pred_cache.
+# Cached images have no latency, so cell.json also keeps the cell's mean SAHI
+# ms/image; a re-run served entirely from the cache carries the previous
+# figure over, and summarize_sahi_runs.py falls back to it.
+# discover() finds every cell's results directory for summarize_sahi_runs.py.
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SWEEP_FILE = PROJECT_ROOT / "configs" / "sweep_sahi.yaml"
+MARKER = "cell.json"
+
+GRID_KEYS = ("slice", "overlap", "conf", "merge", "imgsz")
+
+
+def cell_name(cell, defaults):
+    name = f"tile{cell['slice']}_ov{round(cell['overlap'] * 100):02d}"
+    if cell["conf"] != defaults.get("conf"):
+        name += f"_conf{cell['conf']:g}"
+    if cell["merge"] != defaults.get("merge"):
+        name += f"_{cell['merge']}"
+    if cell["imgsz"] != defaults.get("imgsz"):
+        name += f"_img{cell['imgsz']}"
+    return name
+
+
+def as_cell(entry, defaults):
+    # fills the keys compare_sahi_ablation.py reads (slice_h / slice_w etc.)
+    cell = {k: entry.get(k, defaults.get(k)) for k in GRID_KEYS}
+    cell.update({k: v for k, v in entry.items() if k not in GRID_KEYS})
+    cell["slice_h"] = cell["slice_w"] = int(cell["slice"])
+    cell["overlap"] = float(cell["overlap"])
+    cell.setdefault("name", cell_name(cell, defaults))
+    return cell
+
+
+def expand_grid(spec):
+    defaults = spec.get("defaults", {})
+    grid = spec.get("grid", {})
+    values = [grid.get(k, [defaults.get(k)]) for k in GRID_KEYS]
+    cells = [as_cell(dict(zip(GRID_KEYS, combo)), defaults) for combo in itertools.product(*values)]
+    cells += [as_cell(entry, defaults) for entry in spec.get("extra", [])]
+
+    names = [c["name"] for c in cells]
+    dupes = sorted({n for n in names if names.count(n) > 1})
+    if dupes:
+        raise ValueError(f"sweep cells with the same name: {dupes}")
+    for c in cells:
+        if "base" in c and c["base"] not in names:
+            raise ValueError(f"{c['name']}: base {c['base']!r} is not a cell of the sweep")
+    return cells
+
+
+def load_sweep(path=SWEEP_FILE):
+    with open(path, "r") as f:
+        return expand_grid(yaml.safe_load(f))
+
+
+def load_marker(out_dir):
+    path = Path(out_dir) / MARKER
+    if not path.exists():
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def cell_done(out_dir, cell, run_key):
+    marker = load_marker(out_dir)
+    if marker is None or not (Path(out_dir) / "summary.csv").exists():
+        return False
+    return marker.get("cell") == cell and marker.get("run") == run_key
+
+
+def pending_cells(cells, out_root, run_key, force=False):
+    # cells still to run; a selective-tiling cell pulls in its base so the
+    # skipped / recall-lost report compares numbers from the same run
+    if force:
+        return list(cells)
+    todo = {c["name"] for c in cells if not cell_done(Path(out_root) / c["name"], c, run_key)}
+    todo |= {c["base"] for c in cells if c["name"] in todo and "base" in c}
+    return [c for c in cells if c["name"] in todo]
+
+
+def mark_done(out_dir, cell, run_key, latency=None):
+    # written last, after the cell's summary.csv and metrics.json; latency:
+    # {"sahi_ms", "images", "host"} over the images computed (not cached) in this run
+    marker = {"cell": cell, "run": run_key}
+    if latency is None:
+        # nothing computed this time: keep the figure of the same cell and run key
+        prev = load_marker(out_dir)
+        if prev is not None and prev.get("cell") == cell and prev.get("run") == run_key:
+            latency = prev.get("latency")
+    if latency is not None:
+        marker["latency"] = latency
+    with open(Path(out_dir) / MARKER, "w") as f:
+        json.dump(marker, f, indent=2)
+
+
+def discover(out_root):
+    # every run directory directly under out_root with a results/ or a
+    # summary.csv, in name order (also runs from before the sweep engine,
+    # which have no marker, and from before the results store, CSV only)
+    root = Path(out_root)
+    return sorted({p.parent for pattern in (f"*/{RESULTS_FILE}", "*/summary.csv") for p in root.glob(pattern)})
+
+
+def pareto_front(points):
+    # points: (cost, value) pairs, lower cost and higher value are better;
+    # -> indices of the points no other point beats on both
+    front = []
+    for i, (cost, value) in enumerate(points):
+        if cost is None or value is None:
+            continue
+        dominated = any(c is not None and v is not None and c <= cost and v >= value and (c < cost or v > value)
+                        for j, (c, v) in enumerate(points) if j != i)
+        if not dominated:
+            front.append(i)
+    return front
@@ -0,0 +1,160 @@
+import re
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from box_ops import BOX_DTYPE, greedy_assign
+from instrument import stage
+from sliced_predictor import (BATCH_SIZE, MERGE_METHOD, MERGE_METRIC, MERGE_THR, SlicedPredictor,
+                              load_frame, shift_to_frame, slice_bboxes)
+
+# Sequence mode for consecutive dashcam frames.
+# Bosch frames are numbered captures (Roboflow keeps the number at the front
+# of the file name, e.g. 24068_png.rf.<hash>.jpg), so sorting by that number
+# and splitting wherever it jumps by more than MAX_GAP gives the sequences.
+# Within a sequence each frame is compared with the previous one on a
+# grayscale copy downsampled by CHANGE_SCALE: a tile is re-run only if the
+# mean absolute difference under it is >= CHANGE_THR or it had detections
+# last frame. Every other tile reuses its previous boxes. The full-frame pass
+# always runs, and every REFRESH_EVERY frames (and at the start of a sequence)
+# all tiles run, so stale tiles cannot drift for long.
+# Results depend on the previous frame, so sequence mode bypasses pred_cache.
+
+CHANGE_SCALE = 8
+CHANGE_THR = 4.0         # mean |diff| in gray levels (0-255)
+REFRESH_EVERY = 10
+MAX_GAP = 1              # frame-number gap that still counts as the same sequence
+
+_FRAME_NUMBER = re.compile(r"^(\d+)")
+
+
+def frame_number(path):
+    m = _FRAME_NUMBER.match(Path(path).stem)
+    return int(m.group(1)) if m else None
+
+
+def split_sequences(paths, max_gap=MAX_GAP):
+    # -> list of sequences (lists of paths in frame order); unnumbered files
+    # are each a sequence of their own
+    numbered = sorted((p for p in paths if frame_number(p) is not None), key=lambda p: (frame_number(p), p.name))
+    sequences = []
+    last = None
+    for p in numbered:
+        n = frame_number(p)
+        if last is None or n - last > max_gap:
+            sequences.append([])
+        sequences[-1].append(p)
+        last = n
+    sequences.extend([p] for p in sorted(p for p in paths if frame_number(p) is None))
+    return sequences
+
+
+def downsample(frame, scale=CHANGE_SCALE):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape
+    return cv2.resize(gray, (max(1, w // scale), max(1, h // scale)), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def change_scores(prev_small, cur_small, tiles, scale=CHANGE_SCALE):
+    # mean |cur - prev| under each tile, from a summed-area table of the diff
+    diff = np.abs(cur_small - prev_small)
+    sat = np.zeros((diff.shape[0] + 1, diff.shape[1] + 1), dtype=np.float64)
+    sat[1:, 1:] = diff.cumsum(axis=0).cumsum(axis=1)
+    t = np.asarray(tiles, dtype=np.int64).reshape(-1, 4)
+    x1 = np.clip(t[:, 0] // scale, 0, diff.shape[1] - 1)
+    y1 = np.clip(t[:, 1] // scale, 0, diff.shape[0] - 1)
+    x2 = np.clip(-(-t[:, 2] // scale), x1 + 1, diff.shape[1])
+    y2 = np.clip(-(-t[:, 3] // scale), y1 + 1, diff.shape[0])
+    total = sat[y2, x2] - sat[y1, x2] - sat[y2, x1] + sat[y1, x1]
+    return total / ((x2 - x1) * (y2 - y1))
+
+
+def recall_vs(boxes, ref, iou_thr=0.5):
+    # -> (reference boxes matched one-to-one (same class) by `boxes`, that
+    # count over len(ref), or None without reference boxes)
+    if len(ref) == 0:
+        return 0, None
+    matched, _, _ = greedy_assign(ref, boxes, iou_thr, class_aware=True)
+    return len(matched), len(matched) / len(ref)
+
+
+class TemporalPredictor(SlicedPredictor):
+    def __init__(self, yolo_model, slice_h=640, slice_w=640, overlap_h=0.2, overlap_w=None, conf=0.25,
+                 change_thr=CHANGE_THR, refresh_every=REFRESH_EVERY, change_scale=CHANGE_SCALE,
+                 batch_size=BATCH_SIZE, imgsz=None, device=None,
+                 merge_metric=MERGE_METRIC, merge_thr=MERGE_THR, merge_method=MERGE_METHOD):
+        super().__init__(yolo_model, slice_h, slice_w, overlap_h, overlap_w, conf=conf, batch_size=batch_size,
+                         imgsz=imgsz, device=device, merge_metric=merge_metric, merge_thr=merge_thr,
+                         merge_method=merge_method)
+        self.change_thr = change_thr
+        self.refresh_every = refresh_every
+        self.change_scale = change_scale
+
+        self.frames_run = 0
+        self.refreshes = 0
+        self.tiles_reused = 0
+        # previous frame of the current sequence: its downsampled gray copy,
+        # per-tile boxes (frame coords) and frames since the last full refresh
+        self.last = None
+
+    @property
+    def temporal_name(self):
+        return f"temporal_c{self.change_thr:g}_s{self.change_scale}_r{self.refresh_every}"
+
+    @property
+    def tiles_per_frame(self):
+        return self.tiles_run / self.frames_run if self.frames_run else 0.0
+
+    def reset(self):
+        # start of a new sequence: the next frame runs every tile
+        self.last = None
+
+    def select(self, frame, tiles):
+        # -> (small frame, bool mask of tiles to run, change score per tile or None)
+        small = downsample(frame, self.change_scale)
+        last = self.last
+        if (last is None or last["shape"] != frame.shape or
+                self.refresh_every and last["age"] + 1 >= self.refresh_every):
+            return small, np.ones(len(tiles), dtype=bool), None
+        scores = change_scores(last["small"], small, tiles, self.change_scale)
+        had_boxes = np.array([len(b) > 0 for b in last["tile_boxes"]], dtype=bool)
+        return small, (scores >= self.change_thr) | had_boxes, scores
+
+    def predict_frame(self, frame):
+        # -> (merged boxes, info dict); frames must come in sequence order
+        frame = load_frame(frame)
+        h, w = frame.shape[:2]
+        with stage("slice"):
+            tiles = slice_bboxes(h, w, self.slice_h, self.slice_w, self.overlap_h, self.overlap_w)
+            small, run, scores = self.select(frame, tiles)
+        refresh = scores is None
+
+        tile_boxes = list(self.last["tile_boxes"]) if not refresh else [np.zeros(0, dtype=BOX_DTYPE)] * len(tiles)
+        jobs = np.flatnonzero(run)
+        for start in range(0, len(jobs), self.batch_size):
+            chunk = jobs[start:start + self.batch_size]
+            with stage("slice"):
+                batch = [self._cut(frame, tiles[ti]) for ti in chunk]
+            for ti, boxes in zip(chunk, self._forward(batch)):
+                tile_boxes[ti] = shift_to_frame(boxes, tiles[ti]) if len(boxes) else boxes
+        self.tiles_run += len(jobs)
+        self.tiles_reused += len(tiles) - len(jobs)
+        self.frames_run += 1
+        self.refreshes += refresh
+
+        parts = [b for b in tile_boxes if len(b)] + self._full_frame_pass([frame])
+        merged = self._merge([parts])[0]
+        self.last = {"shape": frame.shape, "small": small, "tile_boxes": tile_boxes,
+                     "age": 0 if refresh else self.last["age"] + 1}
+        info = {"tiles_run": len(jobs), "tiles_total": len(tiles), "refresh": refresh,
+                "change_mean": None if scores is None else float(scores.mean())}
+        return merged, info
+
+    def predict_arrays(self, frames):
+        return [self.predict_frame(f)[0] for f in frames]
+
+    def report(self):
+        return (f"{self.frames_run} frames, {self.tiles_run} tiles run ({self.tiles_per_frame:.2f}/frame), "
+                f"{self.tiles_reused} reused, {self.refreshes} full refreshes, "
+                f"{self.forward_passes} forward passes, {self.forward_seconds:.1f}s forward")
@@ -0,0 +1,118 @@
+import argparse
+import hashlib
+
+import numpy as np
+
+from dataset_index import load_index
+
+# Spatial occupancy prior for selective tiling.
+# Every training box is spread over the cells it covers on a GRID x GRID map
+# of the (normalized) frame, each box adding a total mass of 1, and the map is
+# normalized to sum to 1. A tile is run only if the prior mass under it
+# (plus MARGIN cells around it) is at least the threshold; the full-frame pass
+# is always kept, so lights outside the usual band can still be found at the
+# single-shot resolution.
+# Any GRID x GRID array works as a prior, e.g. a hand-drawn mask loaded with
+# np.load, via OccupancyPrior(grid).
+
+GRID = 64
+MARGIN = 1               # cells of slack around each tile
+DEFAULT_THRESHOLD = 0.005
+
+
+def occupancy_grid(boxes, grid=GRID):
+    # boxes: dataset_index rows (normalized cx, cy, w, h)
+    occ = np.zeros((grid + 1, grid + 1), dtype=np.float64)
+    if len(boxes) == 0:
+        return occ[:grid, :grid]
+
+    x = boxes["x"].astype(np.float64)
+    y = boxes["y"].astype(np.float64)
+    w = boxes["w"].astype(np.float64)
+    h = boxes["h"].astype(np.float64)
+    c0 = np.clip(np.floor((x - w / 2) * grid), 0, grid - 1).astype(np.int64)
+    c1 = np.clip(np.floor((x + w / 2) * grid), 0, grid - 1).astype(np.int64) + 1
+    r0 = np.clip(np.floor((y - h / 2) * grid), 0, grid - 1).astype(np.int64)
+    r1 = np.clip(np.floor((y + h / 2) * grid), 0, grid - 1).astype(np.int64) + 1
+    weight = 1.0 / ((c1 - c0) * (r1 - r0))
+
+    # 2D difference array: one corner update per box, then two cumsums
+    np.add.at(occ, (r0, c0), weight)
+    np.add.at(occ, (r0, c1), -weight)
+    np.add.at(occ, (r1, c0), -weight)
+    np.add.at(occ, (r1, c1), weight)
+    occ = occ.cumsum(axis=0).cumsum(axis=1)[:grid, :grid]
+    return occ / max(occ.sum(), 1e-12)
+
+
+class OccupancyPrior:
+    def __init__(self, grid):
+        grid = np.asarray(grid, dtype=np.float64)
+        self.grid = grid / max(grid.sum(), 1e-12)
+        # summed-area table so any tile's mass is four lookups
+        self.sat = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1), dtype=np.float64)
+        self.sat[1:, 1:] = self.grid.cumsum(axis=0).cumsum(axis=1)
+        self.digest = hashlib.sha1(self.grid.astype(np.float32).tobytes()).hexdigest()[:12]
+
+    @classmethod
+    def from_split(cls, split="train", grid=GRID):
+        return cls(occupancy_grid(load_index(split).boxes, grid))
+
+    def tile_mass(self, tiles, image_h, image_w, margin=MARGIN):
+        # tiles: (x1, y1, x2, y2) pixel boxes -> prior mass under each one
+        gh, gw = self.grid.shape
+        t = np.asarray(tiles, dtype=np.float64).reshape(-1, 4)
+        c0 = np.clip(np.floor(t[:, 0] / image_w * gw).astype(np.int64) - margin, 0, gw)
+        c1 = np.clip(np.ceil(t[:, 2] / image_w * gw).astype(np.int64) + margin, 0, gw)
+        r0 = np.clip(np.floor(t[:, 1] / image_h * gh).astype(np.int64) - margin, 0, gh)
+        r1 = np.clip(np.ceil(t[:, 3] / image_h * gh).astype(np.int64) + margin, 0, gh)
+        s = self.sat
+        return s[r1, c1] - s[r0, c1] - s[r1, c0] + s[r0, c0]
+
+
+class TileSelector:
+    # tile_filter for SlicedPredictor: keeps tiles whose prior mass >= threshold
+    def __init__(self, prior, threshold=DEFAULT_THRESHOLD, margin=MARGIN):
+        self.prior = prior
+        self.threshold = threshold
+        self.margin = margin
+        self._masks = {}
+
+    @property
+    def name(self):
+        return f"prior{self.threshold:g}_m{self.margin}_{self.prior.digest}"
+
+    def __call__(self, tiles, image_h, image_w):
+        key = (image_h, image_w, tuple(tiles))
+        mask = self._masks.get(key)
+        if mask is None:
+            mass = self.prior.tile_mass(tiles, image_h, image_w, self.margin)
+            mask = mass >= self.threshold
+            self._masks[key] = mask
+        return mask
+
+
+def main():
+    from sliced_predictor import slice_bboxes
+
+    parser = argparse.ArgumentParser(description="Show which tiles the training-label prior keeps.")
+    parser.add_argument("--split", default="train")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--slice", type=int, default=640)
+    parser.add_argument("--overlap", type=float, default=0.2)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.001, DEFAULT_THRESHOLD, 0.02])
+    args = parser.parse_args()
+
+    prior = OccupancyPrior.from_split(args.split)
+    tiles = slice_bboxes(args.height, args.width, args.slice, args.slice, args.overlap, args.overlap)
+    mass = prior.tile_mass(tiles, args.height, args.width)
+    print(f"{len(tiles)} tiles of {args.slice}px on {args.width}x{args.height}, prior {prior.digest}")
+    for tile, m in zip(tiles, mass):
+        print(f"  {tile}: mass={m:.4f}")
+    for thr in args.thresholds:
+        print(f"threshold {thr:g}: keeps {int((mass >= thr).sum())}/{len(tiles)} tiles")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import argparse
+import csv
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from box_ops import BOX_DTYPE, greedy_assign
+from dataset_index import load_index
+from evaluate import NUM_CLASSES
+
+# Class-balanced + hard-example sampling for step4_makeyaml_and_train.py.
+# Static part, from the labels: an image weighs as much as its heaviest box,
+# where a box of class c weighs (count of the most frequent class / count of
+# c) ** CLASS_POWER, times SMALL_BOOST if its short side is under SMALL_PX at
+# the training resolution. Class 2 stays at 1 and rare classes such as 4 get
+# sampled several times as often. Dynamic part: every HARD_EVERY epochs the
+# last checkpoint is run on HARD_SAMPLE random train images, and each
+# image's error at IoU 0.5 ((missed GT + FP_WEIGHT * false positives) /
+# (GT + 1), relative to the mean) multiplies its weight by 1 + HARD_GAIN *
+# error until the next refresh, which replaces every earlier score. Weights
+# are capped at MAX_WEIGHT x the mean. Each epoch still draws len(dataset)
+# images, with replacement, so epochs stay comparable. Indices are drawn
+# DRAW_BLOCK at a time from the current weights, so a refresh applies from the
+# next block on rather than an epoch late (InfiniteDataLoader starts drawing
+# the next epoch before on_fit_epoch_end runs); only that block and the
+# loader's prefetched batches still use the old weights.
+# --report gives wall-clock time to a target val mAP per run, against the
+# first (uniform) run.
+
+CLASS_POWER = 0.5
+SMALL_PX = 16
+SMALL_BOOST = 1.5
+EMPTY_WEIGHT = 1.0       # images without boxes
+MAX_WEIGHT = 10.0
+
+HARD_EVERY = 5           # epochs between hard-example refreshes
+HARD_SAMPLE = 1000       # train images scored per refresh
+HARD_GAIN = 1.0
+HARD_CONF = 0.25
+IOU_MATCH = 0.50
+FP_WEIGHT = 0.5
+DRAW_BLOCK = 64          # sampler indices drawn per weights lookup
+
+TARGET_MAP = 0.5
+
+
+def image_weights(n, img_id, cls, short_px, nc=NUM_CLASSES):
+    # per-box class / size weights -> per-image weight, mean 1
+    freq = np.bincount(cls, minlength=nc).astype(np.float64)
+    class_w = (freq.max() / np.maximum(freq, 1)) ** CLASS_POWER if len(cls) else np.ones(nc)
+    box_w = class_w[cls] * np.where(short_px < SMALL_PX, SMALL_BOOST, 1.0)
+    w = np.full(n, EMPTY_WEIGHT, dtype=np.float64)
+    np.maximum.at(w, img_id, box_w)
+    return np.minimum(w / w.mean(), MAX_WEIGHT) if n else w
+
+
+def weights_from_labels(labels, imgsz, nc=NUM_CLASSES):
+    # YOLODataset.labels (normalized xywh, original (h, w) shape) -> image weights
+    counts = np.array([len(lb["cls"]) for lb in labels], dtype=np.int64)
+    img_id = np.repeat(np.arange(len(labels)), counts)
+    cls = np.concatenate([lb["cls"].reshape(-1) for lb in labels] + [np.zeros(0)]).astype(np.int64)
+    wh = np.concatenate([lb["bboxes"].reshape(-1, 4)[:, 2:] for lb in labels] + [np.zeros((0, 2))])
+    hw0 = np.array([lb["shape"] for lb in labels], dtype=np.float64).reshape(-1, 2)
+    scale = imgsz / hw0.max(axis=1)
+    short_px = np.minimum(wh[:, 0] * hw0[img_id, 1], wh[:, 1] * hw0[img_id, 0]) * scale[img_id]
+    return image_weights(len(labels), img_id, cls, short_px, nc), img_id, cls
+
+
+class WeightedImageSampler:
+    # DataLoader sampler: len(base) draws per epoch, with replacement, in
+    # proportion to the current weights; set_hardness() changes them between epochs
+    def __init__(self, base, seed=0):
+        self.base = np.asarray(base, dtype=np.float64)
+        self.hard = np.zeros(len(self.base), dtype=np.float64)
+        self.rng = np.random.default_rng(seed)
+
+    def weights(self):
+        w = self.base * (1.0 + HARD_GAIN * self.hard)
+        return np.minimum(w / w.mean(), MAX_WEIGHT) if len(w) else w
+
+    def set_hardness(self, idx, errors):
+        # replaces the previous refresh: images not scored this time go back to 0
+        errors = np.asarray(errors, dtype=np.float64)
+        self.hard[:] = 0.0
+        self.hard[idx] = errors / max(errors.mean(), 1e-9)
+
+    def __iter__(self):
+        n = len(self.base)
+        for start in range(0, n, DRAW_BLOCK):
+            w = self.weights()
+            yield from self.rng.choice(n, size=min(DRAW_BLOCK, n - start), replace=True, p=w / w.sum()).tolist()
+
+    def __len__(self):
+        return len(self.base)
+
+
+def class_exposure(weights, img_id, cls, nc=NUM_CLASSES):
+    # share of the boxes drawn per epoch by class, uniform vs weighted
+    uniform = np.bincount(cls, minlength=nc).astype(np.float64)
+    weighted = np.bincount(cls, weights=weights[img_id], minlength=nc)
+    return uniform / max(uniform.sum(), 1e-9), weighted / max(weighted.sum(), 1e-9)
+
+
+def print_exposure(weights, img_id, cls, nc=NUM_CLASSES):
+    uniform, weighted = class_exposure(weights, img_id, cls, nc)
+    print("  box share per class, uniform -> balanced: "
+          + ", ".join(f"{c}: {u:.1%} -> {b:.1%}" for c, (u, b) in enumerate(zip(uniform, weighted)) if u))
+    print(f"  image weights: max {weights.max():.2f}x mean, "
+          f"{np.count_nonzero(weights > 1.0) / max(len(weights), 1):.0%} of images above the mean")
+
+
+def image_errors(model, labels, idx, imgsz, device=None):
+    # (missed GT + FP_WEIGHT * FP) / (GT + 1) per image at IoU 0.5, class-aware
+    files = [labels[i]["im_file"] for i in idx]
+    errors = np.zeros(len(idx), dtype=np.float64)
+    results = model.predict(source=files, imgsz=imgsz, conf=HARD_CONF, device=device, stream=True, verbose=False)
+    for k, res in enumerate(results):
+        lb = labels[idx[k]]
+        h0, w0 = lb["shape"]
+        xywh = lb["bboxes"].reshape(-1, 4).astype(np.float64)
+        gts = np.zeros(len(xywh), dtype=BOX_DTYPE)
+        gts["x1"], gts["x2"] = (xywh[:, 0] - xywh[:, 2] / 2) * w0, (xywh[:, 0] + xywh[:, 2] / 2) * w0
+        gts["y1"], gts["y2"] = (xywh[:, 1] - xywh[:, 3] / 2) * h0, (xywh[:, 1] + xywh[:, 3] / 2) * h0
+        gts["cls"] = lb["cls"].reshape(-1)
+        gts["conf"] = 1.0
+
+        boxes = res.boxes
+        preds = np.zeros(0 if boxes is None else len(boxes), dtype=BOX_DTYPE)
+        if len(preds):
+            xyxy = boxes.xyxy.cpu().numpy()
+            preds["x1"], preds["y1"], preds["x2"], preds["y2"] = xyxy.T
+            preds["cls"] = boxes.cls.cpu().numpy()
+            preds["conf"] = boxes.conf.cpu().numpy()
+
+        matched = len(greedy_assign(preds, gts, IOU_MATCH, class_aware=True, by_score=True)[0])
+        errors[k] = ((len(gts) - matched) + FP_WEIGHT * (len(preds) - matched)) / (len(gts) + 1)
+    return errors
+
+
+def refresh_hard(trainer):
+    # on_fit_epoch_end: last.pt has just been saved
+    epoch = trainer.epoch + 1
+    if trainer.sampler is None or epoch % HARD_EVERY or epoch >= trainer.epochs or not Path(trainer.last).exists():
+        return
+    from ultralytics import YOLO
+
+    labels = trainer.train_loader.dataset.labels
+    rng = np.random.default_rng(epoch)
+    idx = rng.choice(len(labels), size=min(HARD_SAMPLE, len(labels)), replace=False)
+    t0 = time.perf_counter()
+    errors = image_errors(YOLO(trainer.last), labels, idx, trainer.args.imgsz, trainer.args.device)
+    trainer.sampler.set_hardness(idx, errors)
+    print(f"hard examples: scored {len(idx)} train images in {time.perf_counter() - t0:.1f}s, "
+          f"mean error {errors.mean():.3f}, {np.count_nonzero(errors > errors.mean())} above the mean")
+
+
+def balanced_trainer(base=None, hard_examples=True):
+    # wraps a DetectionTrainer (or packed_trainer()'s) so its train loader
+    # draws from a WeightedImageSampler; pass as YOLO(...).train(trainer=...)
+    from ultralytics.data.build import PIN_MEMORY, InfiniteDataLoader, seed_worker
+
+    if base is None:
+        from ultralytics.models.yolo.detect import DetectionTrainer as base
+
+    class BalancedTrainer(base):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.sampler = None
+            if hard_examples:
+                self.add_callback("on_fit_epoch_end", refresh_hard)
+
+        def get_dataloader(self, dataset_path, batch_size=16, rank=0, mode="train"):
+            if mode != "train":
+                return super().get_dataloader(dataset_path, batch_size, rank, mode)
+            dataset = self.build_dataset(dataset_path, mode, batch_size)
+            weights, img_id, cls = weights_from_labels(dataset.labels, self.args.imgsz)
+            self.sampler = WeightedImageSampler(weights, seed=self.args.seed)
+            print("balanced sampling:")
+            print_exposure(weights, img_id, cls)
+            return InfiniteDataLoader(
+                dataset=dataset,
+                batch_size=batch_size,
+                shuffle=False,
+                num_workers=min(os.cpu_count() or 1, self.args.workers),
+                sampler=self.sampler,
+                pin_memory=PIN_MEMORY,
+                collate_fn=getattr(dataset, "collate_fn", None),
+                worker_init_fn=seed_worker,
+            )
+
+    return BalancedTrainer
+
+
+def time_to_map(run_dir, target, metric="metrics/mAP50(B)"):
+    # Ultralytics results.csv -> (epochs, best, first epoch >= target or None,
+    # seconds to reach it or None, where the seconds came from)
+    run_dir = Path(run_dir)
+    with open(run_dir / "results.csv", "r", newline="") as f:
+        rows = [{k.strip(): v.strip() for k, v in r.items()} for r in csv.DictReader(f)]
+    values = np.array([float(r[metric]) for r in rows])
+    if len(values) == 0:
+        return 0, None, None, None, None
+    hit = np.flatnonzero(values >= target)
+    epoch = int(hit[0]) + 1 if len(hit) else None
+    seconds, source = None, None
+    if epoch is not None and rows[epoch - 1].get("time"):
+        # cumulative wall clock, written by newer Ultralytics versions
+        seconds, source = float(rows[epoch - 1]["time"]), "time"
+    elif epoch is not None and (run_dir / "dataloader_wait.csv").exists():
+        # train loop only (no validation), from instrument.LoaderWait
+        with open(run_dir / "dataloader_wait.csv", "r", newline="") as f:
+            train_s = [float(r["train_s"]) for r in csv.DictReader(f)]
+        if len(train_s) >= epoch:
+            seconds, source = float(np.sum(train_s[:epoch])), "train loop"
+    return len(values), float(values.max()), epoch, seconds, source
+
+
+def report(run_dirs, target, metric):
+    print(f"Time to {metric} >= {target:g} (first run is the baseline)\n")
+    print("| Run | Epochs | Best | Reached at epoch | Time (s) | vs baseline |")
+    print("|---|---:|---:|---:|---:|---:|")
+    base = None
+    for run in run_dirs:
+        epochs, best, epoch, seconds, source = time_to_map(run, target, metric)
+        if base is None:
+            base = seconds
+        rel = f"{base / seconds:.2f}x faster" if seconds and base else "-"
+        time_txt = "-" if seconds is None else f"{seconds:.0f} ({source})"
+        best_txt = "-" if best is None else f"{best:.3f}"
+        print(f"| {Path(run).name} | {epochs} | {best_txt} | {epoch or 'not reached'} | {time_txt} | {rel} |")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Class-balanced / hard-example sampling weights and time-to-mAP report.")
+    parser.add_argument("--split", default="train")
+    parser.add_argument("--imgsz", type=int, default=1280, help="training resolution for the small-box boost")
+    parser.add_argument("--report", type=Path, nargs="+", default=None,
+                        help="experiment run dirs, uniform baseline first")
+    parser.add_argument("--target", type=float, default=TARGET_MAP)
+    parser.add_argument("--metric", default="metrics/mAP50(B)", help="results.csv column, e.g. metrics/mAP50-95(B)")
+    args = parser.parse_args()
+
+    if args.report:
+        report(args.report, args.target, args.metric)
+        return
+
+    # static weights straight from the dataset index, without ultralytics
+    idx = load_index(args.split)
+    rids = idx.image_ids()
+    pos = np.full(len(idx.records), -1, dtype=np.int64)
+    pos[rids] = np.arange(len(rids))
+    boxes = idx.boxes[pos[idx.boxes["image_id"]] >= 0]
+    img_id = pos[boxes["image_id"]]
+    hw0 = np.array([(idx.records[r]["height"] or 1, idx.records[r]["width"] or 1) for r in rids],
+                   dtype=np.float64).reshape(-1, 2)
+    scale = args.imgsz / hw0.max(axis=1)
+    short_px = np.minimum(boxes["w"] * hw0[img_id, 1], boxes["h"] * hw0[img_id, 0]) * scale[img_id]
+    cls = boxes["cls"].astype(np.int64)
+    weights = image_weights(len(rids), img_id, cls, short_px)
+    print(f"[{args.split}] {len(rids)} images, {len(boxes)} boxes at imgsz {args.imgsz}:")
+    print_exposure(weights, img_id, cls)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from dataset_index import DATA_ROOT, INDEX_DIR, load_index
+
+try:
+    from ultralytics.data.dataset import YOLODataset
+    from ultralytics.models.yolo.detect import DetectionTrainer
+except ImportError:
+    # packing works without ultralytics; only the dataset / trainer need it
+    YOLODataset = DetectionTrainer = object
+
+# Pre-decoded, pre-resized training store for step4_makeyaml_and_train.py.
+# Each split is packed once into a few large shards: shard_NNN.npy is a
+# (n, slot_h, slot_w, 3) uint8 BGR array holding every image already resized
+# the way Ultralytics' load_image does it (long side = IMGSZ, aspect kept),
+# top-left in its slot, in index order so an epoch reads the shards
+# sequentially through a memory map. Labels come from the dataset index
+# (no per-file label reads) and go to labels.npz as flat class / xywh arrays
+# with per-image offsets, next to each image's shard, slot and sizes.
+# manifest.json is written last and records the source signature, so a
+# re-run repacks a split only when its images, labels or IMGSZ changed.
+# packed_trainer() returns an Ultralytics DetectionTrainer that reads its
+# train / val batches from the store instead of decoding JPEGs; `--bench`
+# times both loaders on train batches. PackedDataset and PackedTrainer live
+# at module level so DataLoader workers (spawned on Windows) can unpickle
+# them, and a pickled PackedSplit leaves its memmaps behind: each worker
+# reopens the shard files instead of receiving a copy of every pixel.
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SPLITS = ["train", "valid"]
+
+IMGSZ = 640
+SHARD_BYTES = 1 << 30    # ~1 GiB of pixels per shard
+WORKERS = min(16, (os.cpu_count() or 1) * 2)
+STORE_VERSION = 1
+
+
+def store_root(src_root=DATA_ROOT, imgsz=IMGSZ):
+    # data/bosch -> data/bosch_packed640, data/bosch_tiles640 -> data/bosch_tiles640_packed640
+    src_root = Path(src_root)
+    return src_root.parent / f"{src_root.name}_packed{imgsz}"
+
+
+def source_index(split, src_root=DATA_ROOT):
+    # the tile dataset gets its own index dir, so its splits don't clash with data/bosch's
+    src_root = Path(src_root)
+    index_dir = INDEX_DIR if src_root == Path(DATA_ROOT) else INDEX_DIR / src_root.name
+    return load_index(split, root=src_root, index_dir=index_dir)
+
+
+def resized_hw(h0, w0, imgsz):
+    # same rounding as ultralytics BaseDataset.load_image (rect mode)
+    r = imgsz / max(h0, w0)
+    if r == 1:
+        return h0, w0
+    return min(math.ceil(h0 * r), imgsz), min(math.ceil(w0 * r), imgsz)
+
+
+def load_resized(path, h0, w0, h, w):
+    data = np.fromfile(str(path), dtype=np.uint8)
+    # JPEG can decode straight to half size, which is cheaper when that is still >= the target
+    flag = cv2.IMREAD_REDUCED_COLOR_2 if h0 // 2 >= h and w0 // 2 >= w else cv2.IMREAD_COLOR
+    img = cv2.imdecode(data, flag)
+    if img is None:
+        return None
+    if img.shape[:2] != (h, w):
+        interp = cv2.INTER_AREA if img.shape[0] > h else cv2.INTER_LINEAR
+        img = cv2.resize(img, (w, h), interpolation=interp)
+    return img
+
+
+def _signature(index, imgsz):
+    h = hashlib.sha1(f"{STORE_VERSION}|{imgsz}\n".encode("utf-8"))
+    for rid in index.image_ids():
+        r = index.records[rid]
+        h.update(f"{r['stem']}|{r['digest']}|{r['label_sig']}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def pack_split(split, src_root=DATA_ROOT, out_root=None, imgsz=IMGSZ, force=False, pool=None):
+    index = source_index(split, src_root)
+    out_dir = (out_root or store_root(src_root, imgsz)) / split
+    manifest_path = out_dir / "manifest.json"
+    sig = _signature(index, imgsz)
+    if not force and manifest_path.exists():
+        with open(manifest_path, "r") as f:
+            if json.load(f).get("signature") == sig:
+                print(f"[{split}] packed store up to date: {out_dir}")
+                return out_dir
+
+    rids = [rid for rid in index.image_ids()
+            if index.records[rid]["width"] and index.records[rid]["height"]]
+    hw0 = np.array([(index.records[rid]["height"], index.records[rid]["width"]) for rid in rids],
+                   dtype=np.int32).reshape(-1, 2)
+    hw = np.array([resized_hw(h0, w0, imgsz) for h0, w0 in hw0], dtype=np.int32).reshape(-1, 2)
+    slot_h, slot_w = (int(hw[:, 0].max()), int(hw[:, 1].max())) if len(hw) else (imgsz, imgsz)
+    per_shard = max(1, SHARD_BYTES // (slot_h * slot_w * 3))
+    n_shards = max(1, math.ceil(len(rids) / per_shard))
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if manifest_path.exists():
+        manifest_path.unlink()
+    for old in out_dir.glob("shard_*.npy"):
+        old.unlink()
+
+    shard = np.arange(len(rids)) // per_shard
+    slot = np.arange(len(rids)) % per_shard
+    ok = np.ones(len(rids), dtype=bool)
+
+    def load(k):
+        return k, load_resized(index.image_path(rids[k]), *(int(v) for v in hw0[k]), *(int(v) for v in hw[k]))
+
+    t0 = time.perf_counter()
+    own_pool = pool is None
+    pool = pool or ThreadPoolExecutor(max_workers=WORKERS)
+    try:
+        for s in range(n_shards):
+            ks = range(s * per_shard, min((s + 1) * per_shard, len(rids)))
+            arr = np.lib.format.open_memmap(out_dir / f"shard_{s:03d}.npy", mode="w+", dtype=np.uint8,
+                                            shape=(len(ks), slot_h, slot_w, 3))
+            for k, img in pool.map(load, ks):
+                if img is None:
+                    print(f"  could not decode {index.image_path(rids[k])}")
+                    ok[k] = False
+                    continue
+                arr[slot[k], :img.shape[0], :img.shape[1]] = img
+            arr.flush()
+            del arr
+    finally:
+        if own_pool:
+            pool.shutdown()
+    elapsed = time.perf_counter() - t0
+
+    # labels straight from the index table, only for the images that decoded
+    keep = np.flatnonzero(ok)
+    counts = np.array([index.records[rids[k]]["box_count"] for k in keep], dtype=np.int64)
+    boxes = [index.boxes_for(rids[k]) for k in keep]
+    flat = np.concatenate(boxes) if boxes else np.zeros(0, dtype=index.boxes.dtype)
+    offsets = np.zeros(len(keep) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    np.savez(
+        out_dir / "labels.npz",
+        im_files=np.asarray([str(index.image_path(rids[k])) for k in keep], dtype=str),
+        shard=shard[keep].astype(np.int32),
+        slot=slot[keep].astype(np.int32),
+        hw0=hw0[keep],
+        hw=hw[keep],
+        cls=flat["cls"].astype(np.float32),
+        xywh=np.stack([flat["x"], flat["y"], flat["w"], flat["h"]], axis=1).astype(np.float32).reshape(-1, 4),
+        offsets=offsets,
+    )
+
+    # written last: its signature is what marks the split as packed
+    with open(manifest_path, "w") as f:
+        json.dump({"version": STORE_VERSION, "signature": sig, "imgsz": imgsz, "source": str(index.img_dir),
+                   "slot": [slot_h, slot_w], "shards": n_shards, "images": int(len(keep))}, f, indent=2)
+    size_gb = sum(p.stat().st_size for p in out_dir.glob("shard_*.npy")) / 1e9
+    print(f"[{split}] packed {len(keep)} images into {n_shards} shards ({size_gb:.2f} GB, "
+          f"{slot_w}x{slot_h} slots) in {elapsed:.1f}s -> {out_dir}")
+    return out_dir
+
+
+def pack_store(splits=SPLITS, src_root=DATA_ROOT, imgsz=IMGSZ, force=False):
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        for split in splits:
+            pack_split(split, src_root, imgsz=imgsz, force=force, pool=pool)
+    return store_root(src_root, imgsz)
+
+
+class PackedSplit:
+    def __init__(self, split_dir):
+        split_dir = Path(split_dir)
+        self.split_dir = split_dir
+        with open(split_dir / "manifest.json", "r") as f:
+            self.manifest = json.load(f)
+        self.imgsz = self.manifest["imgsz"]
+        self._shards = None
+        with np.load(split_dir / "labels.npz") as data:
+            self.im_files = [str(p) for p in data["im_files"]]
+            self.shard, self.slot = data["shard"], data["slot"]
+            self.hw0, self.hw = data["hw0"], data["hw"]
+            self.cls, self.xywh, self.offsets = data["cls"], data["xywh"], data["offsets"]
+
+    @property
+    def shards(self):
+        # memmaps, opened on first use in each process
+        if self._shards is None:
+            self._shards = [np.load(self.split_dir / f"shard_{s:03d}.npy", mmap_mode="r")
+                            for s in range(self.manifest["shards"])]
+        return self._shards
+
+    def __getstate__(self):
+        # memmaps pickle by value: send the paths, not ~1 GB per shard
+        state = self.__dict__.copy()
+        state["_shards"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def __len__(self):
+        return len(self.im_files)
+
+    def image(self, i):
+        # -> (BGR copy, (h0, w0), (h, w)), like BaseDataset.load_image
+        h, w = (int(v) for v in self.hw[i])
+        img = np.ascontiguousarray(self.shards[self.shard[i]][self.slot[i], :h, :w])
+        return img, tuple(int(v) for v in self.hw0[i]), (h, w)
+
+    def labels(self, i):
+        # label dict in the form YOLODataset.get_labels() builds from the .txt files
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return {
+            "im_file": self.im_files[i],
+            "shape": tuple(int(v) for v in self.hw0[i]),
+            "cls": self.cls[lo:hi].reshape(-1, 1).copy(),
+            "bboxes": self.xywh[lo:hi].copy(),
+            "segments": [],
+            "keypoints": None,
+            "normalized": True,
+            "bbox_format": "xywh",
+        }
+
+
+class PackedDataset(YOLODataset):
+    def __init__(self, split_dir, *args, **kwargs):
+        self.store = PackedSplit(split_dir)
+        self._pos = {f: i for i, f in enumerate(self.store.im_files)}
+        super().__init__(*args, **kwargs)
+
+    def get_img_files(self, img_path):
+        # a train list (dedup_frames.py) keeps only the images it names
+        if str(img_path).endswith(".txt"):
+            with open(img_path, "r") as f:
+                names = {Path(line.strip()).name for line in f if line.strip()}
+            return [p for p in self.store.im_files if Path(p).name in names]
+        return list(self.store.im_files)
+
+    def get_labels(self):
+        return [self.store.labels(self._pos[f]) for f in self.im_files]
+
+    def load_image(self, i, rect_mode=True):
+        # by file name: rect mode reorders im_files / labels after get_labels
+        img, hw0, hw = self.store.image(self._pos[self.im_files[i]])
+        if max(hw) != self.imgsz:
+            # store packed at another size: resize from the packed copy
+            hw = resized_hw(*hw0, self.imgsz)
+            img = cv2.resize(img, (hw[1], hw[0]), interpolation=cv2.INTER_LINEAR)
+        if self.augment:
+            # mosaic draws its extra images from this buffer
+            self.buffer.append(i)
+            if len(self.buffer) >= self.max_buffer_length:
+                self.buffer.pop(0)
+        return img, hw0, hw
+
+
+def packed_dataset(root, cfg, img_path, mode="train", batch=None, data=None, stride=32):
+    # ultralytics build_yolo_dataset(), reading <root>/train or <root>/valid
+    from ultralytics.utils import colorstr
+
+    return PackedDataset(
+        Path(root) / ("train" if mode == "train" else "valid"),
+        img_path=img_path,
+        imgsz=cfg.imgsz,
+        batch_size=batch,
+        augment=mode == "train",
+        hyp=cfg,
+        rect=cfg.rect or mode == "val",
+        cache=None,
+        single_cls=cfg.single_cls or False,
+        stride=int(stride),
+        pad=0.0 if mode == "train" else 0.5,
+        prefix=colorstr(f"{mode}: "),
+        task=cfg.task,
+        classes=cfg.classes,
+        data=data,
+        fraction=cfg.fraction if mode == "train" else 1.0,
+    )
+
+
+class PackedTrainer(DetectionTrainer):
+    # store root set by packed_trainer()
+    store_root = None
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        model = getattr(self.model, "module", self.model)
+        gs = max(int(model.stride.max() if model else 0), 32)
+        return packed_dataset(self.store_root, self.args, img_path, mode, batch, self.data, gs)
+
+
+def packed_trainer(root):
+    # pass as YOLO(...).train(trainer=packed_trainer(root), ...)
+    PackedTrainer.store_root = Path(root)
+    return PackedTrainer
+
+
+def bench(root, data_yaml, imgsz, batch, batches, workers):
+    # ms per train batch (augmentation included) for the JPEG loader vs the packed store
+    from ultralytics.cfg import get_cfg
+    from ultralytics.data import build_dataloader, build_yolo_dataset
+    from ultralytics.data.utils import check_det_dataset
+    from ultralytics.utils import DEFAULT_CFG
+
+    cfg = get_cfg(DEFAULT_CFG, {"imgsz": imgsz, "data": str(data_yaml)})
+    data = check_det_dataset(str(data_yaml))
+    datasets = {
+        "jpeg": build_yolo_dataset(cfg, data["train"], batch, data, mode="train"),
+        "packed": packed_dataset(root, cfg, data["train"], "train", batch, data),
+    }
+    for name, dataset in datasets.items():
+        loader = build_dataloader(dataset, batch, workers, shuffle=True)
+        it = iter(loader)
+        next(it)    # warm-up: worker start and first reads
+        t0 = time.perf_counter()
+        n = 0
+        for _ in range(batches):
+            try:
+                next(it)
+            except StopIteration:
+                break
+            n += 1
+        ms = (time.perf_counter() - t0) * 1e3 / max(n, 1)
+        print(f"  {name:>6}: {ms:.1f} ms/batch of {batch} ({n} batches, workers={workers})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack train/valid into pre-decoded uint8 shards for training.")
+    parser.add_argument("--src", type=Path, default=DATA_ROOT, help="dataset root (data/bosch or the tile dataset)")
+    parser.add_argument("--splits", nargs="+", default=SPLITS)
+    parser.add_argument("--imgsz", type=int, default=IMGSZ)
+    parser.add_argument("--force", action="store_true", help="repack even if the store is up to date")
+    parser.add_argument("--bench", type=int, default=0, metavar="BATCHES",
+                        help="then time this many train batches from JPEGs and from the store")
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=8,
+                        help="DataLoader workers for --bench; 8 is what step4 training uses")
+    args = parser.parse_args()
+
+    root = pack_store(args.splits, args.src, args.imgsz, force=args.force)
+    if args.bench:
+        bench(root, args.src / "data.yaml", args.imgsz, args.batch, args.bench, args.workers)
+
+
+if __name__ == "__main__":
+    main()
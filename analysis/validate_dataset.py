@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+from dataset_index import IMG_EXTENSIONS, image_size, parse_label_file, scan_dir
+
+# Combined structure / image / label validator for data/bosch.
+# Every split is listed with os.scandir and each file is checked on a thread
+# pool (file reads and cv2.imdecode release the GIL). Results are
+# kept in debug/dataset_validation/<split>.json keyed by file size + mtime, so
+# a re-run only re-checks files that changed since the last one.
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+root = PROJECT_ROOT / "data" / "bosch"
+DATA_YAML = root / "data.yaml"
+STATE_DIR = PROJECT_ROOT / "debug" / "dataset_validation"
+
+folders = ["train", "valid", "test"]
+WORKERS = min(32, (os.cpu_count() or 1) * 4)
+FULL_DECODE = True       # False = header + end-marker checks only
+COORD_TOL = 1e-3         # how far past the image edge a normalized box may go
+MIN_SIZE = 1e-6          # normalized w/h at or below this counts as degenerate
+STATE_VERSION = 1
+
+
+def read_nc(data_yaml=DATA_YAML):
+    with open(data_yaml, "r") as f:
+        return int(yaml.safe_load(f)["nc"])
+
+
+def check_image(path, full_decode=FULL_DECODE):
+    errors = []
+    try:
+        data = np.fromfile(str(path), dtype=np.uint8)
+    except OSError as e:
+        return {"errors": [f"unreadable: {e}"]}
+    if len(data) == 0:
+        return {"errors": ["empty file"]}
+
+    size = image_size(path)
+    if size is None:
+        errors.append("unrecognised or corrupt header")
+
+    tail = data[-64:].tobytes()
+    name = str(path).lower()
+    if name.endswith((".jpg", ".jpeg")) and b"\xff\xd9" not in tail.rstrip(b"\x00"):
+        errors.append("truncated jpeg (no EOI marker)")
+    if name.endswith(".png") and b"IEND" not in tail:
+        errors.append("truncated png (no IEND chunk)")
+
+    if full_decode:
+        img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if img is None:
+            errors.append("does not decode")
+        elif size is not None and (img.shape[1], img.shape[0]) != tuple(size):
+            errors.append(f"decoded size {img.shape[1]}x{img.shape[0]} != header {size[0]}x{size[1]}")
+
+    return {"errors": errors, "size": list(size) if size else None}
+
+
+def check_label(path, nc):
+    rows, bad = parse_label_file(path)
+    errors = [f"bad line: '{ln}'" for ln in bad]
+    if not rows:
+        return {"errors": errors, "boxes": 0}
+
+    arr = np.asarray(rows, dtype=np.float64)
+    cls, x, y, w, h = arr.T
+
+    problems = {
+        f"class id outside [0, {nc})": (cls < 0) | (cls >= nc),
+        "non-finite value": ~np.isfinite(arr).all(axis=1),
+        "degenerate box (w or h <= 0)": (w <= MIN_SIZE) | (h <= MIN_SIZE),
+        "box outside image": (
+            (x - w / 2 < -COORD_TOL) | (x + w / 2 > 1 + COORD_TOL)
+            | (y - h / 2 < -COORD_TOL) | (y + h / 2 > 1 + COORD_TOL)
+        ),
+    }
+    for what, mask in problems.items():
+        idx = np.flatnonzero(mask)
+        if len(idx):
+            shown = ", ".join(str(i) for i in idx[:5])
+            errors.append(f"{what}: {len(idx)} box(es) (#{shown}{', ...' if len(idx) > 5 else ''})")
+
+    return {"errors": errors, "boxes": len(rows)}
+
+
+def load_state(split, nc):
+    path = STATE_DIR / f"{split}.json"
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        state = json.load(f)
+    if state.get("version") != STATE_VERSION:
+        return {}
+    # settings changed since the last run: drop the results that depended on them
+    stale = []
+    if state.get("nc") != nc:
+        stale.append("labels/")
+    if state.get("full_decode") != FULL_DECODE:
+        stale.append("images/")
+    return {k: v for k, v in state.get("entries", {}).items() if not k.startswith(tuple(stale))}
+
+
+def save_state(split, nc, entries):
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    path = STATE_DIR / f"{split}.json"
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"version": STATE_VERSION, "nc": nc, "full_decode": FULL_DECODE, "entries": entries}, f)
+    os.replace(tmp, path)
+
+
+def validate_split(split, nc, pool, force=False):
+    img_dir = root / split / "images"
+    label_dir = root / split / "labels"
+    print(f"Split: {split}")
+
+    if not img_dir.exists() or not label_dir.exists():
+        print(f"  missing image or label directory under {root / split}")
+        return None
+
+    images = scan_dir(img_dir, IMG_EXTENSIONS)
+    labels = scan_dir(label_dir, (".txt",))
+    old = {} if force else load_state(split, nc)
+
+    entries = {}
+    jobs = []
+    for kind, files, folder in (("images", images, img_dir), ("labels", labels, label_dir)):
+        for name, size, mtime in files.values():
+            key = f"{kind}/{name}"
+            prev = old.get(key)
+            if prev is not None and prev["sig"] == [size, mtime]:
+                entries[key] = prev
+            else:
+                jobs.append((key, kind, folder / name, [size, mtime]))
+
+    def run(job):
+        key, kind, path, sig = job
+        result = check_image(path) if kind == "images" else check_label(path, nc)
+        result["sig"] = sig
+        return key, result
+
+    t0 = time.perf_counter()
+    for key, result in pool.map(run, jobs):
+        entries[key] = result
+    elapsed = time.perf_counter() - t0
+    save_state(split, nc, entries)
+
+    missing_labels = sorted(set(images) - set(labels))
+    missing_images = sorted(set(labels) - set(images))
+    bad = sorted((k, e["errors"]) for k, e in entries.items() if e["errors"])
+    total_boxes = sum(e.get("boxes", 0) for k, e in entries.items() if k.startswith("labels/"))
+
+    print(f"  images: {len(images)}  labels: {len(labels)}  boxes: {total_boxes}")
+    print(f"  re-checked {len(jobs)} of {len(entries)} files in {elapsed:.2f}s")
+    print(f"  images with no label: {len(missing_labels)}")
+    for stem in missing_labels[:10]:
+        print(f"   - {stem}")
+    print(f"  labels with no image: {len(missing_images)}")
+    for stem in missing_images[:10]:
+        print(f"   - {stem}")
+    print(f"  files with problems: {len(bad)}")
+    for key, errs in bad[:20]:
+        print(f"   - {key}: {'; '.join(errs)}")
+    if len(bad) > 20:
+        print(f"   ... and {len(bad) - 20} more (see {STATE_DIR / (split + '.json')})")
+
+    return {"missing_labels": missing_labels, "missing_images": missing_images, "bad_files": bad}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate the Bosch dataset (structure, images, labels).")
+    parser.add_argument("--splits", nargs="+", default=folders)
+    parser.add_argument("--force", action="store_true", help="re-check every file, ignoring saved results")
+    args = parser.parse_args()
+
+    nc = read_nc()
+    print(f"Validating Bosch dataset at: {root} (nc={nc})")
+
+    any_problem = False
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        for split in args.splits:
+            res = validate_split(split, nc, pool, force=args.force)
+            if res is None or res["bad_files"] or res["missing_labels"] or res["missing_images"]:
+                any_problem = True
+
+    print("\nResult:", "problems found" if any_problem else "all checks passed")
+    raise SystemExit(1 if any_problem else 0)
+
+
+if __name__ == "__main__":
+    main()
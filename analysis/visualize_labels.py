@@ -1,8 +1,9 @@
-import os
 import random
 from pathlib import Path
 import cv2
 
+from dataset_index import load_index
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 root = PROJECT_ROOT / "data" / "bosch"
 output = PROJECT_ROOT / "debug" / "visualize_labels"
@@ -27,29 +28,31 @@ def draw_boxes_for_split(split_name: str, num_images: int = 5):
     print(f"image dir: {img_dir}")
     print(f"label dir: {label_dir}")
 
-    img_files = [
-        f for f in os.listdir(img_dir)
-        if f.lower().endswith((".jpg", ".jpeg", ".png"))
+    idx = load_index(split_name, root=root)
+    img_ids = [
+        i for i in idx.image_ids()
+        if idx.records[i]["image"].lower().endswith((".jpg", ".jpeg", ".png"))
     ]
 
-    if not img_files:
+    if not img_ids:
         print(f"[{split_name}] no image files found.")
         return
 
-    sample_files = random.sample(
-        img_files,
-        k=min(num_images, len(img_files))
+    sample_ids = random.sample(
+        img_ids,
+        k=min(num_images, len(img_ids))
     )
 
     split_out_dir = output / split_name
     split_out_dir.mkdir(parents=True, exist_ok=True)
 
-    for fname in sample_files:
+    for rid in sample_ids:
+        rec = idx.records[rid]
+        fname = rec["image"]
         img_path = img_dir / fname
-        stem = os.path.splitext(fname)[0]
-        label_path = label_dir / f"{stem}.txt"
+        stem = rec["stem"]
 
-        if not label_path.exists():
+        if rec["label"] is None:
             print(f"  skipping {fname}: no label file")
             continue
 
@@ -60,20 +63,15 @@ def draw_boxes_for_split(split_name: str, num_images: int = 5):
 
         h, w = img.shape[:2]
 
-        with open(label_path, "r") as f:
-            lines = [ln.strip() for ln in f.readlines() if ln.strip()]
-
-        for ln in lines:
-            parts = ln.split()
-            if len(parts) < 5:
-                print(f"  bad line in {label_path.name}: '{ln}'")
-                continue
+        for ln in rec["bad_lines"]:
+            print(f"  bad line in {rec['label']}: '{ln}'")
 
-            cls_id = int(float(parts[0]))
-            x_center = float(parts[1]) * w
-            y_center = float(parts[2]) * h
-            box_w = float(parts[3]) * w
-            box_h = float(parts[4]) * h
+        for b in idx.boxes_for(rid):
+            cls_id = int(b["cls"])
+            x_center = float(b["x"]) * w
+            y_center = float(b["y"]) * h
+            box_w = float(b["w"]) * w
+            box_h = float(b["h"]) * h
 
             x1 = int(x_center - box_w / 2)
             y1 = int(y_center - box_h / 2)